@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+
+class LRUCache:
+    """Caché LRU limitada por número de entradas y/o bytes, con caducidad (TTL) opcional."""
+
+    def __init__(self, max_entries=1000, max_bytes=None, ttl=None, sizeof=None, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 0)
+        self.on_evict = on_evict
+        self.entries = OrderedDict()  # key -> (value, created_at, size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        """Devuelve el valor vigente de `key` o None, actualizando los contadores."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, created_at=None):
+        """Guarda un valor y expulsa las entradas más antiguas si se superan los límites."""
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, created_at or time.time(), size)
+            self.total_bytes += size
+            while self.entries and (
+                len(self.entries) > self.max_entries
+                or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+            ):
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def items(self):
+        """Entradas vigentes como lista de (key, value, created_at), de la más antigua a la más reciente."""
+        with self._lock:
+            for key in [key for key, entry in self.entries.items() if self._expired(entry)]:
+                self._remove(key)
+            return [(key, value, created_at) for key, (value, created_at, _) in self.entries.items()]
+
+    def miss(self):
+        """Cuenta un fallo de una búsqueda hecha fuera de `get()`."""
+        with self._lock:
+            self.misses += 1
+
+    def touch(self, key):
+        """Marca una entrada como usada recientemente y cuenta un acierto."""
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+
+    def _expired(self, entry):
+        return self.ttl is not None and time.time() - entry[1] > self.ttl
+
+    def _remove(self, key):
+        value, _, size = self.entries.pop(key)
+        self.total_bytes -= size
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def stats(self):
+        """Contadores de aciertos, fallos y expulsiones."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None
+            }
+
+class SemanticAnswerCache:
+    """Reutiliza respuestas del LLM para transcripciones semánticamente equivalentes.
+
+    Una respuesta solo se reutiliza si la similitud coseno entre los
+    embeddings de las transcripciones supera `threshold` y además el RAG
+    recuperó exactamente los mismos fragmentos y la conversación previa (su
+    huella: resumen y turnos ya respondidos) es idéntica, de modo que la
+    respuesta se generó con el mismo contexto. Así, entre llamadas distintas
+    solo se comparten respuestas de turnos sin historial previo, y una
+    pregunta que depende de lo hablado ("¿Cuánto cuesta eso?") nunca recibe
+    la respuesta de otra conversación. Las transcripciones muy cortas ("sí",
+    "vale") nunca se cachean.
+    """
+
+    def __init__(self, threshold=0.92, max_entries=500, ttl=3600, persist_path=None, min_chars=12):
+        self.threshold = threshold
+        self.min_chars = min_chars
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.persist_path = Path(persist_path) if persist_path else None
+        self._lock = threading.Lock()
+        if self.persist_path and self.persist_path.exists():
+            self._load()
+
+    def accepts(self, transcript):
+        """Indica si la transcripción es lo bastante autónoma para reutilizar respuestas."""
+        return len(transcript.strip()) >= self.min_chars
+
+    @staticmethod
+    def context_key(documents, conversation=""):
+        """Huella de los fragmentos recuperados por el RAG y de la conversación previa."""
+        return hashlib.sha256("\x1e".join([conversation] + list(documents)).encode("utf-8")).hexdigest()
+
+    def lookup(self, embedding, documents, conversation=""):
+        """Devuelve la respuesta cacheada más parecida con el mismo contexto, o None."""
+        context_key = self.context_key(documents, conversation)
+        query = self._normalize(embedding)
+        candidates = [(key, value) for key, value, _ in self.cache.items() if value["context"] == context_key]
+        if not candidates:
+            self.cache.miss()
+            return None
+
+        matrix = np.vstack([value["embedding"] for _, value in candidates])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.cache.miss()
+            return None
+
+        key, value = candidates[best]
+        self.cache.touch(key)
+        return value["answer"]
+
+    def store(self, transcript, embedding, documents, answer, conversation=""):
+        """Guarda la respuesta de una transcripción junto a su embedding y su contexto."""
+        context_key = self.context_key(documents, conversation)
+        key = hashlib.sha256(f"{transcript}\x1e{context_key}".encode("utf-8")).hexdigest()
+        self.cache.put(key, {
+            "embedding": self._normalize(embedding),
+            "context": context_key,
+            "answer": answer
+        })
+
+    def _normalize(self, embedding):
+        vector = np.asarray(embedding, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _load(self):
+        """Carga las respuestas persistidas que no hayan caducado."""
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            print(f"⚠️ Caché de respuestas {self.persist_path} ilegible. Se empieza vacía.")
+            return
+        for entry in entries:
+            self.cache.put(entry["key"], {
+                "embedding": np.asarray(entry["embedding"], dtype="float32"),
+                "context": entry["context"],
+                "answer": entry["answer"]
+            }, created_at=entry["created_at"])
+        self.cache.hits = self.cache.misses = self.cache.evictions = 0
+        print(f"♻️ Caché de respuestas cargada con {len(self.cache.entries)} entradas.")
+
+    def save(self):
+        """Persiste las respuestas vigentes en disco (si hay ruta configurada)."""
+        if not self.persist_path:
+            return
+        entries = [
+            {
+                "key": key,
+                "embedding": value["embedding"].tolist(),
+                "context": value["context"],
+                "answer": value["answer"],
+                "created_at": created_at
+            }
+            for key, value, created_at in self.cache.items()
+        ]
+        with self._lock:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.persist_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(entries), encoding="utf-8")
+            os.replace(tmp_path, self.persist_path)
+
+    def stats(self):
+        return self.cache.stats()
+
+class TTSAudioCache:
+    """Caché direccionada por contenido del audio sintetizado por ElevenLabs.
+
+    La clave es el hash del texto, la voz, el modelo, el formato de salida y
+    los ajustes de voz, así que una misma respuesta nunca se sintetiza dos
+    veces. Con `persist_dir` el audio se guarda también en disco.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=7 * 24 * 3600, persist_dir=None):
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.cache = LRUCache(
+            max_entries=10 ** 6,
+            max_bytes=max_bytes,
+            ttl=ttl,
+            sizeof=len,
+            on_evict=self._delete_file
+        )
+        if self.persist_dir:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    @staticmethod
+    def key(text, voice_id, model, output_format, voice_settings):
+        """Clave de contenido del audio de un texto con una voz y unos ajustes concretos."""
+        payload = json.dumps(
+            {"text": text, "voice_id": voice_id, "model": model, "format": output_format, "settings": voice_settings},
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def put(self, key, audio):
+        """Guarda el audio completo de un texto en memoria y, si procede, en disco."""
+        if not audio:
+            return
+        self.cache.put(key, audio)
+        if self.persist_dir and key in self.cache.entries:
+            tmp_path = self.persist_dir / f"{key}.tmp"
+            tmp_path.write_bytes(audio)
+            os.replace(tmp_path, self.persist_dir / f"{key}.pcm")
+
+    def _load(self):
+        """Carga el audio persistido, del más antiguo al más reciente."""
+        files = sorted(self.persist_dir.glob("*.pcm"), key=lambda path: path.stat().st_mtime)
+        for path in files:
+            self.cache.put(path.stem, path.read_bytes(), created_at=path.stat().st_mtime)
+        self.cache.evictions = 0
+        if files:
+            print(f"♻️ Caché de audio cargada con {len(self.cache.entries)} entradas.")
+
+    def _delete_file(self, key, value):
+        if self.persist_dir:
+            try:
+                os.remove(self.persist_dir / f"{key}.pcm")
+            except OSError:
+                pass
+
+    def stats(self):
+        return self.cache.stats()
+
+def create_answer_cache(config):
+    """Crea la caché semántica de respuestas desde `cache.answers` de config.yaml (desactivada salvo `enabled: true`)."""
+    config = config or {}
+    if not config.get("enabled", False):
+        return None
+    return SemanticAnswerCache(
+        threshold=config.get("threshold", 0.92),
+        max_entries=config.get("max_entries", 500),
+        ttl=config.get("ttl", 3600),
+        persist_path=config.get("persist_path"),
+        min_chars=config.get("min_chars", 12)
+    )
+
+def create_tts_cache(config):
+    """Crea la caché de audio TTS desde `cache.tts` de config.yaml, o None si está desactivada."""
+    config = config or {}
+    if not config.get("enabled", True):
+        return None
+    return TTSAudioCache(
+        max_bytes=config.get("max_bytes", 64 * 1024 * 1024),
+        ttl=config.get("ttl", 7 * 24 * 3600),
+        persist_dir=config.get("persist_dir")
+    )
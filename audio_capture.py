@@ -0,0 +1,115 @@
+import asyncio
+import time
+import pyaudio
+
+from src.metrics import LatencyStats
+from src.tracing import TRACER
+
+class AudioCapture:
+    """Captura del micrófono en el hilo de callback de PyAudio hacia una cola asyncio acotada.
+
+    El bucle de eventos nunca bloquea leyendo el micrófono: PyAudio entrega
+    cada bloque en su propio hilo y este se pasa a la cola con
+    `call_soon_threadsafe`. La cola actúa como búfer de jitter: el consumo
+    empieza cuando hay `jitter_frames` bloques y, cada vez que se vacía, se
+    espera a que vuelva a tenerlos (eso es un underrun). Si se llena (el
+    envío va más lento que la captura), se descarta el bloque más antiguo.
+    Con `jitter_frames=1` no hay búfer: cada bloque se envía al llegar.
+    """
+
+    def __init__(self, loop, rate, channels, sample_format, chunk, device_id=None, max_queue_frames=50,
+                 jitter_frames=1):
+        self.loop = loop
+        self.rate = rate
+        self.channels = channels
+        self.sample_format = sample_format
+        self.chunk = chunk
+        self.device_id = device_id
+        self.jitter_frames = max(1, jitter_frames)
+        self.queue = asyncio.Queue(maxsize=max_queue_frames)
+        self._prefilled = asyncio.Event()
+
+        self.audio = None
+        self.stream = None
+        self.running = False
+
+        self.overflows = 0  # Bloques descartados porque la cola estaba llena
+        self.input_overflows = 0  # Desbordamientos notificados por PyAudio
+        self.underruns = 0  # Veces que el búfer de jitter se agotó y hubo que volver a llenarlo
+        self.capture_to_send = LatencyStats()
+
+    def start(self):
+        """Abre el micrófono en modo callback."""
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(
+            format=self.sample_format,
+            channels=self.channels,
+            rate=self.rate,
+            input=True,
+            input_device_index=self.device_id,
+            frames_per_buffer=self.chunk,
+            stream_callback=self._callback
+        )
+        self.running = True
+        self.stream.start_stream()
+        print("🎤 Micrófono iniciado...")
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """Hilo de PyAudio: entrega el bloque al bucle de eventos sin bloquear."""
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        if self.running:
+            self.loop.call_soon_threadsafe(self._enqueue, in_data, time.perf_counter())
+        return (None, pyaudio.paContinue)
+
+    def _enqueue(self, data, captured_at):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.overflows += 1
+        self.queue.put_nowait((data, captured_at))
+        if self.queue.qsize() >= self.jitter_frames:
+            self._prefilled.set()
+
+    async def frames(self):
+        """Generador asíncrono de (bloque PCM, instante de captura) con búfer de jitter."""
+        while True:
+            if self.queue.empty():
+                # Búfer agotado: se vuelve a llenar hasta `jitter_frames` bloques antes de seguir enviando
+                if self._prefilled.is_set() and self.running and self.jitter_frames > 1:
+                    self.underruns += 1
+                self._prefilled.clear()
+                await self._prefilled.wait()
+            item = self.queue.get_nowait()
+            if item is None:
+                break
+            yield item
+
+    def record_sent(self, captured_at):
+        """Registra la latencia captura → envío de un bloque."""
+        latency = time.perf_counter() - captured_at
+        self.capture_to_send.record(latency)
+        TRACER.observe("capture.send", latency)
+
+    def stats(self):
+        """Contadores del búfer y latencia captura → envío."""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "overflows": self.overflows,
+            "input_overflows": self.input_overflows,
+            "underruns": self.underruns,
+            "capture_to_send": self.capture_to_send.summary()
+        }
+
+    def stop(self):
+        """Cierra el micrófono y despierta al consumidor."""
+        self.running = False
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
+        if self.audio:
+            self.audio.terminate()
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+        self._prefilled.set()
+        print("🎤 Micrófono detenido.")
@@ -1,77 +1,59 @@
 import asyncio
+import time
 import pyaudio
-from deepgram import DeepgramClient, LiveTranscriptionEvents, LiveOptions
-import yaml
+from deepgram import LiveTranscriptionEvents, LiveOptions
 from pathlib import Path
 import sys
 import threading
-import queue
-import tkinter as tk
-from tkinter import scrolledtext
 
 # Añade la raíz del proyecto al path de Python
 sys.path.append(str(Path(__file__).parent.parent))
 
 from src.llm_processor import LLMProcessor
 from src.audio_output import AudioPlayback
+from src.vad import UtteranceAssembler, create_vad, format_trace
+from src.turn_scheduler import TurnScheduler
+from src.audio_capture import AudioCapture
+from src.backends import create_stt_client
+from src.tracing import configure_tracing
+from src.startup import StartupOrchestrator, load_config
+from src.http_pool import close_http_pool, http_stats, preconnect
+from src.transcript_sink import TerminalTranscriptView, create_transcript_sinks
 
-class TranscriptionWindow:
-    """Ventana secundaria para mostrar transcripciones en tiempo real."""
-    def __init__(self, transcript_queue):
-        self.queue = transcript_queue
-        self.root = tk.Tk()
-        self.root.title("Transcripciones de Deepgram")
-        self.root.geometry("400x300")
-        self.root.configure(bg="#0d1b2a")  # Color de fondo de la ventana
-        
-        self.text_area = scrolledtext.ScrolledText(
-            self.root, 
-            wrap=tk.WORD, 
-            width=40, 
-            height=20, 
-            bg="#0d1b2a",  # Color de fondo del área de texto
-            fg="#ffffff",  # Color del texto blanco para contraste
-            insertbackground="#ffffff"  # Color del cursor
-        )
-        self.text_area.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
-        
-        self.running = True
-        self.update_thread = threading.Thread(target=self.update_text)
-        self.update_thread.daemon = True
-        self.update_thread.start()
-        
-        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
-        self.root.mainloop()
-
-    def update_text(self):
-        """Actualiza la ventana con las transcripciones de la cola."""
-        while self.running:
-            try:
-                transcript = self.queue.get(timeout=0.1)
-                if transcript is None:
-                    break
-                self.text_area.insert(tk.END, f"{transcript}\n")
-                self.text_area.see(tk.END)
-            except queue.Empty:
-                continue
-
-    def on_closing(self):
-        """Cierra la ventana limpiamente."""
-        self.running = False
-        self.root.destroy()
+# Deepgram cierra la conexión si no recibe nada en ~10 s
+KEEPALIVE_INTERVAL = 5
 
 class AudioInput:
     def __init__(self, config_path=None):
+        """Lee la configuración una vez y arranca en paralelo el RAG, el LLM y la reproducción.
+
+        El constructor no espera a ningún componente pesado: `start()` abre
+        Deepgram y empieza a escuchar en cuanto el LLM y la reproducción están
+        listos, y el RAG se incorpora a la conversación cuando termina de
+        cargar el modelo, sincronizar el índice y calentarse.
+        """
         if config_path is None:
             config_path = Path(__file__).parent.parent / "config" / "config.yaml"
-        
-        with open(config_path, "r") as f:
-            config = yaml.safe_load(f)
 
-        deepgram_config = config["deepgram"]
-        self.api_key = deepgram_config["api_key"]
-        self.deepgram = DeepgramClient(self.api_key)
-        self.dg_connection = self.deepgram.listen.websocket.v("1")
+        config = load_config(config_path)
+        configure_tracing(config.get("tracing"))
+        # Vistas de la conversación (por defecto, la ventana Tk, que `main()` ejecuta en el hilo principal)
+        self.transcripts = create_transcript_sinks(config.get("transcripts"), default_sinks=("tk",))
+        self.startup = StartupOrchestrator()
+        rag_future = self.startup.start("rag", self._create_rag(config_path, config), warmup=lambda rag: rag.warm_up())
+        self.startup.start("llm", lambda: LLMProcessor(
+            config_path, rag_backend=rag_future, config=config, transcript_sink=self.transcripts
+        ))
+        self.startup.start("tts", lambda: AudioPlayback(config_path, config=config))
+        self.llm = None
+        self.playback = None
+
+        self.deepgram_config = config["deepgram"]
+        self.api_key = self.deepgram_config["api_key"]
+        stt_started = time.perf_counter()
+        self.deepgram = create_stt_client(config)
+        self.dg_connection = self.deepgram.listen.asyncwebsocket.v("1")
+        self._stt_created = (stt_started, time.perf_counter())
 
         audio_config = config["audio"]
         self.chunk = audio_config["chunk"]
@@ -79,25 +61,40 @@ class AudioInput:
         self.channels = audio_config["channels"]
         self.rate = audio_config["rate"]
         self.device_id = audio_config["device_id"]
+        # Búfer de jitter entre el hilo de captura y el envío a Deepgram
+        self.max_queue_frames = audio_config.get("max_queue_frames", 50)
+        self.jitter_frames = audio_config.get("jitter_frames", 1)
 
-        self.llm = LLMProcessor(config_path)
-        self.playback = AudioPlayback(config_path)
+        # Modo streaming: LLM -> TTS -> reproducción frase a frase
+        streaming_config = config.get("streaming") or {}
+        self.streaming = streaming_config.get("enabled", True)
 
-        self.transcript_queue = queue.Queue()
+        # VAD local: solo se envía la voz a Deepgram y se entrega un turno por locución
+        vad_config = config.get("vad") or {}
+        self.vad = create_vad(vad_config, self.rate, self.channels)
+        self.assembler = None
+        if self.vad is not None:
+            self.assembler = UtteranceAssembler(
+                self._dispatch_utterance,
+                finalize_timeout=vad_config.get("finalize_timeout", 1.5)
+            )
+        self._last_audio_sent = time.time()
 
-        self.transcript_window_thread = threading.Thread(
-            target=TranscriptionWindow, args=(self.transcript_queue,)
-        )
-        self.transcript_window_thread.daemon = True
-        self.transcript_window_thread.start()
+        # El planificador de turnos se crea en start(), dentro del bucle de eventos
+        self.turns_config = config.get("turns") or {}
+        self.scheduler = None
 
-        self.audio = None
-        self.stream = None
+        self.capture = None
+
+    def _create_rag(self, config_path, config):
+        def create():
+            # Importación diferida: sentence-transformers y FAISS se cargan en el hilo de arranque
+            from src.rag_backend import RAGBackend
+            return RAGBackend(config_path, config=config)
+        return create
 
     def _configure_transcription_options(self):
-        config_path = Path(__file__).parent.parent / "config" / "config.yaml"
-        with open(config_path, "r") as f:
-            config = yaml.safe_load(f)["deepgram"]
+        config = self.deepgram_config
         return LiveOptions(
             model=config["model"],
             language=config["language"],
@@ -106,69 +103,166 @@ class AudioInput:
             sample_rate=self.rate
         )
 
-    def _on_transcript(self, sender, result, **kwargs):
+    async def _on_transcript(self, client, result, **kwargs):
         if result.channel and result.channel.alternatives:
             transcript = result.channel.alternatives[0].transcript
-            if transcript:
-                self.transcript_queue.put(transcript)
+            if self.assembler is not None:
+                # Con VAD se acumulan los resultados finales hasta el fin de la locución
+                self.assembler.add_result(transcript, result.is_final, getattr(result, "from_finalize", False))
+            elif transcript:
                 self.playback.stop()
-                threading.Thread(target=self._process_transcript, args=(transcript,)).start()
+                self.scheduler.submit(transcript)
+
+    def _dispatch_utterance(self, transcript, trace):
+        """Lanza un único turno LLM + TTS con la transcripción completa de la locución."""
+        print(f"⏱️ Turno: {format_trace(trace)}")
+        self.playback.stop()
+        speech_ended_at = None
+        if "speech_end" in trace:
+            # El VAD marca con time.time(); los turnos se miden con perf_counter
+            speech_ended_at = time.perf_counter() - (time.time() - trace["speech_end"])
+        self.scheduler.submit_threadsafe(transcript, speech_ended_at=speech_ended_at, trace=trace)
+
+    async def _send_audio(self, data, captured_at):
+        """Envía el audio a Deepgram, pasando antes por el VAD si está activado."""
+        if self.vad is None:
+            await self.dg_connection.send(data)
+            self.capture.record_sent(captured_at)
+            return
 
-    def _process_transcript(self, transcript):
-        print(f"Transcripción: {transcript}")
-        response = self.llm.process(transcript)
-        print(f"Respuesta de Grok: {response}")
-        self.playback.play(response)
+        frames, events = self.vad.process(data)
+        for frame in frames:
+            await self.dg_connection.send(frame)
+        now = time.time()
+        if frames:
+            # El pre-roll se retiene a propósito; la latencia se mide con el bloque recién capturado
+            self.capture.record_sent(captured_at)
+            self._last_audio_sent = now
+        elif now - self._last_audio_sent > KEEPALIVE_INTERVAL:
+            await self.dg_connection.keep_alive()
+            self._last_audio_sent = now
 
-    def _setup_deepgram(self):
+        for event in events:
+            await self._on_vad_event(event)
+
+    async def _on_vad_event(self, event):
+        """Reacciona a los eventos del VAD: barge-in al empezar a hablar y cierre del turno al terminar."""
+        if event.kind == "speech_start":
+            print(f"🟢 Voz detectada ({event.timestamp:.3f})")
+            self.playback.stop()
+            # Mientras el usuario habla se calientan las conexiones con Grok y ElevenLabs
+            preconnect()
+            self.assembler.speech_started(event.timestamp)
+        elif event.kind == "speech_end":
+            print(f"🔴 Fin de voz ({event.timestamp:.3f})")
+            await self.dg_connection.finalize()
+            self.assembler.speech_ended(event.timestamp)
+
+    async def _setup_deepgram(self):
         self.dg_connection.on(LiveTranscriptionEvents.Transcript, self._on_transcript)
         options = self._configure_transcription_options()
-        self.dg_connection.start(options)
+        await self.dg_connection.start(options)
         print("🔗 Conexión con Deepgram establecida.")
 
-    def _setup_audio(self):
-        self.audio = pyaudio.PyAudio()
-        self.stream = self.audio.open(
-            format=self.format,
-            channels=self.channels,
-            rate=self.rate,
-            input=True,
-            input_device_index=self.device_id,
-            frames_per_buffer=self.chunk
+    def _setup_audio(self, loop):
+        """Abre el micrófono en un hilo de callback que alimenta la cola del bucle de eventos."""
+        self.capture = AudioCapture(
+            loop,
+            self.rate,
+            self.channels,
+            self.format,
+            self.chunk,
+            device_id=self.device_id,
+            max_queue_frames=self.max_queue_frames,
+            jitter_frames=self.jitter_frames
         )
-        print("🎤 Micrófono iniciado...")
+        self.capture.start()
 
     async def start(self):
-        self._setup_deepgram()
-        self._setup_audio()
+        loop = asyncio.get_running_loop()
+        # Deepgram se conecta mientras terminan de arrancar el LLM y la reproducción; el RAG no se espera
+        stt_started, stt_created = self._stt_created
+        _, self.llm, self.playback = await asyncio.gather(
+            self._setup_deepgram(),
+            self.startup.wait("llm"),
+            self.startup.wait("tts")
+        )
+        self.startup.record("stt", stt_started, stt_created)
+        self.scheduler = TurnScheduler(
+            self.llm,
+            self.playback,
+            loop=loop,
+            streaming=self.streaming,
+            max_concurrent=self.turns_config.get("max_concurrent", 2),
+            cancel_wait=self.turns_config.get("cancel_wait", 2.0)
+        )
+        self._setup_audio(loop)
+        if not self.startup.ready("rag"):
+            print("⏳ El RAG sigue arrancando; se incorporará a la conversación al terminar.")
         print("🎤 Habla al micrófono... (Ctrl+C para detener)")
         try:
-            while True:
-                data = self.stream.read(self.chunk, exception_on_overflow=False)
-                self.dg_connection.send(data)
-                await asyncio.sleep(0.01)
-        except KeyboardInterrupt:
+            async for data, captured_at in self.capture.frames():
+                await self._send_audio(data, captured_at)
+        except (KeyboardInterrupt, asyncio.CancelledError):
             await self.stop()
 
     async def stop(self):
+        if self.scheduler is not None:
+            await self.scheduler.close()
+            print(f"📊 Turnos: {self.scheduler.stats()}")
         if self.dg_connection:
             await self.dg_connection.finish()
             print("🔗 Conexión con Deepgram cerrada.")
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-        if self.audio:
-            self.audio.terminate()
-            print("🎤 Micrófono detenido.")
-        self.playback.close()
-        self.transcript_queue.put(None)
-        self.transcript_window_thread.join(timeout=1)
-        print("📌 Ventana de transcripciones detenida.")
+        if self.capture is not None:
+            self.capture.stop()
+            print(f"🎚️ Captura: {self.capture.stats()}")
+        if self.vad is not None:
+            print(f"📉 VAD: {self.vad.stats()}")
+        if self.playback is not None:
+            self.playback.close()
+        if self.llm is not None:
+            self.llm.close()
+        if http_stats() is not None:
+            print(f"🌐 HTTP: {http_stats()}")
+        close_http_pool()
+        if self.startup.ready("rag"):
+            self.startup.get("rag").close()
+        self.startup.shutdown()
+        print(f"🚀 Arranque por componente: {self.startup.report()}")
+        self.transcripts.close()
+        print("📌 Vistas de transcripciones detenidas.")
         print("\n📌 Transcripción detenida.")
 
-async def main():
+def main():
     audio_input = AudioInput()
-    await audio_input.start()
+    view = audio_input.transcripts.main_thread_view
+    if view is not None:
+        try:
+            view.open()
+        except Exception as e:
+            # Sin pantalla (TclError) o sin tkinter: las transcripciones van a la terminal
+            print(f"⚠️ No se pudo abrir la ventana de transcripciones ({e}). Se muestran en la terminal.")
+            audio_input.transcripts.replace(view, TerminalTranscriptView())
+            view = None
+    if view is None:
+        asyncio.run(audio_input.start())
+        return
+
+    # Tk debe ejecutarse en el hilo principal: la llamada va en un hilo con su propio bucle de eventos
+    loop = asyncio.new_event_loop()
+    call = loop.create_task(audio_input.start())
+    call.add_done_callback(lambda _: view.close())
+    thread = threading.Thread(target=loop.run_until_complete, args=(call,), name="call-loop")
+    thread.start()
+    try:
+        view.run(on_close=lambda: loop.call_soon_threadsafe(call.cancel))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Si la ventana se cierra o falla, la llamada no debe seguir sin nadie que la espere
+        loop.call_soon_threadsafe(call.cancel)
+    thread.join()
+    loop.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    main()
\ No newline at end of file
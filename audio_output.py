@@ -1,125 +1,204 @@
-import os
 import time
 import yaml
-import shutil
 from pathlib import Path
-from elevenlabs import ElevenLabs, VoiceSettings
-import subprocess
-import signal
+from elevenlabs import VoiceSettings
+
+from src.audio_sink import PlaybackEngine, create_sink
+from src.answer_cache import TTSAudioCache, create_tts_cache
+from src.backends import create_tts_client
+from src.http_pool import create_retry_policy
+from src.tracing import TRACER
+
+# Valor por defecto de `tts_cache`: distingue "crear según config.yaml" de un None explícito
+_FROM_CONFIG = object()
 
 class AudioPlayback:
     """Clase para reproducir texto como audio usando ElevenLabs."""
 
-    def __init__(self, config_path=None):
-        """Inicializa el cliente de ElevenLabs y verifica ffplay."""
+    def __init__(self, config_path=None, sink=None, tts_cache=_FROM_CONFIG, tts_client=None, config=None):
+        """Inicializa el cliente de ElevenLabs y el motor de reproducción persistente.
+
+        `sink` permite inyectar un destino de audio (por ejemplo `NullSink` en
+        pruebas sin tarjeta de sonido); si no se indica se crea según la
+        sección `playback` de config.yaml. `tts_cache` permite compartir la
+        caché de audio sintetizado entre sesiones (None la desactiva; si no se
+        indica se crea según `cache.tts`) y `tts_client` el cliente de
+        ElevenLabs (o su sustituto local). `config` es la configuración ya
+        leída, para no volver a abrir config.yaml.
+        """
         if config_path is None:
             config_path = Path(__file__).parent.parent / "config" / "config.yaml"
-        
-        # Forzar el PATH para incluir FFmpeg
-        ffmpeg_path = r"C:\ffmpeg\bin"  # Ajusta esta ruta según tu instalación
-        os.environ["PATH"] = ffmpeg_path + os.pathsep + os.environ["PATH"]
-        print(f"DEBUG: PATH actualizado = {os.environ['PATH']}")
 
-        with open(config_path, "r") as f:
-            config = yaml.safe_load(f)["elevenlabs"]
+        if config is None:
+            with open(config_path, "r") as f:
+                config = yaml.safe_load(f)
+        full_config = config
+        config = full_config["elevenlabs"]
+        playback_config = full_config.get("playback") or {}
 
         self.api_key = config["api_key"]
         self.voice_id = config["voice_id"]
-        self.client = ElevenLabs(api_key=self.api_key)
-
-        # Verificar ffplay
-        self.ffplay_path = shutil.which("ffplay")
-        if self.ffplay_path:
-            print(f"✅ ffplay detectado en: {self.ffplay_path}")
-        else:
-            print("🚨 ERROR: ffplay no detectado. Asegúrate de que FFmpeg está instalado y en el PATH.")
-        
-        self.active_processes = []  # Lista para rastrear todos los procesos FFmpeg activos
-
-    def play(self, text):
-        """Convierte el texto en audio con ElevenLabs y lo reproduce con ffplay."""
+        self.client = tts_client or create_tts_client(full_config)
+        self.retry = create_retry_policy(full_config, "tts")
+        self.tts_model = "eleven_multilingual_v2"
+        self.voice_settings = {"speed": 1.1, "stability": 0.5, "similarity_boost": 0.8}
+
+        # Caché de audio: una misma frase con la misma voz no se sintetiza dos veces
+        if tts_cache is _FROM_CONFIG:
+            tts_cache = create_tts_cache((full_config.get("cache") or {}).get("tts"))
+        self.tts_cache = tts_cache
+
+        # ElevenLabs entrega PCM 16 bits mono, que se escribe sin decodificar
+        self.output_format = config.get("output_format", "pcm_22050")
+        if not self.output_format.startswith("pcm_"):
+            raise ValueError(f"Formato de salida no soportado: {self.output_format}. Usa pcm_<frecuencia>.")
+        sample_rate = int(self.output_format.split("_")[1])
+
+        if sink is None:
+            sink = create_sink(playback_config)
+        self.engine = PlaybackEngine(
+            sink,
+            sample_rate=sample_rate,
+            frame_ms=playback_config.get("frame_ms", 20),
+            max_buffered_frames=playback_config.get("max_buffered_frames", 256)
+        )
+        print(f"✅ Motor de reproducción listo ({type(sink).__name__}, {sample_rate} Hz)")
+
+    @property
+    def last_time_to_first_audio(self):
+        """Tiempo (s) desde el inicio del último turno hasta que empezó a sonar el audio."""
+        return self.engine.last_time_to_first_audio
+
+    def play(self, text, started_at=None, cancel_event=None):
+        """Convierte el texto en audio con ElevenLabs y lo reproduce en el motor persistente."""
         print(f"Intentando reproducir: '{text}'")
-        if not self.ffplay_path:
-            print("❌ Error: ffplay no está disponible. Instala FFmpeg y agrégalo al PATH.")
-            return
-
         try:
             # Detener todas las reproducciones anteriores
-            self.stop()
+            generation = self.engine.begin(started_at)
 
             # Pausa si contiene "Déjame revisar"
             if "Déjame revisar" in text:
                 print("⏳ Pausa de 2 segundos antes de la oferta...")
                 time.sleep(2)
 
-            # Generar audio desde ElevenLabs
+            # Generar audio desde ElevenLabs y reproducirlo a medida que llega
             print("🎤 Generando audio con ElevenLabs...")
-            audio_stream = self.client.generate(
-                text=text,
-                voice=self.voice_id,
-                model="eleven_multilingual_v2",
-                voice_settings=VoiceSettings(
-                    speed=1.1,
-                    stability=0.5,
-                    similarity_boost=0.8
-                )
-            )
-
-            # Convertir el stream a bytes
-            print("🔄 Convirtiendo stream a bytes...")
-            audio_bytes = b"".join(audio_stream)
-            print(f"📦 Audio generado, tamaño en bytes: {len(audio_bytes)}")
-
-            if len(audio_bytes) == 0:
-                print("❌ Error: No se generó audio (audio_bytes vacío)")
+            total_bytes = self._speak(text, generation, cancel_event)
+            if total_bytes is None:
+                print("🛑 Reproducción interrumpida.")
                 return
+            print(f"📦 Audio generado, tamaño en bytes: {total_bytes}")
 
-            # Reproducir con ffplay manualmente
-            print("🔊 Reproduciendo audio con ffplay...")
-            process = subprocess.Popen(
-                [self.ffplay_path, "-nodisp", "-autoexit", "-i", "pipe:0"],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            process.stdin.write(audio_bytes)
-            process.stdin.flush()
-            process.stdin.close()
-            self.active_processes.append(process)
-            print("✅ Reproducción iniciada.")
-
-            # Limpiar procesos terminados
-            self._cleanup_processes()
+            if total_bytes == 0:
+                print("❌ Error: No se generó audio (audio_bytes vacío)")
 
         except Exception as e:
             print(f"❌ Error al reproducir con ElevenLabs: {e}")
             import traceback
             traceback.print_exc()
 
+    def play_stream(self, sentences, started_at=None, cancel_event=None):
+        """Sintetiza y reproduce frase a frase a medida que llegan del LLM.
+
+        El audio de todas las frases se encola en la misma locución del motor,
+        que empieza a sonar con el primer fragmento. Se detiene al vaciar el
+        motor (`stop()`) o al activarse `cancel_event`. Devuelve el texto de
+        las frases entregadas completas al motor; una frase cortada a mitad de
+        síntesis no cuenta, igual que en el historial del LLM.
+        """
+        if started_at is None:
+            started_at = time.perf_counter()
+        generation = self.engine.begin(started_at)
+        spoken = []
+
+        try:
+            for sentence in sentences:
+                if generation != self.engine.generation or (cancel_event is not None and cancel_event.is_set()):
+                    break
+                print(f"Intentando reproducir: '{sentence}'")
+
+                if "Déjame revisar" in sentence:
+                    print("⏳ Pausa de 2 segundos antes de la oferta...")
+                    time.sleep(2)
+
+                if self._speak(sentence, generation, cancel_event) is None:
+                    print("🛑 Reproducción en streaming interrumpida.")
+                    break
+                spoken.append(sentence)
+        except Exception as e:
+            print(f"❌ Error al reproducir en streaming con ElevenLabs: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            if hasattr(sentences, "close"):
+                # Cierra el generador del LLM para que registre la respuesta
+                sentences.close()
+
+        return " ".join(spoken)
+
+    def _speak(self, text, generation, cancel_event=None):
+        """Encola el audio de un texto, desde la caché si ya se sintetizó.
+
+        Devuelve los bytes encolados, o None si la locución se canceló.
+        """
+        key = None
+        if self.tts_cache is not None:
+            key = TTSAudioCache.key(text, self.voice_id, self.tts_model, self.output_format, self.voice_settings)
+            audio = self.tts_cache.get(key)
+            if audio is not None:
+                print("♻️ Audio reutilizado de la caché TTS.")
+                return len(audio) if self.engine.enqueue(audio, generation) else None
+
+        chunks = []
+        request_started = time.perf_counter()
+        audio_stream = self._synthesize(text)
+        for chunk in audio_stream:
+            if not chunks:
+                TRACER.record("tts.first_byte", time.perf_counter() - request_started, chars=len(text))
+            chunks.append(chunk)
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            if cancelled or not self.engine.enqueue(chunk, generation):
+                if hasattr(audio_stream, "close"):
+                    # Abandona la síntesis en curso en ElevenLabs
+                    audio_stream.close()
+                return None
+        audio = b"".join(chunks)
+        TRACER.record("tts.complete", time.perf_counter() - request_started, chars=len(text), bytes=len(audio))
+        if key is not None:
+            # Solo se cachea el audio completo, nunca una síntesis interrumpida
+            self.tts_cache.put(key, audio)
+        return len(audio)
+
+    def _synthesize(self, text):
+        """Pide a ElevenLabs el audio PCM del texto y devuelve un iterador de fragmentos.
+
+        La petición pasa por `RetryPolicy`: se reintenta ante errores
+        transitorios y se duplica si el primer fragmento tarda demasiado.
+        """
+        return self.retry.run(lambda: self.client.generate(
+            text=text,
+            voice=self.voice_id,
+            model=self.tts_model,
+            voice_settings=VoiceSettings(**self.voice_settings),
+            output_format=self.output_format,
+            stream=True
+        ))
+
     def stop(self):
-        """Detiene todas las reproducciones activas de ffplay de manera robusta."""
-        if self.active_processes:
-            print("🛑 Deteniendo todas las reproducciones anteriores...")
-            for process in self.active_processes:
-                if process.poll() is None:  # Si el proceso está activo
-                    try:
-                        process.kill()  # Usar kill() para una terminación más agresiva
-                        process.wait(timeout=1)  # Esperar con límite de tiempo
-                    except subprocess.TimeoutExpired:
-                        print(f"⚠️ Proceso {process.pid} no terminó a tiempo, forzando con taskkill...")
-                        os.system(f"taskkill /PID {process.pid} /F")  # Forzar en Windows
-            self.active_processes.clear()
-            print("✅ Todas las reproducciones detenidas.")
-
-        # Doble verificación: matar todos los ffplay.exe en Windows
-        print("🔍 Verificando y eliminando cualquier ffplay residual...")
-        os.system("taskkill /IM ffplay.exe /F >nul 2>&1")  # Silencioso, fuerza la terminación de todos los ffplay
-
-    def _cleanup_processes(self):
-        """Elimina los procesos que ya terminaron de la lista."""
-        self.active_processes = [p for p in self.active_processes if p.poll() is None]
+        """Corta la reproducción en curso vaciando el búfer del motor (barge-in)."""
+        latency = self.engine.flush()
+        if latency is not None:
+            print(f"🛑 Reproducción detenida en {latency * 1000:.1f} ms.")
+
+    def stats(self):
+        """Latencias de arranque y parada de la reproducción y aciertos de la caché TTS."""
+        stats = self.engine.stats()
+        if self.tts_cache is not None:
+            stats["tts_cache"] = self.tts_cache.stats()
+        stats["retries"] = self.retry.stats()
+        return stats
 
     def close(self):
         """Cierra recursos."""
-        self.stop()  # Detener todas las reproducciones
-        print("🛑 Cierre de AudioPlayback completado.")
\ No newline at end of file
+        self.engine.close()
+        print("🛑 Cierre de AudioPlayback completado.")
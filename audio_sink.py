@@ -0,0 +1,257 @@
+import queue
+import threading
+import time
+import wave
+
+from src.metrics import LatencyStats
+
+class AudioSink:
+    """Destino de audio PCM que permanece abierto durante toda la llamada."""
+
+    def open(self, sample_rate, channels, sample_width):
+        """Abre el destino con el formato PCM indicado."""
+        raise NotImplementedError
+
+    def write(self, pcm):
+        """Escribe un bloque PCM; puede bloquear para marcar el ritmo de reproducción."""
+        raise NotImplementedError
+
+    def close(self):
+        """Libera el destino."""
+
+class PyAudioSink(AudioSink):
+    """Reproduce por la tarjeta de sonido con un único stream de salida de PyAudio."""
+
+    def __init__(self, device_id=None):
+        self.device_id = device_id
+        self.audio = None
+        self.stream = None
+
+    def open(self, sample_rate, channels, sample_width):
+        import pyaudio
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(
+            format=self.audio.get_format_from_width(sample_width),
+            channels=channels,
+            rate=sample_rate,
+            output=True,
+            output_device_index=self.device_id
+        )
+        print("🔊 Stream de salida de audio abierto.")
+
+    def write(self, pcm):
+        self.stream.write(pcm)
+
+    def close(self):
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
+        if self.audio:
+            self.audio.terminate()
+
+class FileSink(AudioSink):
+    """Escribe el audio en un archivo WAV (pruebas sin tarjeta de sonido)."""
+
+    def __init__(self, path, realtime=False):
+        self.path = str(path)
+        self.realtime = realtime
+        self.bytes_per_second = None
+        self.wav = None
+
+    def open(self, sample_rate, channels, sample_width):
+        self.bytes_per_second = sample_rate * channels * sample_width
+        self.wav = wave.open(self.path, "wb")
+        self.wav.setnchannels(channels)
+        self.wav.setsampwidth(sample_width)
+        self.wav.setframerate(sample_rate)
+
+    def write(self, pcm):
+        self.wav.writeframes(pcm)
+        if self.realtime:
+            time.sleep(len(pcm) / self.bytes_per_second)
+
+    def close(self):
+        if self.wav:
+            self.wav.close()
+
+class NullSink(AudioSink):
+    """Descarta el audio; con `realtime=True` simula la duración de la reproducción."""
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.bytes_per_second = None
+        self.bytes_written = 0
+
+    def open(self, sample_rate, channels, sample_width):
+        self.bytes_per_second = sample_rate * channels * sample_width
+
+    def write(self, pcm):
+        self.bytes_written += len(pcm)
+        if self.realtime:
+            time.sleep(len(pcm) / self.bytes_per_second)
+
+class QueueSink(AudioSink):
+    """Entrega el audio a una cola para que el transporte de la llamada lo envíe al llamante."""
+
+    def __init__(self, output_queue, timeout=0.5):
+        self.output_queue = output_queue
+        self.timeout = timeout
+        self.dropped_frames = 0
+
+    def open(self, sample_rate, channels, sample_width):
+        pass
+
+    def write(self, pcm):
+        # Bloquea si el transporte no consume (así se respeta su ritmo de envío),
+        # pero nunca indefinidamente para no bloquear flush()
+        try:
+            self.output_queue.put(pcm, timeout=self.timeout)
+        except queue.Full:
+            self.dropped_frames += 1
+
+def create_sink(config):
+    """Crea el destino de audio a partir de la sección `playback` de config.yaml."""
+    sink_type = config.get("sink", "pyaudio")
+    if sink_type == "pyaudio":
+        return PyAudioSink(config.get("output_device_id"))
+    if sink_type == "file":
+        return FileSink(config.get("file_path", "playback.wav"), realtime=config.get("realtime", False))
+    if sink_type == "null":
+        return NullSink(realtime=config.get("realtime", False))
+    raise ValueError(f"Destino de audio desconocido: {sink_type}")
+
+class PlaybackEngine:
+    """Motor de reproducción persistente: un hilo escribe en el destino desde un búfer acotado.
+
+    El audio se divide en tramas cortas (`frame_ms`) para que `flush()` corte
+    la reproducción casi al instante. Cada locución tiene un número de
+    generación; al vaciar el búfer se descartan las tramas de generaciones
+    anteriores que todavía estén en cola. La escritura en el destino (que
+    bloquea al ritmo de reproducción) se hace fuera del lock, así que
+    `flush()` no espera a la trama en curso: como mucho suena esa trama.
+    """
+
+    def __init__(self, sink, sample_rate=22050, channels=1, sample_width=2, frame_ms=20, max_buffered_frames=256):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * channels * sample_width
+
+        self.queue = queue.Queue(maxsize=max_buffered_frames)
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._remainder = b""
+        self._turn_started_at = None
+        self._first_enqueue_at = None
+        self._started = False
+        self._closed = False
+
+        self.start_latency = LatencyStats()
+        self.stop_latency = LatencyStats()
+        self.late_frames = 0  # Tramas que terminaron de escribirse después de un flush()
+        self.last_time_to_first_audio = None
+
+        self.sink.open(sample_rate, channels, sample_width)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def begin(self, started_at=None):
+        """Empieza una nueva locución descartando el audio pendiente y devuelve su generación.
+
+        `started_at` (perf_counter) marca el inicio del turno para medir el
+        tiempo hasta el primer audio.
+        """
+        self.flush()
+        with self._lock:
+            self._turn_started_at = started_at
+            self._first_enqueue_at = None
+            self._started = False
+            self.last_time_to_first_audio = None
+            return self.generation
+
+    def enqueue(self, pcm, generation):
+        """Encola audio PCM de una locución. Devuelve False si la locución ya fue cancelada."""
+        with self._lock:
+            if generation != self.generation:
+                return False
+            data = self._remainder + pcm
+            usable = len(data) - len(data) % (self.channels * self.sample_width)
+            self._remainder = data[usable:]
+            if self._first_enqueue_at is None and usable:
+                self._first_enqueue_at = time.perf_counter()
+
+        for offset in range(0, usable, self.frame_bytes):
+            frame = data[offset:min(offset + self.frame_bytes, usable)]
+            while True:
+                if generation != self.generation or self._closed:
+                    return False
+                try:
+                    self.queue.put((generation, frame), timeout=0.05)
+                    break
+                except queue.Full:
+                    continue
+        return True
+
+    def flush(self):
+        """Corta la reproducción y vacía el búfer. Devuelve la latencia de parada o None si no sonaba nada."""
+        requested_at = time.perf_counter()
+        # Tras el cambio de generación el hilo de escritura ya no toma tramas de esta locución
+        with self._lock:
+            self.generation += 1
+            self._remainder = b""
+            was_active = self._started or self._first_enqueue_at is not None
+            self._started = False
+            self._first_enqueue_at = None
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)
+                break
+        if not was_active:
+            return None
+        latency = time.perf_counter() - requested_at
+        self.stop_latency.record(latency)
+        return latency
+
+    def _run(self):
+        """Hilo de escritura: consume tramas y las envía al destino mientras sean vigentes."""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            generation, frame = item
+            with self._lock:
+                if generation != self.generation:
+                    continue
+                if not self._started:
+                    self._started = True
+                    now = time.perf_counter()
+                    if self._first_enqueue_at is not None:
+                        self.start_latency.record(now - self._first_enqueue_at)
+                    if self._turn_started_at is not None:
+                        self.last_time_to_first_audio = now - self._turn_started_at
+                        print(f"⏱️ Tiempo hasta el primer audio: {self.last_time_to_first_audio * 1000:.0f} ms")
+            # Fuera del lock: un flush() durante la escritura no espera a que el destino la acepte
+            self.sink.write(frame)
+            if generation != self.generation:
+                self.late_frames += 1
+
+    def stats(self):
+        """Métricas de latencia de arranque y parada de la reproducción."""
+        return {
+            "start_latency": self.start_latency.summary(),
+            "stop_latency": self.stop_latency.summary(),
+            "late_frames": self.late_frames
+        }
+
+    def close(self):
+        """Detiene el hilo de escritura y cierra el destino."""
+        self.flush()
+        self._closed = True
+        self.queue.put(None)
+        self.thread.join(timeout=1)
+        self.sink.close()
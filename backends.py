@@ -0,0 +1,224 @@
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+from collections import deque
+from deepgram import DeepgramClient, LiveTranscriptionEvents
+from openai import OpenAI
+from elevenlabs import ElevenLabs
+
+from src.http_pool import get_http_pool
+
+XAI_BASE_URL = "https://api.x.ai/v1"
+ELEVENLABS_BASE_URL = "https://api.elevenlabs.io"
+
+class MockLatency:
+    """Latencia simulada: media más jitter gaussiano, en milisegundos."""
+
+    def __init__(self, mean_ms, jitter_ms=0.0, rng=None):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.rng = rng or random.Random()
+
+    def sample(self):
+        """Una muestra de latencia en segundos (nunca negativa)."""
+        if not self.jitter_ms:
+            return self.mean_ms / 1000
+        return max(0.0, self.rng.gauss(self.mean_ms, self.jitter_ms)) / 1000
+
+    def sleep(self):
+        time.sleep(self.sample())
+
+    async def async_sleep(self):
+        await asyncio.sleep(self.sample())
+
+class MockLiveConnection:
+    """Imitación de la conexión asíncrona de Deepgram (`listen.asyncwebsocket.v("1")`).
+
+    No reconoce voz: cada `finalize()` responde, tras la latencia simulada,
+    con la siguiente frase de `script` (o con `default_transcript` si se ha
+    agotado) como resultado final `from_finalize`, igual que Deepgram al
+    cerrar una locución delimitada por el VAD.
+    """
+
+    def __init__(self, latency, default_transcript, connect_latency=None):
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.default_transcript = default_transcript
+        self.script = deque()
+        self.handlers = {}
+        self.bytes_received = 0
+        self._pending_bytes = 0
+        self._tasks = set()
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    async def start(self, options=None):
+        if self.connect_latency is not None:
+            await self.connect_latency.async_sleep()
+        return True
+
+    async def send(self, data):
+        self.bytes_received += len(data)
+        self._pending_bytes += len(data)
+
+    async def keep_alive(self):
+        return True
+
+    async def finalize(self):
+        if not self._pending_bytes:
+            return
+        self._pending_bytes = 0
+        transcript = self.script.popleft() if self.script else self.default_transcript
+        task = asyncio.create_task(self._emit(transcript))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _emit(self, transcript):
+        await self.latency.async_sleep()
+        handler = self.handlers.get(LiveTranscriptionEvents.Transcript)
+        if handler is None:
+            return
+        result = SimpleNamespace(
+            channel=SimpleNamespace(alternatives=[SimpleNamespace(transcript=transcript)]),
+            is_final=True,
+            from_finalize=True
+        )
+        await handler(self, result)
+
+    async def finish(self):
+        for task in list(self._tasks):
+            task.cancel()
+        return True
+
+class MockDeepgramClient:
+    """Sustituto local de `DeepgramClient` con la misma ruta `listen.asyncwebsocket.v("1")`."""
+
+    def __init__(self, config, rng=None):
+        rng = rng or random.Random()
+        latency = MockLatency(config.get("latency_ms", 150), config.get("jitter_ms", 50), rng)
+        connect_latency = MockLatency(config.get("connect_ms", 100), config.get("connect_jitter_ms", 20), rng)
+        default_transcript = config.get("transcript", "Hola, quería información sobre sus tarifas.")
+        factory = lambda: MockLiveConnection(latency, default_transcript, connect_latency)
+        version = SimpleNamespace(v=lambda _version: factory())
+        self.listen = SimpleNamespace(asyncwebsocket=version)
+
+class _MockStream:
+    """Respuesta en streaming de la imitación del LLM, con `close()` como el SDK de OpenAI."""
+
+    def __init__(self, words, first_token, per_token):
+        self.words = words
+        self.first_token = first_token
+        self.per_token = per_token
+        self.closed = False
+
+    def __iter__(self):
+        self.first_token.sleep()
+        for index, word in enumerate(self.words):
+            if self.closed:
+                return
+            if index:
+                self.per_token.sleep()
+            delta = SimpleNamespace(content=word if index == 0 else f" {word}")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    def close(self):
+        self.closed = True
+
+class MockLLMClient:
+    """Sustituto local del cliente OpenAI de xAI (`chat.completions.create`)."""
+
+    def __init__(self, config, rng=None):
+        rng = rng or random.Random()
+        self.first_token = MockLatency(config.get("first_token_ms", 350), config.get("jitter_ms", 80), rng)
+        self.per_token = MockLatency(config.get("token_ms", 15), config.get("token_jitter_ms", 5), rng)
+        self.response = config.get(
+            "response",
+            "Claro, con gusto le ayudo. Nuestra tarifa básica cuesta veinte euros al mes. ¿Desea que se la active?"
+        )
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model=None, messages=None, stream=False, **kwargs):
+        words = self.response.split()
+        if stream:
+            return _MockStream(words, self.first_token, self.per_token)
+        self.first_token.sleep()
+        for _ in words[1:]:
+            self.per_token.sleep()
+        prompt_tokens = sum(len(message["content"]) // 4 + 1 for message in messages or [])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.response))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens)
+        )
+
+class MockTTSClient:
+    """Sustituto local de ElevenLabs (`generate(..., stream=True)`) que devuelve PCM en silencio.
+
+    La duración del audio es proporcional al texto (`ms_per_char`) y se
+    entrega `realtime_factor` veces más rápido que tiempo real, en
+    fragmentos de `chunk_ms`.
+    """
+
+    def __init__(self, config, rng=None):
+        rng = rng or random.Random()
+        self.first_byte = MockLatency(config.get("first_byte_ms", 200), config.get("jitter_ms", 50), rng)
+        self.ms_per_char = config.get("ms_per_char", 65)
+        self.realtime_factor = config.get("realtime_factor", 4.0)
+        self.chunk_ms = config.get("chunk_ms", 100)
+
+    def generate(self, text="", output_format="pcm_22050", stream=True, **kwargs):
+        audio = self._stream(text, int(output_format.split("_")[1]))
+        return audio if stream else b"".join(audio)
+
+    def _stream(self, text, sample_rate):
+        self.first_byte.sleep()
+        remaining_ms = len(text) * self.ms_per_char
+        while remaining_ms > 0:
+            chunk_ms = min(self.chunk_ms, remaining_ms)
+            yield b"\x00\x00" * int(sample_rate * chunk_ms / 1000)
+            remaining_ms -= chunk_ms
+            if remaining_ms > 0 and self.realtime_factor:
+                time.sleep(chunk_ms / 1000 / self.realtime_factor)
+
+def backend_mode(config, name, override=None):
+    """Modo (`live` o `mock`) de un backend según la sección `backends` de config.yaml."""
+    if override:
+        return override
+    return ((config.get("backends") or {}).get(name) or {}).get("mode", "live")
+
+def _mock_config(config, name):
+    backends = config.get("backends") or {}
+    return backends.get(name) or {}, random.Random(backends.get("seed"))
+
+def create_stt_client(config, mode=None):
+    """Cliente de Deepgram real o su sustituto local según `backends.stt.mode`."""
+    if backend_mode(config, "stt", mode) == "mock":
+        return MockDeepgramClient(*_mock_config(config, "stt"))
+    return DeepgramClient(config["deepgram"]["api_key"])
+
+def create_llm_client(config, mode=None):
+    """Cliente de Grok (OpenAI SDK contra xAI) real o su sustituto local según `backends.llm.mode`.
+
+    El cliente real usa el pool HTTP/2 compartido y no reintenta por su
+    cuenta: de los reintentos se encarga `RetryPolicy` (ver http_pool.py).
+    """
+    if backend_mode(config, "llm", mode) == "mock":
+        return MockLLMClient(*_mock_config(config, "llm"))
+    pool = get_http_pool(config)
+    if pool is None:
+        return OpenAI(api_key=config["xai"]["api_key"], base_url=XAI_BASE_URL)
+    client = OpenAI(api_key=config["xai"]["api_key"], base_url=XAI_BASE_URL, http_client=pool.client, max_retries=0)
+    pool.register("xai", XAI_BASE_URL)
+    return client
+
+def create_tts_client(config, mode=None):
+    """Cliente de ElevenLabs real o su sustituto local según `backends.tts.mode`, sobre el pool HTTP/2 compartido."""
+    if backend_mode(config, "tts", mode) == "mock":
+        return MockTTSClient(*_mock_config(config, "tts"))
+    pool = get_http_pool(config)
+    if pool is None:
+        return ElevenLabs(api_key=config["elevenlabs"]["api_key"])
+    client = ElevenLabs(api_key=config["elevenlabs"]["api_key"], httpx_client=pool.client)
+    pool.register("elevenlabs", ELEVENLABS_BASE_URL)
+    return client
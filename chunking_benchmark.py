@@ -0,0 +1,177 @@
+import argparse
+import json
+import random
+import sys
+import tempfile
+from pathlib import Path
+import faiss
+import yaml
+
+# Añade la raíz del proyecto al path de Python
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.vector_store import ChunkStore, PersistentVectorStore
+from src.document_chunker import StructuredChunker, create_chunker_factory
+from src.ingestion import read_document
+
+def load_labeled_queries(path):
+    """Lee las consultas etiquetadas: una por línea en JSON con "query", "source" y opcionalmente "page" y "answer"."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def is_relevant(query, text, metadata):
+    """Un fragmento es relevante si contiene la respuesta esperada o, sin ella, si viene del documento (y página) etiquetado."""
+    if query.get("answer"):
+        return query["answer"].casefold() in text.casefold()
+    if metadata["source"] != query.get("source"):
+        return False
+    return query.get("page") is None or metadata["page"] == query["page"]
+
+def benchmark(name, chunking_config, model, documents_dir, index_config, queries, query_embeddings, top_k):
+    """Construye el índice con una estrategia de troceado y mide tamaño, memoria y precisión."""
+    count_tokens = lambda text: len(model.tokenizer.tokenize(text))
+    encode = lambda chunks: model.encode(chunks, convert_to_numpy=True)
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as index_dir:
+        store = PersistentVectorStore(
+            index_dir,
+            encode=encode,
+            load_document=read_document,
+            create_chunker=create_chunker_factory(chunking_config, count_tokens),
+            settings={"chunking": chunking_config},
+            index_config=index_config
+        )
+        index, chunks = store.sync(documents_dir)
+        if index is None:
+            print(f"❌ No hay documentos en {documents_dir}.")
+            sys.exit(1)
+
+        texts = list(chunks)
+        tokens = [count_tokens(text) for text in texts]
+        storage = {
+            "json_bytes": len(json.dumps(texts, ensure_ascii=False).encode("utf-8")),
+            "blob_bytes": sum(
+                (Path(index_dir) / filename).stat().st_size
+                for filename in (ChunkStore.BLOB_FILE, ChunkStore.OFFSETS_FILE, ChunkStore.PAGES_FILE)
+            )
+        }
+        # Memoria de los textos en una lista de Python frente a los arrays residentes del blob mapeado
+        memory = {
+            "list_bytes": sys.getsizeof(texts) + sum(sys.getsizeof(text) for text in texts),
+            "blob_resident_bytes": chunks.nbytes()["arrays"]
+        }
+
+        k = min(top_k, len(texts))
+        _, indices = index.search(query_embeddings, k)
+        precision = hits = context_tokens = 0
+        for query, row in zip(queries, indices):
+            found = [i for i in row if i >= 0]
+            relevant = sum(is_relevant(query, texts[i], store.chunk_metadata(i)) for i in found)
+            precision += relevant / k
+            hits += relevant > 0
+            context_tokens += sum(tokens[i] for i in found)
+
+        return {
+            "strategy": name,
+            "chunks": len(texts),
+            "avg_chunk_tokens": round(sum(tokens) / len(tokens), 1),
+            "index_bytes": int(faiss.serialize_index(index).nbytes),
+            "storage": storage,
+            "memory": memory,
+            f"precision@{k}": round(precision / len(queries), 4),
+            f"hit_rate@{k}": round(hits / len(queries), 4),
+            "avg_context_tokens": round(context_tokens / len(queries), 1)
+        }
+
+def check_chunk_limits(max_tokens=60, overlap_tokens=20, documents=200, seed=0):
+    """Comprueba que el troceado estructurado respeta `max_tokens` con el solapamiento incluido.
+
+    Se trocean documentos sintéticos que mezclan frases cortas, frases que
+    casi llenan un fragmento y frases más largas que `max_tokens`. Cuenta
+    tokens por palabras (así la suma de las frases es exacta) y falla si
+    algún fragmento supera el límite o si un fragmento está contenido entero
+    en el anterior (solapamiento sin contenido nuevo).
+    """
+    rng = random.Random(seed)
+    count_tokens = lambda text: len(text.split())
+    rows, passed = [], True
+    for document in range(documents):
+        sentences = []
+        for number in range(rng.randint(5, 40)):
+            length = rng.choice((rng.randint(3, 12), rng.randint(max_tokens - 10, max_tokens), rng.randint(max_tokens + 1, 3 * max_tokens)))
+            sentences.append(" ".join(f"d{document}s{number}w{word}" for word in range(length)) + ".")
+        paragraphs = [" ".join(sentences[start:start + 6]) for start in range(0, len(sentences), 6)]
+        chunker = StructuredChunker(max_tokens, overlap_tokens, count_tokens=count_tokens)
+        chunks = [text for text, _ in chunker.feed("\n\n".join(paragraphs)) + chunker.flush()]
+        oversized = sum(count_tokens(text) > max_tokens for text in chunks)
+        repeated = sum(current in previous for previous, current in zip(chunks, chunks[1:]))
+        ok = not oversized and not repeated
+        passed = passed and ok
+        rows.append({"document": document, "chunks": len(chunks), "oversized": oversized, "repeated": repeated, "ok": ok})
+    return passed, rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el troceado de tamaño fijo con el troceado por frases y párrafos.")
+    parser.add_argument("--queries", default=None, help="JSON lines con consultas etiquetadas (query, source, page, answer)")
+    parser.add_argument("--config", default=None, help="Ruta a config.yaml")
+    parser.add_argument("--documents", default=None, help="Carpeta de documentos")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Imprime el resultado en JSON")
+    parser.add_argument("--check-limits", action="store_true",
+                        help="Comprueba que ningún fragmento supera max_tokens con el solapamiento (documentos sintéticos)")
+    args = parser.parse_args()
+
+    if args.check_limits:
+        passed, rows = check_chunk_limits()
+        failed = [row for row in rows if not row["ok"]]
+        if args.json:
+            print(json.dumps({"passed": passed, "failed": failed}, indent=2))
+        else:
+            print(f"{'✅' if passed else '❌'} {len(rows) - len(failed)}/{len(rows)} documentos sin fragmentos de más ni repetidos")
+            for row in failed[:10]:
+                print(f"   documento {row['document']}: {row['oversized']} de más, {row['repeated']} repetidos")
+        sys.exit(0 if passed else 1)
+    if args.queries is None:
+        parser.error("--queries es obligatorio salvo con --check-limits")
+
+    from sentence_transformers import SentenceTransformer
+
+    base_path = Path(__file__).parent
+    config_path = args.config or base_path.parent / "config" / "config.yaml"
+    with open(config_path, "r") as f:
+        rag_config = yaml.safe_load(f).get("rag") or {}
+    documents_dir = args.documents or base_path / "documents"
+
+    model = SentenceTransformer(rag_config.get("embedding_model", "all-MiniLM-L6-v2"))
+    queries = load_labeled_queries(args.queries)
+    query_embeddings = model.encode([query["query"] for query in queries], convert_to_numpy=True).astype("float32")
+
+    structured = dict(rag_config.get("chunking") or {}, strategy="structured")
+    fixed = {"strategy": "fixed", "chunk_size": rag_config.get("chunk_size", 500)}
+    index_config = rag_config.get("index") or {"type": "flat"}
+    report = [
+        benchmark(name, chunking, model, documents_dir, index_config, queries, query_embeddings, args.top_k)
+        for name, chunking in (("fixed", fixed), ("structured", structured))
+    ]
+
+    if args.json:
+        print(json.dumps({"queries": len(queries), "results": report}, indent=2))
+        return
+
+    precision_key = next(key for key in report[0] if key.startswith("precision@"))
+    hit_key = next(key for key in report[0] if key.startswith("hit_rate@"))
+    print(f"📊 {len(queries)} consultas etiquetadas, {precision_key.split('@')[1]} resultados por consulta")
+    print(
+        f"{'estrategia':<12}{'frag':>7}{'tok/frag':>10}{'índice MB':>11}{'JSON MB':>9}{'blob MB':>9}"
+        f"{'lista MB':>10}{'resid. MB':>11}{'precisión':>11}{'aciertos':>10}{'tok ctx':>9}"
+    )
+    for row in report:
+        print(
+            f"{row['strategy']:<12}{row['chunks']:>7}{row['avg_chunk_tokens']:>10.1f}"
+            f"{row['index_bytes'] / 1e6:>11.2f}{row['storage']['json_bytes'] / 1e6:>9.2f}"
+            f"{row['storage']['blob_bytes'] / 1e6:>9.2f}{row['memory']['list_bytes'] / 1e6:>10.2f}"
+            f"{row['memory']['blob_resident_bytes'] / 1e6:>11.3f}{row[precision_key]:>11.3f}"
+            f"{row[hit_key]:>10.3f}{row['avg_context_tokens']:>9.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+_STOP = object()
+
+class ConversationLog:
+    """Log de conversación en JSON lines escrito por un hilo en segundo plano.
+
+    Los turnos solo encolan registros (un dict por mensaje) en una cola
+    acotada; el hilo los escribe por lotes en `chat_<fecha>.jsonl` y vacía
+    el búfer del archivo como mucho cada `flush_interval` segundos. Al
+    cambiar de fecha o superar `max_bytes`, el archivo se cierra y se
+    comprime (`chat_<fecha>.<n>.jsonl.gz`) en lugar de borrarse.
+
+    Con la cola llena se aplica `policy`: `drop_oldest` descarta el registro
+    más antiguo, `drop_new` el que llega y `block` espera hasta
+    `block_timeout` segundos (contrapresión sobre el turno) antes de
+    descartarlo. Los descartes se cuentan en `stats()`.
+    """
+
+    POLICIES = ("drop_oldest", "drop_new", "block")
+
+    def __init__(self, log_dir, max_queue=10000, batch_size=256, flush_interval=0.5, max_bytes=50 * 1024 * 1024,
+                 compress=True, policy="drop_oldest", block_timeout=0.05):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Política de log desconocida: {policy}. Opciones: {', '.join(self.POLICIES)}")
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_date = None
+        self._file_bytes = 0
+
+        self.thread = threading.Thread(target=self._run, daemon=True, name="conversation-log")
+        self.thread.start()
+
+    def log(self, record):
+        """Encola un registro sin bloquear (salvo con la política `block`). Devuelve False si se descartó."""
+        try:
+            if self.policy == "block":
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            if self.policy != "drop_oldest":
+                self._count_drop()
+                return False
+            try:
+                self.queue.get_nowait()
+                self._count_drop()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                self._count_drop()
+                return False
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def _count_drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def _run(self):
+        """Hilo de escritura: agrupa los registros pendientes y los escribe de una vez."""
+        self._compress_stale()
+        last_flush = time.perf_counter()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush()
+                last_flush = time.perf_counter()
+                continue
+
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = any(item is _STOP for item in batch)
+            self._write_batch([item for item in batch if item is not _STOP])
+
+            if stopping:
+                self._close_file()
+                return
+            if time.perf_counter() - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = time.perf_counter()
+
+    def _write_batch(self, batch):
+        for record in batch:
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            date = record.get("ts", "")[:10] or datetime.now().strftime("%Y-%m-%d")
+            if self._file is None or date != self._file_date:
+                self._open(date)
+            elif self.max_bytes and self._file_bytes + len(line) > self.max_bytes:
+                self._rotate()
+                self._open(date)
+            data = line.encode("utf-8")
+            self._file.write(data)
+            self._file_bytes += len(data)
+        with self._lock:
+            self.written += len(batch)
+
+    def _path(self, date):
+        return self.log_dir / f"chat_{date}.jsonl"
+
+    def _open(self, date):
+        """Abre (en modo añadir) el archivo de la fecha; rota el anterior si era de otro día."""
+        if self._file is not None:
+            self._rotate()
+        path = self._path(date)
+        self._file = open(path, "ab", buffering=1024 * 1024)
+        self._file_date = date
+        self._file_bytes = path.stat().st_size
+
+    def _rotate(self):
+        """Cierra el archivo actual y lo archiva con un número de secuencia (comprimido si procede)."""
+        path = self._path(self._file_date)
+        self._close_file()
+        self._archive(path)
+        with self._lock:
+            self.rotations += 1
+
+    def _archive(self, path):
+        sequence = 1
+        while any((path.with_name(f"{path.stem}.{sequence}{suffix}")).exists() for suffix in (".jsonl", ".jsonl.gz")):
+            sequence += 1
+        archived = path.with_name(f"{path.stem}.{sequence}.jsonl")
+        os.replace(path, archived)
+        if self.compress:
+            with open(archived, "rb") as source, gzip.open(f"{archived}.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(archived)
+
+    def _compress_stale(self):
+        """Archiva los logs de días anteriores que quedaron abiertos en una ejecución previa."""
+        today = self._path(datetime.now().strftime("%Y-%m-%d"))
+        for path in self.log_dir.glob("chat_????-??-??.jsonl"):
+            if path != today:
+                try:
+                    self._archive(path)
+                except OSError as e:
+                    print(f"⚠️ No se pudo archivar {path}: {e}")
+
+    def _flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self):
+        """Registros escritos y descartados, profundidad de la cola y rotaciones."""
+        with self._lock:
+            return {
+                "written": self.written,
+                "dropped": self.dropped,
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.max_depth,
+                "rotations": self.rotations,
+                "policy": self.policy
+            }
+
+    def close(self, timeout=5):
+        """Escribe los registros pendientes, cierra el archivo y detiene el hilo."""
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print("⚠️ Cola del log llena al cerrar: se pierden los registros pendientes.")
+            return
+        self.thread.join(timeout)
+        print(f"📝 Log de conversación cerrado: {self.stats()}")
+
+def create_conversation_log(config, log_dir):
+    """Crea el log desde la sección `conversation_log` de config.yaml, o None si está desactivado."""
+    config = config or {}
+    if not config.get("enabled", True):
+        return None
+    return ConversationLog(
+        config.get("dir", log_dir),
+        max_queue=config.get("max_queue", 10000),
+        batch_size=config.get("batch_size", 256),
+        flush_interval=config.get("flush_interval", 0.5),
+        max_bytes=config.get("max_mb", 50) * 1024 * 1024,
+        compress=config.get("compress", True),
+        policy=config.get("policy", "drop_oldest"),
+        block_timeout=config.get("block_timeout_ms", 50) / 1000
+    )
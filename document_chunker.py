@@ -0,0 +1,207 @@
+import re
+
+from src.history_manager import estimate_tokens
+
+class FixedSizeChunker:
+    """Troceado en ventanas fijas de `chunk_size` caracteres, sin solapamiento (estrategia original).
+
+    Recibe el documento página a página (`feed`) y devuelve (texto, página)
+    de cada fragmento, con la página en la que empieza. Las ventanas son las
+    mismas que al trocear el documento completo de una vez.
+    """
+
+    def __init__(self, chunk_size=500):
+        self.chunk_size = chunk_size
+        self._carry = ""
+        self._carry_page = None
+
+    def feed(self, text, page=None):
+        """Añade texto y devuelve los fragmentos completos."""
+        if not self._carry:
+            self._carry_page = page
+        data = self._carry + text
+        carried = len(self._carry)
+        chunks = []
+        position = 0
+        # El último trozo se guarda aunque esté lleno: puede haber más texto en la página siguiente
+        while len(data) - position > self.chunk_size:
+            chunks.append((data[position:position + self.chunk_size], self._carry_page if position < carried else page))
+            position += self.chunk_size
+        if position >= carried:
+            self._carry_page = page
+        self._carry = data[position:]
+        return chunks
+
+    def flush(self):
+        """Devuelve el fragmento pendiente al terminar el documento."""
+        chunks = [(self._carry, self._carry_page)] if self._carry else []
+        self._carry = ""
+        self._carry_page = None
+        return chunks
+
+class StructuredChunker:
+    """Troceado por frases y párrafos con tamaño en tokens y solapamiento.
+
+    Los párrafos (separados por líneas en blanco) se dividen en frases y las
+    tablas (líneas con `|` o tabuladores) en filas; nunca se corta una frase
+    salvo que por sí sola supere `max_tokens`. Las unidades se agrupan hasta
+    `max_tokens`. Si un párrafo nuevo empieza con el fragmento ya por encima
+    de `min_tokens`, se cierra ahí para no mezclar párrafos. Cuando un
+    fragmento se cierra a mitad de párrafo, el siguiente repite las últimas
+    frases hasta `overlap_tokens`, y solo las que caben junto a la frase que
+    provocó el corte. Cada fragmento lleva la página en la que empieza.
+    """
+
+    # Espacio tras un signo de cierre de frase, opcionalmente seguido de comillas o paréntesis
+    SENTENCE_END = re.compile(r"(?:(?<=[.!?…])|(?<=[.!?…][\"'»)]))\s+")
+    PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+    def __init__(self, max_tokens=180, overlap_tokens=30, min_tokens=None, count_tokens=None):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = max_tokens // 2 if min_tokens is None else min_tokens
+        self.count_tokens = count_tokens or estimate_tokens
+        self._buffer = ""  # Texto del párrafo en curso que aún puede continuar
+        self._buffer_page = None
+        self._new_paragraph = True
+        self._units = []  # (texto, tokens, página, separador)
+        self._tokens = 0
+
+    def feed(self, text, page=None):
+        """Añade texto (normalmente una página) y devuelve los fragmentos ya cerrados."""
+        if not self._buffer:
+            self._buffer_page = page
+        elif not self._buffer[-1].isspace():
+            # Las páginas no terminan en espacio: se evita pegar la última palabra con la siguiente
+            self._buffer += "\n"
+        self._buffer += text
+        chunks = []
+        paragraphs = self.PARAGRAPH_BREAK.split(self._buffer)
+        for paragraph in paragraphs[:-1]:
+            chunks.extend(self._add_paragraph(paragraph, self._buffer_page, complete=True))
+            self._buffer_page = page
+        # Del último párrafo se procesan las frases completas; la última puede seguir en la página siguiente
+        self._buffer = paragraphs[-1]
+        if self._buffer.strip():
+            remainder, ready = self._split_ready(self._buffer)
+            if ready:
+                chunks.extend(self._add_paragraph(ready, self._buffer_page, complete=False))
+                self._buffer = remainder
+                self._buffer_page = page
+        return chunks
+
+    def flush(self):
+        """Cierra el documento y devuelve los fragmentos pendientes."""
+        chunks = []
+        if self._buffer.strip():
+            chunks.extend(self._add_paragraph(self._buffer, self._buffer_page, complete=True))
+        self._buffer = ""
+        self._new_paragraph = True
+        if self._units:
+            chunks.append(self._emit(keep_overlap=False))
+        return chunks
+
+    def _split_ready(self, text):
+        """Separa las frases completas de un párrafo abierto del trozo final que aún puede continuar."""
+        if self._is_table(text):
+            cut = text.rfind("\n")
+            return (text[cut + 1:], text[:cut]) if cut > 0 else (text, "")
+        last = None
+        for match in self.SENTENCE_END.finditer(text):
+            last = match
+        if last is None:
+            return text, ""
+        return text[last.end():], text[:last.end()]
+
+    def _is_table(self, paragraph):
+        lines = [line for line in paragraph.splitlines() if line.strip()]
+        if len(lines) < 2:
+            return False
+        tabular = sum(1 for line in lines if "|" in line or "\t" in line)
+        return tabular >= len(lines) / 2
+
+    def _add_paragraph(self, paragraph, page, complete):
+        """Divide un párrafo en unidades (frases o filas de tabla) y las agrupa en fragmentos."""
+        chunks = []
+        if self._is_table(paragraph):
+            units = [line.strip() for line in paragraph.splitlines() if line.strip()]
+            joiner = "\n"
+        else:
+            flat = " ".join(line.strip() for line in paragraph.splitlines() if line.strip())
+            units = [sentence.strip() for sentence in self.SENTENCE_END.split(flat) if sentence.strip()]
+            joiner = " "
+        for unit in units:
+            separator = "\n\n" if self._new_paragraph else joiner
+            chunks.extend(self._add_unit(unit, page, separator))
+            self._new_paragraph = False
+        if complete:
+            self._new_paragraph = True
+        return chunks
+
+    def _add_unit(self, text, page, separator):
+        tokens = self.count_tokens(text)
+        if tokens > self.max_tokens and len(text.split()) > 1:
+            return self._add_long_unit(text, tokens, page, separator)
+
+        chunks = []
+        starts_paragraph = separator == "\n\n"
+        if self._units and self._tokens + tokens > self.max_tokens:
+            chunks.append(self._emit(keep_overlap=not starts_paragraph, room=self.max_tokens - tokens))
+        elif self._units and starts_paragraph and self._tokens >= self.min_tokens:
+            chunks.append(self._emit(keep_overlap=False))
+        self._units.append((text, tokens, page, separator))
+        self._tokens += tokens
+        return chunks
+
+    def _add_long_unit(self, text, tokens, page, separator):
+        """Corta por palabras una frase que no cabe en un fragmento."""
+        words = text.split()
+        per_piece = max(1, int(len(words) * self.max_tokens / tokens))
+        chunks = []
+        for start in range(0, len(words), per_piece):
+            piece = " ".join(words[start:start + per_piece])
+            chunks.extend(self._add_unit(piece, page, separator if start == 0 else " "))
+        return chunks
+
+    def _emit(self, keep_overlap, room=None):
+        """Cierra el fragmento actual; opcionalmente conserva sus últimas frases como solapamiento.
+
+        `room` son los tokens que deja libres la unidad que abre el fragmento
+        siguiente: el solapamiento nunca pasa de ahí.
+        """
+        text = self._units[0][0] + "".join(separator + unit for unit, _, _, separator in self._units[1:])
+        chunk = (text, self._units[0][2])
+
+        kept = []
+        if keep_overlap and self.overlap_tokens:
+            budget = self.overlap_tokens if room is None else min(self.overlap_tokens, room)
+            for unit in reversed(self._units):
+                if unit[1] > budget:
+                    break
+                kept.insert(0, unit)
+                budget -= unit[1]
+        self._units = kept
+        self._tokens = sum(unit[1] for unit in kept)
+        return chunk
+
+def create_chunker_factory(config, count_tokens=None, chunk_size=500):
+    """Devuelve una función que crea un troceador nuevo por documento según `rag.chunking`.
+
+    `strategy: fixed` conserva las ventanas de `chunk_size` caracteres;
+    `structured` (por defecto) trocea por frases y párrafos.
+    """
+    config = config or {}
+    if config.get("strategy", "structured") == "fixed":
+        size = config.get("chunk_size", chunk_size)
+        return lambda: FixedSizeChunker(size)
+    return lambda: StructuredChunker(
+        max_tokens=config.get("max_tokens", 180),
+        overlap_tokens=config.get("overlap_tokens", 30),
+        min_tokens=config.get("min_tokens"),
+        count_tokens=count_tokens
+    )
+
+def chunk_document(create_chunker, text, page=None):
+    """Trocea un texto completo de una vez (sin streaming)."""
+    chunker = create_chunker()
+    return chunker.feed(text, page) + chunker.flush()
@@ -0,0 +1,162 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Hilos compartidos por todas las sesiones para generar los resúmenes en segundo plano
+_SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+SUMMARY_PROMPT = (
+    "Resume en español, en pocas frases, la conversación telefónica entre el cliente y la asistente. "
+    "Conserva datos concretos (nombres, productos, precios, fechas, compromisos) y omite saludos."
+)
+
+def estimate_tokens(text):
+    """Estimación rápida de tokens (~4 caracteres por token) sin depender del tokenizador del modelo."""
+    return len(text) // 4 + 1
+
+class ConversationHistory:
+    """Historial de la conversación con presupuesto de tokens y resumen incremental.
+
+    Se conservan literalmente el prompt de sistema y los últimos
+    `keep_recent_turns` turnos. Solo el turno en curso lleva el contexto RAG;
+    en los anteriores se guarda únicamente la transcripción. Los turnos que
+    salen de la ventana reciente se resumen en segundo plano con `summarize`
+    (que recibe el resumen anterior y los turnos a añadir) y se sustituyen
+    por ese resumen.
+    """
+
+    def __init__(self, system_prompt, max_prompt_tokens=3000, keep_recent_turns=4, summarize=None):
+        self.system_prompt = system_prompt
+        self.max_prompt_tokens = max_prompt_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.summarize = summarize
+        self.turns = []  # {"user": transcripción, "context": mensaje con RAG, "assistant": respuesta}
+        self.summary = ""
+        self._lock = threading.Lock()
+        self._summary_pending = False
+        self._epoch = 0  # Cambia en cada reset() para descartar resúmenes de una conversación anterior
+        self.last_prompt_tokens = 0
+
+    def add_user(self, transcript, rag_prompt):
+        """Añade el mensaje del usuario de un turno nuevo y devuelve el turno.
+
+        El turno devuelto se pasa a `add_assistant`, `discard_pending` y
+        `messages`: un turno cancelado que aún termina en su hilo no debe
+        tocar el turno que ya ha empezado después.
+        """
+        turn = {"user": transcript, "context": rag_prompt, "assistant": None}
+        with self._lock:
+            self.turns.append(turn)
+        return turn
+
+    def add_assistant(self, content, turn=None):
+        """Completa `turn` (por defecto, el último sin respuesta) con la respuesta de la asistente."""
+        with self._lock:
+            if turn is None:
+                turn = next((pending for pending in reversed(self.turns) if pending["assistant"] is None), None)
+            if turn is not None and turn["assistant"] is None:
+                turn["assistant"] = content
+        self._schedule_summary()
+
+    def discard_pending(self, turn=None):
+        """Elimina `turn` (por defecto, el último sin respuesta), por ejemplo al cancelarlo."""
+        with self._lock:
+            if turn is None:
+                turn = next((pending for pending in reversed(self.turns) if pending["assistant"] is None), None)
+            self.turns = [kept for kept in self.turns if kept is not turn]
+
+    def messages(self, current=None):
+        """Mensajes a enviar al LLM respetando el presupuesto de tokens.
+
+        Con `current`, ese turno es el actual y se omiten los añadidos después.
+        """
+        with self._lock:
+            turns = list(self.turns)
+            summary = self.summary
+        if current is not None:
+            position = next((index for index, kept in enumerate(turns) if kept is current), None)
+            if position is not None:
+                turns = turns[:position + 1]
+
+        system = self.system_prompt
+        if summary:
+            system += f"\n\nResumen de la conversación anterior:\n{summary}"
+        head = [{"role": "system", "content": system}]
+
+        # El último turno sin respuesta es el actual y lleva el contexto RAG completo
+        tail = []
+        if turns and turns[-1]["assistant"] is None:
+            tail = [{"role": "user", "content": turns[-1]["context"]}]
+            turns = turns[:-1]
+
+        budget = self.max_prompt_tokens - self._count(head + tail)
+        body = []
+        for turn in reversed(turns):
+            messages = [{"role": "user", "content": f"Transcripción del usuario: {turn['user']}"}]
+            if turn["assistant"] is not None:
+                messages.append({"role": "assistant", "content": turn["assistant"]})
+            cost = self._count(messages)
+            if cost > budget and body:
+                break
+            budget -= cost
+            body = messages + body
+
+        result = head + body + tail
+        self.last_prompt_tokens = self._count(result)
+        return result
+
+    def fingerprint(self, current=None):
+        """Huella de la conversación anterior a `current`: resumen y turnos ya respondidos."""
+        with self._lock:
+            turns = list(self.turns)
+            summary = self.summary
+        position = next((index for index, kept in enumerate(turns) if kept is current), len(turns))
+        parts = [summary] + [
+            f"{turn['user']}\x1f{turn['assistant']}" for turn in turns[:position] if turn["assistant"] is not None
+        ]
+        return hashlib.sha256("\x1e".join(parts).encode("utf-8")).hexdigest()
+
+    def _count(self, messages):
+        return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+    def _schedule_summary(self):
+        """Lanza en segundo plano el resumen de los turnos que salen de la ventana reciente."""
+        if self.summarize is None:
+            return
+        with self._lock:
+            if self._summary_pending:
+                return
+            completed = [turn for turn in self.turns if turn["assistant"] is not None]
+            to_fold = len(completed) - self.keep_recent_turns
+            if to_fold <= 0:
+                return
+            folded = completed[:to_fold]
+            previous = self.summary
+            self._summary_pending = True
+            epoch = self._epoch
+        _SUMMARY_EXECUTOR.submit(self._fold, previous, folded, epoch)
+
+    def _fold(self, previous, folded, epoch):
+        """Incorpora los turnos al resumen y los elimina del historial literal."""
+        try:
+            summary = self.summarize(previous, folded)
+        except Exception as e:
+            print(f"⚠️ No se pudo resumir el historial: {e}")
+            summary = None
+        with self._lock:
+            self._summary_pending = False
+            if epoch != self._epoch:
+                return
+            if summary:
+                self.summary = summary
+                self.turns = [turn for turn in self.turns if not any(turn is done for done in folded)]
+        if summary:
+            print(f"🧾 Historial resumido: {len(folded)} turnos condensados.")
+            self._schedule_summary()
+
+    def reset(self):
+        """Vacía el historial y el resumen."""
+        with self._lock:
+            self.turns = []
+            self.summary = ""
+            self._epoch += 1
@@ -0,0 +1,361 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+
+from src.metrics import LatencyStats
+from src.tracing import TRACER
+
+_EMPTY = object()
+
+class HttpPool:
+    """Pool HTTP/2 compartido por los clientes de Grok (xAI) y ElevenLabs.
+
+    Un único `httpx.Client` mantiene conexiones persistentes (multiplexadas
+    con HTTP/2) hacia cada origen registrado. Para que la primera petición
+    de un turno no pague TCP + TLS:
+
+    - `preconnect()` (al detectar voz) abre o comprueba la conexión de los
+      orígenes que llevan más de `preconnect_idle` segundos sin uso;
+    - un hilo envía una petición HEAD ligera a los orígenes inactivos cada
+      `keepalive_interval` segundos para que el servidor no cierre la conexión.
+
+    Cada petición lleva la extensión `trace` de httpcore, con la que se
+    cuentan las conexiones nuevas y se mide el handshake (TCP + TLS).
+    """
+
+    def __init__(self, http2=True, max_connections=20, max_keepalive=10, keepalive_expiry=120.0, connect_timeout=3.0,
+                 read_timeout=15.0, write_timeout=5.0, pool_timeout=2.0, keepalive_interval=25.0, preconnect_idle=5.0):
+        self.client = httpx.Client(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, write=write_timeout, pool=pool_timeout),
+            event_hooks={"request": [self._on_request]}
+        )
+        self.keepalive_interval = keepalive_interval
+        self.preconnect_idle = preconnect_idle
+        self.origins = {}  # nombre -> origen (esquema://host)
+        self.last_used = {}  # origen -> time.monotonic() de la última petición
+        self.handshake = LatencyStats()
+        self.counts = {"api_requests": 0, "api_connections": 0, "warm_requests": 0, "warm_connections": 0,
+                       "preconnects": 0, "keepalives": 0, "warm_errors": 0}
+        self._warming = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="http-warm")
+        self._stop = threading.Event()
+        self._thread = None
+        if keepalive_interval:
+            self._thread = threading.Thread(target=self._keepalive_loop, daemon=True, name="http-keepalive")
+            self._thread.start()
+
+        TRACER.gauge("http_connection_reuse_ratio", lambda: self.stats()["reuse_ratio"])
+        TRACER.gauge("http_api_requests", lambda: self.counts["api_requests"])
+        TRACER.gauge("http_connections_opened", lambda: self.counts["api_connections"] + self.counts["warm_connections"])
+
+    def register(self, name, base_url, preconnect=True):
+        """Añade un origen al que mantener la conexión caliente (y la abre ya si `preconnect`)."""
+        url = httpx.URL(base_url)
+        origin = f"{url.scheme}://{url.host}"
+        with self._lock:
+            self.origins[name] = origin
+            self.last_used.setdefault(origin, 0.0)
+        if preconnect:
+            self._warm(origin, "preconnects")
+
+    def _on_request(self, request):
+        """Event hook de httpx: cuenta la petición y le añade el trazado de conexión."""
+        warm = request.extensions.get("warm", False)
+        origin = f"{request.url.scheme}://{request.url.host}"
+        with self._lock:
+            self.counts["warm_requests" if warm else "api_requests"] += 1
+            self.last_used[origin] = time.monotonic()
+        started = []
+
+        def trace(event, info):
+            if event == "connection.connect_tcp.started":
+                started.append(time.perf_counter())
+                with self._lock:
+                    self.counts["warm_connections" if warm else "api_connections"] += 1
+            elif started and (
+                event == "connection.start_tls.complete"
+                or (event == "connection.connect_tcp.complete" and request.url.scheme == "http")
+            ):
+                seconds = time.perf_counter() - started[0]
+                self.handshake.record(seconds)
+                TRACER.observe("http.handshake", seconds)
+
+        request.extensions["trace"] = trace
+
+    def preconnect(self):
+        """Calienta en segundo plano las conexiones de los orígenes inactivos (se llama al empezar a hablar)."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [origin for origin in self.origins.values() if now - self.last_used.get(origin, 0.0) >= self.preconnect_idle]
+        for origin in idle:
+            self._warm(origin, "preconnects")
+
+    def _warm(self, origin, kind):
+        with self._lock:
+            if origin in self._warming:
+                return
+            self._warming.add(origin)
+            self.counts[kind] += 1
+        self._executor.submit(self._warm_request, origin)
+
+    def _warm_request(self, origin):
+        """Petición HEAD sin credenciales: basta con establecer (o reutilizar) la conexión."""
+        try:
+            self.client.head(f"{origin}/", extensions={"warm": True})
+        except httpx.HTTPError as e:
+            with self._lock:
+                self.counts["warm_errors"] += 1
+            print(f"⚠️ No se pudo precalentar la conexión con {origin}: {e}")
+        finally:
+            with self._lock:
+                self._warming.discard(origin)
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(self.keepalive_interval / 2):
+            now = time.monotonic()
+            with self._lock:
+                idle = [
+                    origin for origin in self.origins.values()
+                    if now - self.last_used.get(origin, 0.0) >= self.keepalive_interval
+                ]
+            for origin in idle:
+                self._warm(origin, "keepalives")
+
+    def stats(self):
+        """Peticiones, conexiones abiertas, proporción de peticiones que reutilizaron conexión y handshake."""
+        with self._lock:
+            counts = dict(self.counts)
+        requests = counts["api_requests"]
+        reuse = round(1 - min(counts["api_connections"], requests) / requests, 4) if requests else None
+        return dict(counts, reuse_ratio=reuse, handshake=self.handshake.summary())
+
+    def close(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.client.close()
+
+def is_retryable(error):
+    """Errores transitorios: red, timeouts, 408, 429 y 5xx (de httpx o de los SDK de OpenAI y ElevenLabs)."""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return True
+    status = getattr(error, "status_code", None)
+    return status in (408, 429) or (status is not None and status >= 500)
+
+class _ResumedStream:
+    """Respuesta en streaming cuyo primer elemento ya se recibió; `close()` cierra la respuesta original."""
+
+    def __init__(self, source, iterator, first):
+        self.source = source
+        self.iterator = iterator
+        self.first = first
+
+    def __iter__(self):
+        if self.first is not _EMPTY:
+            yield self.first
+        yield from self.iterator
+
+    def close(self):
+        target = self.source if hasattr(self.source, "close") else self.iterator
+        if hasattr(target, "close"):
+            target.close()
+
+class RetryPolicy:
+    """Reintentos con hedging para las peticiones en streaming a Grok y ElevenLabs.
+
+    `run(start)` llama a `start()` (que devuelve un iterable) en un hilo y
+    espera al primer elemento. Si no llega en `hedge_after` segundos se
+    lanza la misma petición en paralelo y gana la primera que responda; la
+    otra se cierra. Los errores transitorios se reintentan con `backoff`
+    hasta `max_attempts` peticiones en total (contando las de hedging).
+    `call()` (peticiones sin streaming) solo reintenta: una respuesta completa
+    no se puede abandonar a medias, así que duplicarla pagaría dos veces.
+    """
+
+    CANCEL_CHECK = 0.05  # Cada cuánto se mira `cancel_event` mientras se espera una respuesta
+
+    def __init__(self, name, max_attempts=2, hedge_after=None, backoff=0.2):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.hedge_after = hedge_after
+        self.backoff = backoff
+        self.counts = {"calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "failures": 0,
+                       "cancelled": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def run(self, start, cancel_event=None, hedge=True):
+        """Devuelve la respuesta (iterable, con `close()`) del primer intento que entregue su primer elemento.
+
+        Si `cancel_event` se activa antes, deja de esperar y devuelve None; las
+        respuestas que lleguen después se cierran. Con `hedge=False` no se
+        lanzan peticiones en paralelo, solo reintentos tras un error.
+        """
+        hedge_after = self.hedge_after if hedge else None
+        self._count("calls")
+        results = queue.Queue()
+        winner = []
+        winner_lock = threading.Lock()
+        attempts = 0
+        hedged = set()
+
+        def attempt(number):
+            try:
+                source = start()
+                iterator = iter(source)
+                try:
+                    first = next(iterator)
+                except StopIteration:
+                    first = _EMPTY
+            except Exception as e:
+                results.put((number, None, e))
+                return
+            with winner_lock:
+                lost = bool(winner)
+                if not lost:
+                    winner.append(number)
+            stream = _ResumedStream(source, iterator, first)
+            if lost:
+                # Otro intento respondió antes: se abandona esta respuesta
+                stream.close()
+                return
+            results.put((number, stream, None))
+
+        hedge_at = None
+
+        def launch():
+            nonlocal attempts, hedge_at
+            attempts += 1
+            self._count("attempts")
+            if hedge_after:
+                hedge_at = time.monotonic() + hedge_after
+            threading.Thread(target=attempt, args=(attempts,), daemon=True, name=f"{self.name}-attempt").start()
+
+        launch()
+        pending = 1
+        last_error = None
+        while True:
+            # Tras un error no transitorio no se lanzan más peticiones: solo se espera a las que ya están en vuelo
+            can_hedge = hedge_after and attempts < self.max_attempts and last_error is None
+            timeout = max(0.0, hedge_at - time.monotonic()) if can_hedge else None
+            if cancel_event is not None:
+                timeout = self.CANCEL_CHECK if timeout is None else min(timeout, self.CANCEL_CHECK)
+            try:
+                number, stream, error = results.get(timeout=timeout)
+            except queue.Empty:
+                if cancel_event is not None and cancel_event.is_set():
+                    self._abandon(results, winner, winner_lock)
+                    return None
+                if can_hedge and time.monotonic() >= hedge_at:
+                    print(f"🪁 {self.name}: sin respuesta en {hedge_after * 1000:.0f} ms, se lanza una petición paralela.")
+                    self._count("hedges")
+                    launch()
+                    hedged.add(attempts)
+                    pending += 1
+                continue
+            pending -= 1
+            if error is None:
+                if number in hedged:
+                    self._count("hedge_wins")
+                return stream
+            if is_retryable(error) and last_error is None and attempts < self.max_attempts:
+                print(f"🔁 {self.name}: error transitorio ({error}); reintento {attempts + 1}/{self.max_attempts}.")
+                self._count("retries")
+                time.sleep(self.backoff * attempts)
+                launch()
+                pending += 1
+                continue
+            if not is_retryable(error):
+                last_error = error
+            if pending == 0:
+                self._count("failures")
+                raise error
+
+    def _abandon(self, results, winner, winner_lock):
+        """Turno cancelado: los intentos en vuelo cierran su respuesta al llegar y se cierran las ya recibidas."""
+        self._count("cancelled")
+        with winner_lock:
+            winner.append(None)
+        while True:
+            try:
+                _, stream, _ = results.get_nowait()
+            except queue.Empty:
+                return
+            if stream is not None:
+                stream.close()
+
+    def call(self, request, cancel_event=None):
+        """Versión sin streaming: reintenta `request()` y devuelve su resultado (None si se canceló)."""
+        stream = self.run(lambda: [request()], cancel_event, hedge=False)
+        return None if stream is None else next(iter(stream))
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+def get_http_pool(config):
+    """Pool compartido por todo el proceso, creado con la sección `http` de config.yaml (None si está desactivado)."""
+    global _shared_pool
+    http_config = config.get("http") or {}
+    if not http_config.get("enabled", True):
+        return None
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = HttpPool(
+                http2=http_config.get("http2", True),
+                max_connections=http_config.get("max_connections", 20),
+                max_keepalive=http_config.get("max_keepalive", 10),
+                keepalive_expiry=http_config.get("keepalive_expiry", 120.0),
+                connect_timeout=http_config.get("connect_timeout", 3.0),
+                read_timeout=http_config.get("read_timeout", 15.0),
+                write_timeout=http_config.get("write_timeout", 5.0),
+                pool_timeout=http_config.get("pool_timeout", 2.0),
+                keepalive_interval=http_config.get("keepalive_interval", 25.0),
+                preconnect_idle=http_config.get("preconnect_idle", 5.0)
+            )
+        return _shared_pool
+
+def preconnect():
+    """Precalienta las conexiones del pool compartido, si existe (al detectar voz)."""
+    if _shared_pool is not None:
+        _shared_pool.preconnect()
+
+def http_stats():
+    """Métricas del pool compartido, o None si no se ha creado."""
+    return _shared_pool.stats() if _shared_pool is not None else None
+
+def close_http_pool():
+    """Cierra el pool compartido."""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is not None:
+            _shared_pool.close()
+            _shared_pool = None
+
+def create_retry_policy(config, name):
+    """Política de reintentos de `http.<name>` (llm o tts), con los valores generales de `http` por defecto."""
+    http_config = config.get("http") or {}
+    section = http_config.get(name) or {}
+    hedge_after_ms = section.get("hedge_after_ms", {"llm": 2000, "tts": 1000}.get(name))
+    return RetryPolicy(
+        name,
+        max_attempts=section.get("max_attempts", http_config.get("max_attempts", 2)),
+        hedge_after=hedge_after_ms / 1000 if hedge_after_ms else None,
+        backoff=section.get("backoff_ms", http_config.get("backoff_ms", 200)) / 1000
+    )
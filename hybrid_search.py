@@ -0,0 +1,228 @@
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+import numpy as np
+
+from src.metrics import LatencyStats
+from src.tracing import TRACER
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Códigos de producto con separadores (AB-123, x.200): también se indexan unidos
+CODE_PATTERN = re.compile(r"\b(?=[\w.\-/]*\d)\w+(?:[\-./]\w+)+\b")
+# Palabras vacías y fórmulas de cortesía (sin tildes): no aportan nada a la búsqueda léxica
+STOPWORDS = frozenset("""
+a al algo ante con como de del el ella ellos en entre era es esa ese eso esta este esto fue ha han hay la las le les
+lo los me mi mis muy mas no nos o os para pero por que se si sin sobre su sus tambien te tengo tiene ti tu un una uno
+unos unas y ya yo hola buenas buenos dias tardes noches gracias vale bueno bien adios oiga oye quiero queria
+""".split())
+
+def fold(text):
+    """Minúsculas y sin tildes."""
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in folded if not unicodedata.combining(char))
+
+def tokenize(text):
+    """Términos de búsqueda de un texto: palabras sin tildes ni palabras vacías, y códigos de producto unidos."""
+    folded = fold(text)
+    terms = [term for term in TOKEN_PATTERN.findall(folded) if term not in STOPWORDS and (len(term) > 1 or term.isdigit())]
+    terms.extend(re.sub(r"[\-./]", "", code) for code in CODE_PATTERN.findall(folded))
+    return terms
+
+class BM25Index:
+    """Índice invertido con puntuación BM25 sobre los fragmentos del RAG.
+
+    Cada término guarda los fragmentos en los que aparece y su peso BM25 ya
+    calculado, así que una consulta solo suma los pesos de sus términos.
+    Complementa a los embeddings en nombres propios y códigos de producto,
+    que MiniLM representa mal.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # término -> (fragmentos int32, pesos float32)
+        self.size = 0
+
+    @classmethod
+    def build(cls, texts, k1=1.5, b=0.75):
+        """Construye el índice a partir de los textos de los fragmentos, en orden."""
+        index = cls(k1, b)
+        postings = defaultdict(list)
+        lengths = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                postings[term].append((position, frequency))
+
+        index.size = len(lengths)
+        lengths = np.asarray(lengths, dtype="float32")
+        average = float(lengths.mean()) if index.size and lengths.mean() else 1.0
+        for term, entries in postings.items():
+            documents = np.fromiter((position for position, _ in entries), dtype="int32", count=len(entries))
+            frequencies = np.fromiter((frequency for _, frequency in entries), dtype="float32", count=len(entries))
+            idf = math.log(1 + (index.size - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = k1 * (1 - b + b * lengths[documents] / average)
+            weights = idf * frequencies * (k1 + 1) / (frequencies + norm)
+            index.postings[term] = (documents, weights.astype("float32"))
+        return index
+
+    def search(self, query, top_k):
+        """Devuelve [(posición, puntuación)] de los `top_k` fragmentos con mayor puntuación (> 0)."""
+        scores = np.zeros(self.size, dtype="float32")
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(position), float(scores[position])) for position in ordered]
+
+def reciprocal_rank_fusion(rankings, k=60, weights=None):
+    """Fusiona listas ordenadas de posiciones con Reciprocal Rank Fusion; devuelve [(posición, puntuación)]."""
+    weights = weights or [1.0] * len(rankings)
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, position in enumerate(ranking):
+            scores[position] += weight / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+class CrossEncoderReranker:
+    """Reordena los candidatos con un cross-encoder pequeño de sentence-transformers."""
+
+    def __init__(self, model_name, batch_size=16):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name)
+        self.batch_size = batch_size
+
+    def score(self, query, texts):
+        """Puntuación de relevancia de cada texto para la consulta."""
+        scores = self.model.predict([(query, text) for text in texts], batch_size=self.batch_size)
+        return [float(score) for score in scores]
+
+def create_reranker(config):
+    """Crea el reranker de `rag.retrieval.reranker`, o None si no hay modelo configurado."""
+    config = config or {}
+    if not config.get("model"):
+        return None
+    return CrossEncoderReranker(config["model"], batch_size=config.get("batch_size", 16))
+
+class HybridSearch:
+    """Búsqueda híbrida: vecinos FAISS + BM25, fusión por rangos, umbral de relevancia y reranker opcional.
+
+    Solo pasan a la fusión los vecinos con distancia L2² <= `max_distance`
+    (con embeddings normalizados, 1.3 equivale a una similitud coseno de
+    0.35) y los resultados léxicos con puntuación >= `min_lexical_score`.
+    Si ninguno pasa, la consulta no recibe contexto: así las frases de
+    cortesía no llenan el prompt con fragmentos irrelevantes. Con
+    `mode: vector` no se usa BM25. Los tiempos de cada etapa se acumulan
+    en `stats()` y se registran como spans.
+    """
+
+    STAGES = ("search", "lexical", "fusion", "rerank")
+
+    def __init__(self, index, chunks, lexical=None, reranker=None, candidates=20, max_distance=1.3,
+                 min_lexical_score=3.0, fusion_k=60, vector_weight=1.0, lexical_weight=1.0, rerank_candidates=10,
+                 min_rerank_score=None):
+        self.index = index
+        self.chunks = chunks
+        self.lexical = lexical
+        self.reranker = reranker
+        self.candidates = candidates
+        self.max_distance = max_distance
+        self.min_lexical_score = min_lexical_score
+        self.fusion_k = fusion_k
+        self.weights = [vector_weight, lexical_weight]
+        self.rerank_candidates = rerank_candidates
+        self.min_rerank_score = min_rerank_score
+
+        self.stages = {name: LatencyStats() for name in self.STAGES}
+        self.queries = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def search(self, queries, query_embeddings, top_k, contexts):
+        """Devuelve, para cada consulta, las posiciones de hasta `top_k` fragmentos relevantes."""
+        depth = top_k if self.lexical is None and self.reranker is None else max(top_k, self.candidates)
+        depth = min(depth, self.index.ntotal)
+        started = time.perf_counter()
+        distances, indices = self.index.search(query_embeddings, depth)
+        self._record("search", time.perf_counter() - started, contexts, batch_size=len(queries))
+
+        results = []
+        for query, row_distances, row_indices, context in zip(queries, distances, indices, contexts):
+            vector = [
+                int(position) for position, distance in zip(row_indices, row_distances)
+                if position >= 0 and (self.max_distance is None or distance <= self.max_distance)
+            ]
+            lexical = []
+            if self.lexical is not None:
+                started = time.perf_counter()
+                lexical = [
+                    position for position, score in self.lexical.search(query, depth)
+                    if score >= self.min_lexical_score
+                ]
+                self._record("lexical", time.perf_counter() - started, [context])
+
+            started = time.perf_counter()
+            ranked = [position for position, _ in reciprocal_rank_fusion([vector, lexical], self.fusion_k, self.weights)]
+            self._record("fusion", time.perf_counter() - started, [context])
+
+            if self.reranker is not None and ranked:
+                started = time.perf_counter()
+                ranked = ranked[:self.rerank_candidates]
+                scores = self.reranker.score(query, [self.chunks[position] for position in ranked])
+                reranked = sorted(zip(ranked, scores), key=lambda item: item[1], reverse=True)
+                ranked = [
+                    position for position, score in reranked
+                    if self.min_rerank_score is None or score >= self.min_rerank_score
+                ]
+                self._record("rerank", time.perf_counter() - started, [context], candidates=len(reranked))
+
+            results.append(ranked[:top_k])
+            with self._lock:
+                self.queries += 1
+                self.skipped += not ranked
+        return results
+
+    def _record(self, stage, seconds, contexts, **attrs):
+        self.stages[stage].record(seconds)
+        for context in contexts:
+            TRACER.record(f"rag.{stage}", seconds, context=context, **attrs)
+
+    def stats(self):
+        """Latencia por etapa y consultas que se quedaron sin contexto por el umbral."""
+        return {
+            "stages": {name: stats.summary() for name, stats in self.stages.items() if stats.count},
+            "queries": self.queries,
+            "skipped_queries": self.skipped
+        }
+
+def create_hybrid_search(config, index, chunks):
+    """Crea la búsqueda desde la sección `rag.retrieval` de config.yaml."""
+    config = config or {}
+    lexical = None
+    if config.get("mode", "hybrid") == "hybrid":
+        started = time.perf_counter()
+        lexical = BM25Index.build(chunks, k1=config.get("bm25_k1", 1.5), b=config.get("bm25_b", 0.75))
+        print(f"🔤 Índice léxico BM25: {len(lexical.postings)} términos en {time.perf_counter() - started:.2f}s")
+    reranker_config = config.get("reranker") or {}
+    return HybridSearch(
+        index,
+        chunks,
+        lexical=lexical,
+        reranker=create_reranker(reranker_config),
+        candidates=config.get("candidates", 20),
+        max_distance=config.get("max_distance", 1.3),
+        min_lexical_score=config.get("min_lexical_score", 3.0),
+        fusion_k=config.get("fusion_k", 60),
+        vector_weight=config.get("vector_weight", 1.0),
+        lexical_weight=config.get("lexical_weight", 1.0),
+        rerank_candidates=reranker_config.get("candidates", 10),
+        min_rerank_score=reranker_config.get("min_score")
+    )
@@ -0,0 +1,155 @@
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import faiss
+import yaml
+
+# Añade la raíz del proyecto al path de Python
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.vector_store import INDEX_TYPES, PersistentVectorStore, build_index, read_index_mapped
+from src.metrics import LatencyStats, current_rss
+
+def load_queries(args, rag_config, embeddings):
+    """Obtiene los vectores de consulta: frases de un archivo o muestras ruidosas del corpus."""
+    if args.queries:
+        from sentence_transformers import SentenceTransformer
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+        model = SentenceTransformer(rag_config.get("embedding_model", "all-MiniLM-L6-v2"))
+        return model.encode(queries, convert_to_numpy=True).astype("float32")
+
+    rng = np.random.default_rng(args.seed)
+    rows = rng.choice(len(embeddings), size=min(args.samples, len(embeddings)), replace=False)
+    sample = np.asarray(embeddings[np.sort(rows)], dtype="float32")
+    # Se añade ruido para que la consulta no coincida exactamente con un fragmento indexado
+    noise = rng.normal(scale=args.noise * float(sample.std()), size=sample.shape).astype("float32")
+    return sample + noise
+
+def benchmark(embeddings, queries, index_config, ground_truth, top_k):
+    """Construye un índice y mide tiempo de construcción, tamaño, latencia y recall@k."""
+    start = time.perf_counter()
+    index = build_index(embeddings, index_config)
+    build_seconds = time.perf_counter() - start
+
+    latency = LatencyStats(window=len(queries))
+    results = np.empty((len(queries), top_k), dtype="int64")
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, indices = index.search(query.reshape(1, -1), top_k)
+        latency.record(time.perf_counter() - start)
+        results[i] = indices[0]
+
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(results, ground_truth))
+    return {
+        "type": index_config["type"],
+        "index_class": type(index).__name__,
+        "build_s": round(build_seconds, 3),
+        "size_bytes": int(faiss.serialize_index(index).nbytes),
+        f"recall@{top_k}": round(hits / (len(queries) * top_k), 4),
+        "latency": latency.summary()
+    }
+
+def check_mapped_load(index_types, dim=384, sizes=(20000, 80000), max_ratio=0.1, graph_ratio=0.25, seed=0):
+    """Comprueba que cargar un índice guardado no copia sus vectores a RAM.
+
+    Para cada tipo se guardan índices sintéticos de tamaños crecientes y se
+    mide cuánto crece la memoria residente al leerlos con `read_index_mapped`.
+    Falla si el crecimiento supera `max_ratio` de lo que ocupan los vectores
+    en float32 (lo que costaría copiarlos); en los HNSW el grafo de vecinos
+    siempre se carga en RAM y el límite es `graph_ratio`.
+    """
+    rng = np.random.default_rng(seed)
+    rows, passed = [], True
+    with tempfile.TemporaryDirectory() as directory:
+        loaded = []  # Se mantienen vivos para que cada medida solo cuente el índice nuevo
+        for index_type in index_types:
+            for count in sizes:
+                embeddings = rng.random((count, dim), dtype="float32")
+                path = Path(directory) / f"{index_type}_{count}.faiss"
+                faiss.write_index(build_index(embeddings, {"type": index_type}), str(path))
+                del embeddings
+                rss_before = current_rss()
+                index, mode = read_index_mapped(path)
+                growth = current_rss() - rss_before
+                loaded.append(index)
+                size = path.stat().st_size
+                vector_bytes = count * dim * 4
+                ok = growth <= (graph_ratio if index_type.startswith("hnsw") else max_ratio) * vector_bytes
+                passed = passed and ok
+                rows.append({"type": index_type, "vectors": count, "mode": mode, "file_bytes": size,
+                             "rss_growth_bytes": growth, "ok": ok})
+    return passed, rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara recall y latencia de los tipos de índice FAISS frente al índice exacto.")
+    parser.add_argument("--config", default=None, help="Ruta a config.yaml")
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--queries", default=None, help="Archivo con una consulta por línea (si no, se muestrea el corpus)")
+    parser.add_argument("--samples", type=int, default=200, help="Consultas muestreadas del corpus")
+    parser.add_argument("--noise", type=float, default=0.1, help="Ruido relativo añadido a las consultas muestreadas")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Imprime el resultado en JSON")
+    parser.add_argument("--check-mmap", action="store_true",
+                        help="Comprueba que la RAM no crece con el tamaño del índice al cargarlo (índices sintéticos)")
+    args = parser.parse_args()
+
+    if args.check_mmap:
+        if current_rss() is None:
+            print("❌ No se puede medir la memoria residente en este sistema.")
+            sys.exit(1)
+        passed, rows = check_mapped_load(args.types, seed=args.seed)
+        if args.json:
+            print(json.dumps({"passed": passed, "results": rows}, indent=2))
+        else:
+            print(f"{'tipo':<10}{'vectores':>10}{'modo':>10}{'MB archivo':>12}{'MB RAM':>9}")
+            for row in rows:
+                print(
+                    f"{row['type']:<10}{row['vectors']:>10}{row['mode']:>10}"
+                    f"{row['file_bytes'] / 1e6:>12.1f}{row['rss_growth_bytes'] / 1e6:>9.1f} {'✅' if row['ok'] else '❌'}"
+                )
+        sys.exit(0 if passed else 1)
+
+    base_path = Path(__file__).parent
+    config_path = args.config or base_path.parent / "config" / "config.yaml"
+    with open(config_path, "r") as f:
+        rag_config = yaml.safe_load(f).get("rag") or {}
+
+    index_dir = Path(rag_config.get("index_dir", base_path / "index"))
+    embeddings_path = index_dir / PersistentVectorStore.EMBEDDINGS_FILE
+    if not embeddings_path.exists():
+        print(f"❌ No existe {embeddings_path}. Arranca el asistente una vez para crear el índice.")
+        sys.exit(1)
+
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    queries = load_queries(args, rag_config, embeddings)
+    top_k = min(args.top_k, len(embeddings))
+
+    baseline = faiss.IndexFlatL2(embeddings.shape[1])
+    baseline.add(np.ascontiguousarray(embeddings, dtype="float32"))
+    _, ground_truth = baseline.search(queries, top_k)
+
+    base_config = dict(rag_config.get("index") or {})
+    report = [benchmark(embeddings, queries, dict(base_config, type=index_type), ground_truth, top_k)
+              for index_type in args.types]
+
+    if args.json:
+        print(json.dumps({"vectors": len(embeddings), "queries": len(queries), "results": report}, indent=2))
+        return
+
+    print(f"📊 {len(embeddings)} vectores, {len(queries)} consultas, top_k={top_k}")
+    print(f"{'tipo':<10}{'clase':<24}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'MB':>9}{'build s':>9}")
+    for row in report:
+        print(
+            f"{row['type']:<10}{row['index_class']:<24}{row[f'recall@{top_k}']:>8.3f}"
+            f"{row['latency']['p50_ms']:>9.3f}{row['latency']['p95_ms']:>9.3f}"
+            f"{row['size_bytes'] / 1e6:>9.2f}{row['build_s']:>9.2f}"
+        )
+
+if __name__ == "__main__":
+    main()
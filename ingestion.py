@@ -0,0 +1,284 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import yaml
+
+# Añade la raíz del proyecto al path de Python
+sys.path.append(str(Path(__file__).parent.parent))
+
+def count_pages(path):
+    """Número de páginas de un documento (los que no son PDF cuentan como una)."""
+    if str(path).endswith(".pdf"):
+        import PyPDF2
+        with open(path, "rb") as f:
+            return len(PyPDF2.PdfReader(f).pages)
+    return 1
+
+def count_pages_or_none(path):
+    """`count_pages` para los procesos del pool: None si el documento no se puede abrir."""
+    try:
+        return count_pages(path)
+    except Exception:
+        return None
+
+def read_document_pages(path, start=None, end=None, raise_errors=False):
+    """Extrae el texto de un documento (PDF, Word, TXT) como lista de páginas.
+
+    En los PDF se puede pedir un rango de páginas [start, end). Se ejecuta en
+    los procesos del pool, así que no depende de ningún objeto del proceso
+    principal. Un documento ilegible devuelve una lista vacía, salvo con
+    `raise_errors`, que propaga el error para no indexarlo a medias.
+    """
+    path = str(path)
+    try:
+        # Importaciones diferidas: solo se cargan si hay documentos de ese tipo
+        if path.endswith(".pdf"):
+            import PyPDF2
+            with open(path, "rb") as f:
+                pages = PyPDF2.PdfReader(f).pages
+                start = start or 0
+                end = len(pages) if end is None else min(end, len(pages))
+                return [pages[number].extract_text() or "" for number in range(start, end)]
+        if path.endswith(".docx"):
+            from docx import Document
+            return ["".join(f"{para.text}\n" for para in Document(path).paragraphs)]
+        if path.endswith(".txt"):
+            with open(path, "r", encoding="utf-8") as f:
+                return [f.read()]
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"⚠️ No se pudo leer {path}: {e}")
+    return []
+
+def read_document(path, raise_errors=False):
+    """Texto completo de un documento."""
+    return "".join(read_document_pages(path, raise_errors=raise_errors))
+
+class IngestionPipeline:
+    """Ingesta en streaming: extracción en un pool de procesos, troceado y embedding por lotes.
+
+    Cada tarea del pool extrae un archivo o un rango de `pages_per_task`
+    páginas de un PDF. Las páginas se consumen en orden y pasan directamente
+    al troceado y, en lotes de `batch_size` fragmentos (de uno o varios
+    archivos), al modelo de embeddings. Cada archivo tiene su propio
+    troceador (`create_chunker`), que recibe las páginas con su número. Como mucho hay `max_pending` tareas
+    en vuelo, así que la memoria no depende del tamaño del corpus: nunca se
+    guarda el texto completo de un documento. Con `workers=0` todo se hace en
+    el proceso actual. Los procesos se crean con `spawn`: el proceso principal
+    ya tiene hilos (y el modelo de embeddings cargado) y hacer `fork` de él
+    puede bloquearse. Las páginas de los PDF también se cuentan en el pool. Si falla la lectura de alguna parte de un archivo, se
+    avisa y el archivo se entrega marcado con el error para no darlo por
+    indexado.
+    """
+
+    def __init__(self, encode, create_chunker, workers=None, pages_per_task=16, batch_size=64, max_pending=None,
+                 progress_interval=2.0):
+        self.encode = encode
+        self.create_chunker = create_chunker
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.pages_per_task = pages_per_task
+        self.batch_size = batch_size
+        self.max_pending = max_pending or max(2, self.workers * 2)
+        self.progress_interval = progress_interval
+        self.last_stats = {}
+
+    def _plan(self, paths, executor, planned):
+        """Genera las tareas (ruta, página inicial, página final, última del archivo) a medida que se piden.
+
+        El número de páginas de todos los PDF se pide al pool de una vez y se
+        espera el de cada archivo solo cuando le toca. `planned` acumula las
+        páginas ya planificadas para el progreso.
+        """
+        counts = {}
+        for path in paths:
+            if str(path).endswith(".pdf"):
+                if executor is not None:
+                    counts[path] = executor.submit(count_pages_or_none, path)
+                else:
+                    counts[path] = Future()
+                    counts[path].set_result(count_pages_or_none(path))
+        for path in paths:
+            pages = counts[path].result() if path in counts else None
+            if not pages:
+                # Sin páginas (o ilegible): una sola tarea, que avisará del error de lectura
+                planned[0] += 1
+                yield (path, None, None, True)
+                continue
+            planned[0] += pages
+            for start in range(0, pages, self.pages_per_task):
+                end = min(start + self.pages_per_task, pages)
+                yield (path, start, end, end == pages)
+
+    def run(self, paths):
+        """Genera, en el orden de `paths`, (fragmentos como (texto, página), embeddings, error) de cada archivo.
+
+        `error` es None si el archivo se leyó entero, o el primer error de lectura.
+        """
+        start_time = time.perf_counter()
+        executor = None
+        if self.workers and (len(paths) > 1 or any(str(path).endswith(".pdf") for path in paths)):
+            executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        planned = [0]  # Páginas planificadas hasta ahora
+        task_iter = self._plan(paths, executor, planned)
+        in_flight = deque()
+
+        def submit_next():
+            task = next(task_iter, None)
+            if task is None:
+                return
+            path, start, end, _ = task
+            if executor is not None:
+                future = executor.submit(read_document_pages, path, start, end, True)
+            else:
+                future = Future()
+                try:
+                    future.set_result(read_document_pages(path, start, end, True))
+                except Exception as e:
+                    future.set_exception(e)
+            in_flight.append((task, future))
+
+        files = deque()  # Archivos en curso: {"chunks", "vectors", "closed", "chunker", "error"}
+        pending = []  # (archivo, texto del fragmento) a la espera de embedding
+        current = None
+        pages_done = 0
+        chunks_done = 0
+        failed_files = 0
+        last_report = start_time
+
+        def encode_batches(force):
+            nonlocal chunks_done
+            while len(pending) >= self.batch_size or (force and pending):
+                batch = pending[:self.batch_size]
+                del pending[:self.batch_size]
+                vectors = self.encode([chunk for _, chunk in batch])
+                for (record, _), vector in zip(batch, vectors):
+                    record["vectors"].append(vector)
+                chunks_done += len(batch)
+
+        try:
+            for _ in range(self.max_pending):
+                submit_next()
+
+            while in_flight:
+                (path, first_page, last_page, last_of_file), future = in_flight.popleft()
+                if current is None:
+                    current = {"chunks": [], "vectors": [], "closed": False, "chunker": self.create_chunker(), "error": None}
+                    files.append(current)
+                try:
+                    pages = future.result()
+                except Exception as e:
+                    span = f" (páginas {first_page + 1}-{last_page})" if first_page is not None else ""
+                    print(f"⚠️ No se pudo leer {path}{span}: {e}. Se reintentará cuando cambie el archivo.")
+                    if current["error"] is None:
+                        current["error"] = f"{type(e).__name__}: {e}"
+                        failed_files += 1
+                    pages = []
+                submit_next()
+
+                pieces = []
+                for offset, page in enumerate(pages):
+                    # Páginas numeradas desde 1 en los PDF; el resto de documentos no tiene páginas
+                    number = first_page + offset + 1 if first_page is not None else None
+                    pieces.extend(current["chunker"].feed(page, number))
+                pages_done += last_page - first_page if first_page is not None else 1
+
+                if last_of_file:
+                    pieces.extend(current["chunker"].flush())
+                for piece in pieces:
+                    current["chunks"].append(piece)
+                    pending.append((current, piece[0]))
+                if last_of_file:
+                    current["closed"] = True
+                    current["chunker"] = None
+                    current = None
+                encode_batches(force=not in_flight)
+
+                # Se entregan los archivos ya completos, en orden
+                while files and files[0]["closed"] and len(files[0]["vectors"]) == len(files[0]["chunks"]):
+                    record = files.popleft()
+                    vectors = np.asarray(record["vectors"], dtype="float32") if record["vectors"] else None
+                    yield record["chunks"], vectors, record["error"]
+
+                now = time.perf_counter()
+                if now - last_report >= self.progress_interval:
+                    last_report = now
+                    self._report(pages_done, planned[0], chunks_done, now - start_time, final=False)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        self._report(pages_done, planned[0], chunks_done, time.perf_counter() - start_time, final=True,
+                     file_count=len(paths), failed_files=failed_files)
+
+    def _report(self, pages, total_pages, chunks, elapsed, final, file_count=None, failed_files=0):
+        pages_per_s = pages / elapsed if elapsed else 0.0
+        chunks_per_s = chunks / elapsed if elapsed else 0.0
+        if final:
+            self.last_stats = {
+                "files": file_count,
+                "failed_files": failed_files,
+                "pages": pages,
+                "chunks": chunks,
+                "seconds": round(elapsed, 3),
+                "pages_per_s": round(pages_per_s, 2),
+                "chunks_per_s": round(chunks_per_s, 2),
+                "workers": self.workers
+            }
+        label = "✅ Ingesta completada" if final else "📥 Ingesta"
+        print(
+            f"{label}: {pages}/{total_pages} páginas, {chunks} fragmentos en {elapsed:.1f}s "
+            f"({pages_per_s:.1f} pág/s, {chunks_per_s:.1f} frag/s)"
+        )
+
+def create_ingestion_pipeline(config, encode, create_chunker):
+    """Crea el pipeline desde la sección `rag.ingestion` de config.yaml."""
+    config = config or {}
+    return IngestionPipeline(
+        encode,
+        create_chunker,
+        workers=config.get("workers"),
+        pages_per_task=config.get("pages_per_task", 16),
+        batch_size=config.get("batch_size", 64),
+        max_pending=config.get("max_pending"),
+        progress_interval=config.get("progress_interval", 2.0)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-ingesta los documentos del RAG sin arrancar el bucle de voz.")
+    parser.add_argument("--config", default=None, help="Ruta a config.yaml")
+    parser.add_argument("--documents", default=None, help="Carpeta de documentos")
+    parser.add_argument("--full", action="store_true", help="Descarta el índice actual y lo reconstruye desde cero")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos de extracción (0 = sin pool)")
+    args = parser.parse_args()
+
+    from src.rag_backend import RAGBackend
+
+    config_path = args.config or Path(__file__).parent.parent / "config" / "config.yaml"
+    if args.full:
+        with open(config_path, "r") as f:
+            rag_config = yaml.safe_load(f).get("rag") or {}
+        index_dir = Path(rag_config.get("index_dir", Path(__file__).parent / "index"))
+        if index_dir.exists():
+            shutil.rmtree(index_dir)
+            print(f"🗑️ Índice {index_dir} eliminado.")
+
+    backend = RAGBackend(config_path, args.documents, ingestion_workers=args.workers)
+    try:
+        print(json.dumps({
+            "sync": backend.vector_store.last_sync_stats,
+            "ingestion": backend.ingestion.last_stats
+        }, indent=2))
+    finally:
+        backend.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,37 @@
-from openai import OpenAI
 import yaml
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
-import PyPDF2
-from docx import Document
-import os
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime
 
+from src.sentence_chunker import SentenceChunker
+from src.answer_cache import create_answer_cache
+from src.history_manager import ConversationHistory, SUMMARY_PROMPT, estimate_tokens
+from src.backends import create_llm_client
+from src.conversation_log import create_conversation_log
+from src.http_pool import create_retry_policy
+from src.tracing import TRACER
+
 class LLMProcessor:
     """Clase para procesar transcripciones usando la API de Grok (xAI) con historial conversacional, RAG y logging."""
 
-    def __init__(self, config_path=None, prompt_path=None, documents_dir=None):
-        """Inicializa el cliente de xAI, el historial, el sistema RAG y el logging."""
+    def __init__(self, config_path=None, prompt_path=None, documents_dir=None, rag_backend=None, session_id=None,
+                 answer_cache=None, llm_client=None, config=None, conversation_log=None, transcript_sink=None):
+        """Inicializa el cliente de xAI, el historial, el sistema RAG y el logging.
+
+        `rag_backend` y `answer_cache` permiten compartir un mismo `RAGBackend`
+        (modelo de embeddings e índice) y una misma caché semántica de
+        respuestas entre varias sesiones; si no se indican se crean propios.
+        `session_id` identifica la llamada en el log. `llm_client` permite
+        compartir el cliente de Grok (o su sustituto local) entre sesiones.
+        `rag_backend` también puede ser un `Future` que se resuelve cuando el
+        RAG termina de arrancar: hasta entonces los turnos van sin contexto.
+        `config` es la configuración ya leída, para no volver a abrir config.yaml.
+        `conversation_log` permite compartir el escritor del log de
+        conversación (un único hilo y archivo para todas las sesiones).
+        `transcript_sink` recibe los mismos mensajes para mostrarlos en directo.
+        """
         # Rutas relativas al archivo llm_processor.py
         base_path = Path(__file__).parent  # Directorio src
         
@@ -24,164 +42,370 @@ class LLMProcessor:
         if documents_dir is None:
             documents_dir = base_path / "documents"
 
-        # Cargar configuración de xAI
-        with open(config_path, "r") as f:
-            config = yaml.safe_load(f)["xai"]
-        
+        # Cargar configuración de xAI y de la caché de respuestas
+        if config is None:
+            with open(config_path, "r") as f:
+                config = yaml.safe_load(f)
+        full_config = config
+        config = full_config["xai"]
+        cache_config = full_config.get("cache") or {}
+        history_config = full_config.get("history") or {}
+
         self.api_key = config["api_key"]
         self.model = config["model"]
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://api.x.ai/v1"
+        self.client = llm_client or create_llm_client(full_config)
+        # Reintentos y hedging de las peticiones a Grok; si todos fallan se dice `fallback_response`
+        self.retry = create_retry_policy(full_config, "llm")
+        self.fallback_response = config.get(
+            "fallback_response", "Disculpe, he tenido un problema técnico. ¿Me lo puede repetir?"
         )
+        # Marcas de tiempo por hilo: cada turno corre en su hilo y un turno cancelado puede solaparse con el siguiente
+        self._marks = threading.local()
 
         # Cargar el prompt desde un archivo externo
         with open(prompt_path, "r") as f:
             prompt_config = yaml.safe_load(f)
             self.system_prompt = prompt_config["system_prompt"]
 
-        # Historial de la conversación
-        self.conversation_history = [{"role": "system", "content": self.system_prompt}]
-
-        # Configurar RAG
-        self.documents = self._load_documents(documents_dir)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.index, self.document_chunks = self._create_vector_store()
-
-        # Configuración del archivo de log
-        self.log_dir = base_path / "logs"  # src/logs
-        self.log_dir.mkdir(exist_ok=True)
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        self.log_file = self.log_dir / f"chat_{current_date}.txt"
-        self._initialize_log()
-
-    def _initialize_log(self):
-        """Inicializa o reinicia el archivo de log según la fecha actual."""
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        new_log_file = self.log_dir / f"chat_{current_date}.txt"
-
-        # Si el archivo actual no coincide con la fecha de hoy
-        if new_log_file != self.log_file and self.log_file.exists():
-            # Eliminar el archivo antiguo
-            os.remove(self.log_file)
-            print(f"🗑️ Archivo de log anterior {self.log_file} eliminado.")
-
-        # Actualizar el archivo de log a usar
-        self.log_file = new_log_file
-
-        # Si el archivo no existe, crearlo e inicializarlo
-        if not self.log_file.exists():
-            with open(self.log_file, "w", encoding="utf-8") as f:
-                f.write(f"Registro de conversación - {current_date}\n")
-                f.write("=" * 50 + "\n")
-            print(f"📝 Nuevo archivo de log creado: {self.log_file}")
+        # Historial de la conversación con presupuesto de tokens y resumen incremental
+        self.history = ConversationHistory(
+            self.system_prompt,
+            max_prompt_tokens=history_config.get("max_prompt_tokens", 3000),
+            keep_recent_turns=history_config.get("keep_recent_turns", 4),
+            summarize=self._summarize_turns if history_config.get("summarize", True) else None
+        )
+
+        # Configurar RAG (compartido entre sesiones o propio)
+        self._owns_rag = rag_backend is None
+        if rag_backend is None:
+            # Importación diferida: arrastra sentence-transformers y FAISS
+            from src.rag_backend import RAGBackend
+            rag_backend = RAGBackend(config_path, documents_dir, config=full_config)
+        if isinstance(rag_backend, Future):
+            self.rag = None
+            rag_backend.add_done_callback(self._attach_rag)
         else:
-            print(f"📝 Continuando con el archivo de log existente: {self.log_file}")
-
-    def _log_message(self, role, content):
-        """Registra un mensaje en el archivo de log con marca de tiempo."""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        with open(self.log_file, "a", encoding="utf-8") as f:
-            f.write(f"[{timestamp}] {role.upper()}: {content}\n")
-
-    def _load_documents(self, documents_dir):
-        """Carga documentos desde una carpeta (PDF, Word, TXT)."""
-        documents = []
-        if not os.path.exists(documents_dir):
-            print(f"⚠️ Carpeta {documents_dir} no encontrada. No se cargaron documentos para RAG.")
-            return documents
-        
-        for filename in os.listdir(documents_dir):
-            filepath = os.path.join(documents_dir, filename)
-            if filename.endswith('.pdf'):
-                with open(filepath, 'rb') as f:
-                    pdf_reader = PyPDF2.PdfReader(f)
-                    text = ""
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() or ""
-                documents.append(text)
-            elif filename.endswith('.docx'):
-                doc = Document(filepath)
-                text = ""
-                for para in doc.paragraphs:
-                    text += para.text + "\n"
-                documents.append(text)
-            elif filename.endswith('.txt'):
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    text = f.read()
-                documents.append(text)
-        print(f"✅ Cargados {len(documents)} documentos desde {documents_dir}")
-        return documents
-
-    def _create_vector_store(self):
-        """Crea un almacén de vectores FAISS con los documentos."""
-        if not self.documents:
-            print("⚠️ No hay documentos para crear el vector store. RAG estará desactivado.")
-            return None, []
-
-        document_chunks = []
-        for doc in self.documents:
-            for i in range(0, len(doc), 500):
-                chunk = doc[i:i+500]
-                document_chunks.append(chunk)
-
-        embeddings = self.embedding_model.encode(document_chunks, convert_to_numpy=True)
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dimension)
-        index.add(embeddings)
-
-        print(f"✅ Vector store creado con {len(document_chunks)} fragmentos")
-        return index, document_chunks
-
-    def _retrieve_relevant_docs(self, query, top_k=3):
-        """Recupera los documentos más relevantes para la consulta."""
-        if self.index is None or not self.document_chunks:
+            self.rag = rag_backend
+        self.session_id = session_id
+
+        # Caché semántica de respuestas (compartida entre sesiones o propia)
+        self._owns_answer_cache = answer_cache is None
+        if answer_cache is None:
+            answer_cache = create_answer_cache(cache_config.get("answers"))
+        self.answer_cache = answer_cache
+
+        # Log de conversación en segundo plano (compartido entre sesiones o propio), en src/logs
+        self._owns_conversation_log = conversation_log is None
+        if conversation_log is None:
+            conversation_log = create_conversation_log(full_config.get("conversation_log"), base_path / "logs")
+        self.conversation_log = conversation_log
+        self.transcript_sink = transcript_sink
+
+    def _log_message(self, role, content, **fields):
+        """Encola un mensaje en el log de conversación y en las vistas de transcripciones.
+
+        No escribe en disco ni en pantalla: de eso se encargan los hilos de
+        `ConversationLog` y de cada `TranscriptSink`.
+        """
+        if self.conversation_log is None and self.transcript_sink is None:
+            return
+        _, turn_id = TRACER.context()
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "session_id": self.session_id,
+            "turn_id": turn_id,
+            "role": role,
+            "content": content
+        }
+        if role != "usuario" and self._turn_started is not None:
+            record["turn_ms"] = round((time.perf_counter() - self._turn_started) * 1000, 1)
+            if self.last_first_token_at is not None:
+                record["first_token_ms"] = round((self.last_first_token_at - self._turn_started) * 1000, 1)
+        record.update((key, value) for key, value in fields.items() if value is not None)
+        if self.conversation_log is not None:
+            self.conversation_log.log(record)
+        if self.transcript_sink is not None:
+            self.transcript_sink.publish(record)
+
+    def _attach_rag(self, future):
+        """Incorpora el RAG cuando termina de arrancar en segundo plano."""
+        if future.cancelled() or future.exception() is not None:
+            print("⚠️ El RAG no pudo arrancar. Se seguirá sin contexto de documentos.")
+            return
+        self.rag = future.result()
+        print("📚 RAG incorporado a la conversación.")
+
+    def _retrieve_relevant_docs(self, query, top_k=None):
+        """Recupera los documentos relevantes para la consulta junto al embedding de la consulta.
+
+        Puede devolver menos de `top_k` documentos, o ninguno, si no superan
+        el umbral de relevancia de `rag.retrieval`.
+        """
+        if self.rag is None:
+            print("⏳ El RAG aún está arrancando. Procesando sin RAG.")
+            return [], None
+        if self.rag.index is None or not self.rag.document_chunks:
             print("⚠️ No hay vector store disponible. Procesando sin RAG.")
-            return []
-        
-        query_embedding = self.embedding_model.encode([query], convert_to_numpy=True)
-        distances, indices = self.index.search(query_embedding, top_k)
-        relevant_docs = [self.document_chunks[i] for i in indices[0]]
+            return [], None
+
+        with TRACER.span("rag.retrieve") as attrs:
+            relevant_docs, embedding = self.rag.retrieve(query, top_k, return_embedding=True)
+            attrs["documents"] = len(relevant_docs)
         print(f"🔍 Documentos relevantes recuperados: {len(relevant_docs)}")
-        return relevant_docs
+        return relevant_docs, embedding
+
+    def _build_rag_prompt(self, transcript):
+        """Construye el mensaje del usuario con el contexto RAG; devuelve (prompt, documentos, embedding).
+
+        Sin documentos relevantes (por ejemplo, en frases de cortesía) el
+        mensaje lleva solo la transcripción.
+        """
+        relevant_docs, embedding = self._retrieve_relevant_docs(transcript)
+        if relevant_docs:
+            context = "\n".join(relevant_docs)
+            rag_prompt = f"Contexto adicional:\n{context}\n\nTranscripción del usuario: {transcript}"
+            self.rag.record_context(estimate_tokens(context))
+        else:
+            rag_prompt = f"Transcripción del usuario: {transcript}"
+            if self.rag is not None:
+                self.rag.record_context(0)
+        return rag_prompt, relevant_docs, embedding
+
+    @property
+    def conversation_history(self):
+        """Mensajes que se enviarían a Grok ahora mismo (sistema, resumen y turnos recientes)."""
+        return self.history.messages()
 
-    def process(self, transcript):
-        """Envía la transcripción a Grok con historial y documentos RAG, y devuelve la respuesta."""
+    @property
+    def last_first_token_at(self):
+        """perf_counter del primer token del último turno procesado en el hilo que pregunta."""
+        return getattr(self._marks, "first_token_at", None)
+
+    @last_first_token_at.setter
+    def last_first_token_at(self, value):
+        self._marks.first_token_at = value
+
+    @property
+    def _turn_started(self):
+        """perf_counter del inicio del turno en curso en este hilo."""
+        return getattr(self._marks, "turn_started", None)
+
+    @_turn_started.setter
+    def _turn_started(self, value):
+        self._marks.turn_started = value
+
+    def _prompt_messages(self, turn=None):
+        """Construye el prompt dentro del presupuesto de tokens y registra su tamaño."""
+        messages = self.history.messages(turn)
+        print(f"🧮 Tokens de prompt (estimados): {self.history.last_prompt_tokens} en {len(messages)} mensajes")
+        return messages
+
+    def _summarize_turns(self, previous_summary, turns):
+        """Pide a Grok que añada los turnos indicados al resumen de la conversación."""
+        dialogue = "\n".join(
+            f"Cliente: {turn['user']}\nAsistente: {turn['assistant']}" for turn in turns
+        )
+        content = f"Resumen previo:\n{previous_summary or '(vacío)'}\n\nNuevos turnos:\n{dialogue}"
+        response = self.retry.call(lambda: self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": content}
+            ],
+            max_tokens=200,
+            temperature=0.0
+        ))
+        return response.choices[0].message.content
+
+    def _conversation_key(self, turn):
+        """Huella de la conversación previa al turno, para no reutilizar respuestas de otra conversación."""
+        return self.history.fingerprint(turn) if self.answer_cache is not None else ""
+
+    def _cached_answer(self, transcript, relevant_docs, embedding, conversation):
+        """Busca una respuesta reutilizable en la caché semántica."""
+        if self.answer_cache is None or embedding is None or not self.answer_cache.accepts(transcript):
+            return None
+        answer = self.answer_cache.lookup(embedding, relevant_docs, conversation)
+        if answer is not None:
+            print("♻️ Respuesta reutilizada de la caché semántica.")
+        return answer
+
+    def _store_answer(self, transcript, relevant_docs, embedding, answer, conversation):
+        """Guarda una respuesta correcta de Grok en la caché semántica."""
+        if self.answer_cache is None or embedding is None or not self.answer_cache.accepts(transcript):
+            return
+        self.answer_cache.store(transcript, embedding, relevant_docs, answer, conversation)
+
+    def process(self, transcript, cancel_event=None):
+        """Envía la transcripción a Grok con historial y documentos RAG, y devuelve la respuesta.
+
+        Devuelve None si `cancel_event` se activa antes de recibir la respuesta.
+        """
+        self.last_first_token_at = None
+        self._turn_started = time.perf_counter()
         # Registrar la transcripción del usuario
         self._log_message("usuario", transcript)
 
-        # Recuperar documentos relevantes
-        relevant_docs = self._retrieve_relevant_docs(transcript)
-        context = "\n".join(relevant_docs) if relevant_docs else "No hay contexto adicional disponible."
-        
         # Crear prompt con contexto RAG
-        rag_prompt = f"Contexto adicional:\n{context}\n\nTranscripción del usuario: {transcript}"
-        self.conversation_history.append({"role": "user", "content": rag_prompt})
+        rag_prompt, relevant_docs, embedding = self._build_rag_prompt(transcript)
+        turn = self.history.add_user(transcript, rag_prompt)
+        conversation = self._conversation_key(turn)
+
+        cached = self._cached_answer(transcript, relevant_docs, embedding, conversation)
+        if cached is not None:
+            self.last_first_token_at = time.perf_counter()
+            self.history.add_assistant(cached, turn)
+            self._log_message("eva", cached, status="cached", rag_documents=len(relevant_docs))
+            return cached
 
         try:
-            response = self.client.chat.completions.create(
+            messages = self._prompt_messages(turn)
+            request_started = time.perf_counter()
+            response = self.retry.call(lambda: self.client.chat.completions.create(
                 model=self.model,
-                messages=self.conversation_history,
+                messages=messages,
                 max_tokens=200,
                 temperature=0.2
-            )
+            ), cancel_event)
+            if response is None:
+                # Cancelado mientras se esperaba a Grok
+                self.history.discard_pending(turn)
+                self._log_message("eva", "", status="cancelled")
+                return None
+            usage = getattr(response, "usage", None)
+            if usage is not None and usage.prompt_tokens:
+                print(f"🧮 Tokens de prompt reales: {usage.prompt_tokens}")
             assistant_response = response.choices[0].message.content
-            self.conversation_history.append({"role": "assistant", "content": assistant_response})
+            self.last_first_token_at = time.perf_counter()
+            TRACER.record("llm.complete", self.last_first_token_at - request_started, stream=False)
+            if cancel_event is not None and cancel_event.is_set():
+                # El turno se canceló mientras Grok respondía: la respuesta no se usa
+                self.history.discard_pending(turn)
+                self._log_message("eva", "", status="cancelled")
+                return None
+            self.history.add_assistant(assistant_response, turn)
             # Registrar la respuesta de la IA
-            self._log_message("eva", assistant_response)
+            self._log_message("eva", assistant_response, status="completed", rag_documents=len(relevant_docs))
+            self._store_answer(transcript, relevant_docs, embedding, assistant_response, conversation)
             return assistant_response
         except Exception as e:
-            error_msg = f"Error al procesar con Grok: {str(e)}"
-            self.conversation_history.append({"role": "assistant", "content": error_msg})
-            # Registrar el error
-            self._log_message("eva", error_msg)
-            return error_msg
+            # Se agotaron los reintentos: al usuario se le dice la respuesta de respaldo, no el error
+            print(f"❌ Error al procesar con Grok: {e}")
+            self.history.add_assistant(self.fallback_response, turn)
+            self._log_message("eva", self.fallback_response, status="error", error=str(e))
+            return self.fallback_response
+
+    def process_stream(self, transcript, cancel_event=None):
+        """Envía la transcripción a Grok en modo streaming y devuelve la respuesta frase a frase.
+
+        Es un generador: cada frase se entrega en cuanto está completa para que
+        el TTS pueda empezar a sintetizarla. La respuesta completa se guarda en
+        el historial y en el log al terminar. Si el turno se cancela
+        (`cancel_event`), el generador se cierra antes de tiempo o Grok falla a
+        mitad de respuesta, solo se guardan las frases ya entregadas al TTS:
+        una frase cuenta como entregada cuando el consumidor pide la
+        siguiente. Si no se entregó ninguna, el turno se descarta del
+        historial (o, con un error, se guarda la respuesta de respaldo que se
+        dice en su lugar).
+        """
+        self.last_first_token_at = None
+        self._turn_started = time.perf_counter()
+        self._log_message("usuario", transcript)
+        rag_prompt, relevant_docs, embedding = self._build_rag_prompt(transcript)
+        turn = self.history.add_user(transcript, rag_prompt)
+        conversation = self._conversation_key(turn)
+
+        chunker = SentenceChunker()
+        parts = []
+        delivered = []
+        completed = False
+        status = "completed"
+        error = None
+        try:
+            cached = self._cached_answer(transcript, relevant_docs, embedding, conversation)
+            if cached is not None:
+                self.last_first_token_at = time.perf_counter()
+                status = "cached"
+                parts.append(cached)
+                for sentence in chunker.feed(cached) + [chunker.flush()]:
+                    if sentence:
+                        yield sentence
+                        delivered.append(sentence)
+                completed = True
+                return
+
+            try:
+                request_started = time.perf_counter()
+                messages = self._prompt_messages(turn)
+                stream = self.retry.run(lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=200,
+                    temperature=0.2,
+                    stream=True
+                ), cancel_event)
+                if stream is None:
+                    # Cancelado mientras se esperaba el primer token
+                    return
+                for event in stream:
+                    if cancel_event is not None and cancel_event.is_set():
+                        # Corta la conexión para que Grok deje de generar
+                        stream.close()
+                        return
+                    if not event.choices:
+                        continue
+                    delta = event.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if self.last_first_token_at is None:
+                        self.last_first_token_at = time.perf_counter()
+                        TRACER.record("llm.first_token", self.last_first_token_at - request_started)
+                    parts.append(delta)
+                    for sentence in chunker.feed(delta):
+                        yield sentence
+                        # El consumidor volvió a pedir texto: la frase anterior ya pasó al TTS
+                        delivered.append(sentence)
+                tail = chunker.flush()
+                if tail:
+                    yield tail
+                    delivered.append(tail)
+                completed = True
+                TRACER.record("llm.complete", time.perf_counter() - request_started, stream=True, deltas=len(parts))
+                self._store_answer(transcript, relevant_docs, embedding, "".join(parts), conversation)
+            except Exception as e:
+                print(f"❌ Error al procesar con Grok: {e}")
+                completed = True
+                status = "error"
+                error = str(e)
+                if not delivered:
+                    # Nada dicho todavía: se habla la respuesta de respaldo (si ya se habló parte, se deja así)
+                    yield self.fallback_response
+                    delivered.append(self.fallback_response)
+        finally:
+            if completed and status != "error":
+                assistant_response = "".join(parts)
+                self.history.add_assistant(assistant_response, turn)
+                self._log_message("eva", assistant_response, status=status, rag_documents=len(relevant_docs), error=error)
+            elif delivered:
+                # Turno interrumpido o fallido: el historial refleja solo lo que se llegó a decir, no los
+                # fragmentos que quedaron en el troceador sin llegar al TTS
+                assistant_response = " ".join(delivered)
+                self.history.add_assistant(assistant_response, turn)
+                self._log_message("eva", assistant_response, status=status if completed else "interrupted",
+                                  rag_documents=len(relevant_docs), error=error)
+            else:
+                self.history.discard_pending(turn)
+                self._log_message("eva", "", status="cancelled")
 
     def reset_conversation(self):
-        """Reinicia el historial de la conversación y verifica si hay que reiniciar el log."""
-        self.conversation_history = [{"role": "system", "content": self.system_prompt}]
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        new_log_file = self.log_dir / f"chat_{current_date}.txt"
-        if new_log_file != self.log_file:
-            self.log_file = new_log_file
-            self._initialize_log()
+        """Reinicia el historial de la conversación (el log rota solo al cambiar de día)."""
+        self.history.reset()
+
+    def close(self):
+        """Persiste la caché de respuestas y libera el RAG y el log si son propios de este procesador."""
+        if self._owns_answer_cache and self.answer_cache is not None:
+            self.answer_cache.save()
+        if self._owns_conversation_log and self.conversation_log is not None:
+            self.conversation_log.close()
+        if self._owns_rag:
+            self.rag.close()
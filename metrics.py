@@ -0,0 +1,56 @@
+import os
+import threading
+from collections import deque
+
+def current_rss():
+    """Memoria residente del proceso en bytes (solo Linux), o None si no está disponible."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class LatencyStats:
+    """Acumula latencias recientes (en segundos) y calcula percentiles sobre una ventana acotada."""
+
+    def __init__(self, window=1000):
+        """Guarda como máximo `window` muestras; el contador total no se limita."""
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """Registra una nueva muestra de latencia."""
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, p):
+        """Devuelve el percentil `p` (0-100) de la ventana, o None si no hay muestras."""
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        rank = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+        return ordered[rank]
+
+    def summary(self):
+        """Resumen en milisegundos listo para imprimir o exportar como JSON."""
+        def to_ms(value):
+            return None if value is None else round(value * 1000, 2)
+
+        with self._lock:
+            count = self.count
+            mean = self.total / count if count else None
+            maximum = max(self.samples) if self.samples else None
+        return {
+            "count": count,
+            "mean_ms": to_ms(mean),
+            "p50_ms": to_ms(self.percentile(50)),
+            "p95_ms": to_ms(self.percentile(95)),
+            "p99_ms": to_ms(self.percentile(99)),
+            "max_ms": to_ms(maximum)
+        }
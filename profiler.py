@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+class SamplingProfiler:
+    """Perfilador por muestreo que se puede activar y desactivar en caliente.
+
+    Un hilo toma cada `interval` segundos la pila de todos los hilos del
+    proceso (`sys._current_frames`) y cuenta las pilas iguales. No
+    instrumenta el código, así que su coste es bajo y se puede usar durante
+    llamadas reales. Las pilas se pueden exportar en formato "collapsed"
+    para generar un flamegraph.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        """Empieza a muestrear (sin efecto si ya está en marcha)."""
+        if self.running:
+            return False
+        if interval:
+            self.interval = interval
+        self._stop.clear()
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+        self._thread.start()
+        print(f"🔬 Perfilador activado (cada {self.interval * 1000:.1f} ms).")
+        return True
+
+    def stop(self):
+        """Detiene el muestreo conservando las muestras tomadas."""
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join(timeout=1)
+        self.elapsed += time.perf_counter() - self.started_at
+        print(f"🔬 Perfilador detenido: {self.samples} muestras.")
+        return True
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.elapsed = 0.0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    self.stacks[self._collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+                self.samples += 1
+
+    def _collapse(self, thread_name, frame):
+        """Pila como "hilo;función_raíz;...;función_hoja"."""
+        parts = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        parts.append(thread_name)
+        return ";".join(reversed(parts))
+
+    def top(self, limit=20):
+        """Funciones con más muestras: propias (en la hoja) y acumuladas (en cualquier punto de la pila)."""
+        own = Counter()
+        total = Counter()
+        with self._lock:
+            stacks = list(self.stacks.items())
+        for stack, count in stacks:
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        samples = sum(count for _, count in stacks) or 1
+        return [
+            {
+                "function": name,
+                "own_pct": round(100 * own[name] / samples, 2),
+                "total_pct": round(100 * total[name] / samples, 2)
+            }
+            for name, _ in own.most_common(limit)
+        ]
+
+    def collapsed(self):
+        """Pilas en formato "collapsed" (una por línea con su número de muestras) para flamegraph.pl o speedscope."""
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def report(self, limit=20):
+        """Resumen legible de las funciones más costosas."""
+        lines = [f"Muestras: {self.samples} (intervalo {self.interval * 1000:.1f} ms, activo: {self.running})"]
+        for entry in self.top(limit):
+            lines.append(f"{entry['own_pct']:6.2f}% propio {entry['total_pct']:6.2f}% total  {entry['function']}")
+        return "\n".join(lines)
@@ -0,0 +1,187 @@
+import yaml
+from pathlib import Path
+import os
+import threading
+import time
+
+from src.vector_store import PersistentVectorStore
+from src.retrieval_service import BatchedRetriever
+from src.ingestion import create_ingestion_pipeline, read_document
+from src.document_chunker import create_chunker_factory
+from src.hybrid_search import create_hybrid_search
+from src.history_manager import estimate_tokens
+from src.tracing import TRACER
+
+class RAGBackend:
+    """Modelo de embeddings e índice FAISS del RAG, compartibles en solo lectura entre sesiones."""
+
+    def __init__(self, config_path=None, documents_dir=None, ingestion_workers=None, config=None):
+        """Carga el modelo de embeddings y sincroniza el índice persistente con los documentos.
+
+        `ingestion_workers` sustituye a `rag.ingestion.workers` (0 = ingesta sin pool de procesos).
+        `config` es la configuración ya leída, para no volver a abrir config.yaml.
+        """
+        # Importación diferida: sentence-transformers (y torch) tardan varios segundos en cargar
+        from sentence_transformers import SentenceTransformer
+
+        base_path = Path(__file__).parent  # Directorio src
+
+        if config_path is None:
+            config_path = base_path.parent / "config" / "config.yaml"
+        if documents_dir is None:
+            documents_dir = base_path / "documents"
+
+        if config is None:
+            with open(config_path, "r") as f:
+                config = yaml.safe_load(f)
+        rag_config = config.get("rag") or {}
+
+        self.embedding_model_name = rag_config.get("embedding_model", "all-MiniLM-L6-v2")
+        self.chunk_size = rag_config.get("chunk_size", 500)
+        self.top_k = rag_config.get("top_k", 3)
+        self.embedding_model = SentenceTransformer(self.embedding_model_name)
+        # `tokenizer: model` mide los fragmentos con el tokenizador del modelo de embeddings
+        self.chunking_config = dict(rag_config.get("chunking") or {})
+        self.chunking_config.setdefault("strategy", "structured")
+        self.chunking_config.setdefault("tokenizer", "model")
+        if self.chunking_config["strategy"] == "fixed":
+            self.chunking_config.setdefault("chunk_size", self.chunk_size)
+        count_tokens = self._count_tokens if self.chunking_config["tokenizer"] == "model" else estimate_tokens
+        self.create_chunker = create_chunker_factory(self.chunking_config, count_tokens, self.chunk_size)
+        self.index_dir = Path(rag_config.get("index_dir", base_path / "index"))
+        self.index_config = rag_config.get("index") or {"type": "flat"}
+        ingestion_config = dict(rag_config.get("ingestion") or {})
+        if ingestion_workers is not None:
+            ingestion_config["workers"] = ingestion_workers
+        self.ingestion = create_ingestion_pipeline(ingestion_config, self._encode_chunks, self.create_chunker)
+        self.index, self.document_chunks = self._create_vector_store(documents_dir)
+        self.search = None
+        if self.index is not None:
+            self.search = create_hybrid_search(rag_config.get("retrieval"), self.index, self.document_chunks)
+
+        # Tokens de contexto RAG añadidos a cada turno
+        self.context_turns = 0
+        self.context_skipped = 0
+        self.context_tokens = 0
+        self._context_lock = threading.Lock()
+
+        # Las consultas concurrentes de varias sesiones se agrupan en lotes
+        batching_config = rag_config.get("batching") or {}
+        self.retriever = None
+        if batching_config.get("enabled", True):
+            self.retriever = BatchedRetriever(
+                self,
+                window_ms=batching_config.get("window_ms", 3),
+                max_batch=batching_config.get("max_batch", 32)
+            )
+
+    def _read_document(self, filepath):
+        """Extrae el texto de un documento (PDF, Word, TXT); un error de lectura se propaga al vector store."""
+        return read_document(filepath, raise_errors=True)
+
+    def warm_up(self):
+        """Inferencia de prueba para cargar los pesos y los datos del índice antes de la primera consulta real."""
+        embedding = self.embedding_model.encode(["Hola, ¿me puede ayudar con mi tarifa?"], convert_to_numpy=True)
+        if self.search is None:
+            return
+        self.index.search(embedding, min(self.top_k, self.index.ntotal))
+        if self.search.lexical is not None:
+            self.search.lexical.search("tarifa", 1)
+        if self.search.reranker is not None:
+            self.search.reranker.score("tarifa", [self.document_chunks[0]])
+
+    def _count_tokens(self, text):
+        """Tokens de un texto según el tokenizador del modelo de embeddings."""
+        return len(self.embedding_model.tokenizer.tokenize(text))
+
+    def _encode_chunks(self, chunks):
+        """Codifica una lista de fragmentos con el modelo de embeddings."""
+        return self.embedding_model.encode(chunks, convert_to_numpy=True)
+
+    def _create_vector_store(self, documents_dir):
+        """Carga o actualiza el vector store FAISS persistente con los documentos."""
+        if not os.path.exists(documents_dir):
+            print(f"⚠️ Carpeta {documents_dir} no encontrada. No se cargaron documentos para RAG.")
+
+        self.vector_store = PersistentVectorStore(
+            self.index_dir,
+            encode=self._encode_chunks,
+            load_document=self._read_document,
+            create_chunker=self.create_chunker,
+            # Cambiar el troceado o el formato de los fragmentos obliga a reconstruir el índice
+            settings={
+                "embedding_model": self.embedding_model_name,
+                "chunking": self.chunking_config,
+                "chunk_storage": "blob"
+            },
+            index_config=self.index_config,
+            ingest=self.ingestion
+        )
+        index, document_chunks = self.vector_store.sync(documents_dir)
+
+        if index is None:
+            print("⚠️ No hay documentos para crear el vector store. RAG estará desactivado.")
+            return None, document_chunks
+
+        print(f"✅ Vector store listo con {len(document_chunks)} fragmentos")
+        return index, document_chunks
+
+    def retrieve(self, query, top_k=None, return_embedding=False):
+        """Recupera los fragmentos más relevantes para una consulta (por lotes si está activado).
+
+        Con `return_embedding=True` devuelve también el embedding de la
+        consulta, para reutilizarlo sin volver a codificarla.
+        """
+        if self.retriever is not None and self.index is not None:
+            documents, embedding = self.retriever.retrieve(query, top_k)
+        else:
+            documents, embedding = self.retrieve_batch([query], top_k, return_embeddings=True)[0]
+        return (documents, embedding) if return_embedding else documents
+
+    def retrieve_batch(self, queries, top_k=None, return_embeddings=False, contexts=None):
+        """Recupera los fragmentos de varias consultas con un solo encode y una sola búsqueda FAISS.
+
+        `contexts` son los (session_id, turn_id) de cada consulta para
+        atribuirles los spans del lote; por defecto, el contexto del hilo actual.
+        """
+        if self.index is None or not self.document_chunks:
+            empty = [[] for _ in queries]
+            return [(documents, None) for documents in empty] if return_embeddings else empty
+
+        top_k = top_k or self.top_k
+        contexts = contexts or [TRACER.context()] * len(queries)
+        started = time.perf_counter()
+        query_embeddings = self.embedding_model.encode(list(queries), convert_to_numpy=True)
+        encoded = time.perf_counter()
+        for context in contexts:
+            TRACER.record("rag.encode", encoded - started, context=context, batch_size=len(queries))
+        positions = self.search.search(list(queries), query_embeddings, top_k, contexts)
+        results = [[self.document_chunks[i] for i in row] for row in positions]
+        if return_embeddings:
+            return list(zip(results, query_embeddings))
+        return results
+
+    def record_context(self, tokens):
+        """Registra los tokens de contexto RAG que se añadieron al prompt de un turno (0 si se omitió)."""
+        with self._context_lock:
+            self.context_turns += 1
+            self.context_tokens += tokens
+            self.context_skipped += not tokens
+
+    def stats(self):
+        """Métricas de la recuperación por lotes, de cada etapa de búsqueda y del contexto añadido por turno."""
+        stats = self.retriever.stats() if self.retriever else {}
+        if self.search is not None:
+            stats["search"] = self.search.stats()
+        with self._context_lock:
+            stats["context"] = {
+                "turns": self.context_turns,
+                "turns_without_context": self.context_skipped,
+                "avg_tokens_per_turn": round(self.context_tokens / self.context_turns, 1) if self.context_turns else None
+            }
+        return stats
+
+    def close(self):
+        """Detiene el hilo de recuperación por lotes."""
+        if self.retriever:
+            self.retriever.close()
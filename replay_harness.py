@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import json
+import queue
+import sys
+import threading
+import time
+import wave
+from pathlib import Path
+
+# Añade la raíz del proyecto al path de Python
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.session_manager import SessionManager
+from src.startup import load_config
+from src.vad import check_vad
+from src.metrics import LatencyStats
+from src.tracing import TRACER
+
+class ReplayHarness:
+    """Reproduce llamadas grabadas (WAV) a través del pipeline completo y mide sus latencias.
+
+    Cada WAV (PCM 16 bits mono a la frecuencia de `audio.rate`) se envía a
+    una sesión de `SessionManager` en tramas de `frame_ms`, a tiempo real o
+    `speed` veces más rápido (0 = sin esperas), con hasta `concurrency`
+    llamadas a la vez. Si junto al WAV hay un .txt, sus líneas son las
+    transcripciones que devuelve el sustituto local de Deepgram en cada
+    locución. El audio de respuesta se consume y se descarta.
+    """
+
+    def __init__(self, manager, speed=1.0, concurrency=1, frame_ms=20, tail_silence=2.0, settle_timeout=30.0):
+        self.manager = manager
+        self.speed = speed
+        self.concurrency = concurrency
+        self.frame_ms = frame_ms
+        self.tail_silence = tail_silence
+        self.settle_timeout = settle_timeout
+
+        self.metrics = {
+            "transcript_to_first_token": LatencyStats(window=100000),
+            "first_token_to_first_audio": LatencyStats(window=100000),
+            "end_to_end": LatencyStats(window=100000),
+            "turn_total": LatencyStats(window=100000)
+        }
+        self.calls = 0
+        self.turns = 0
+        self.turns_cancelled = 0
+        self.errors = 0
+
+    def _record_turn(self, turn):
+        """Registra las latencias de un turno completado."""
+        self.turns += 1
+        if turn.first_token_at is not None:
+            self.metrics["transcript_to_first_token"].record(turn.first_token_at - turn.started_at)
+        if turn.first_token_at is not None and turn.first_audio_at is not None:
+            self.metrics["first_token_to_first_audio"].record(turn.first_audio_at - turn.first_token_at)
+        if turn.first_audio_at is not None:
+            # De extremo a extremo: desde que el usuario deja de hablar hasta que oye la respuesta
+            self.metrics["end_to_end"].record(turn.first_audio_at - (turn.speech_ended_at or turn.started_at))
+        if turn.completed_at is not None:
+            self.metrics["turn_total"].record(turn.completed_at - turn.started_at)
+
+    def _read_wav(self, wav_path):
+        with wave.open(str(wav_path), "rb") as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1 or wav.getframerate() != self.manager.rate:
+                raise ValueError(
+                    f"{wav_path}: se espera PCM 16 bits mono a {self.manager.rate} Hz "
+                    f"(tiene {wav.getsampwidth() * 8} bits, {wav.getnchannels()} canales, {wav.getframerate()} Hz)"
+                )
+            return wav.readframes(wav.getnframes())
+
+    async def _feed(self, session, pcm):
+        """Envía el audio en tramas respetando el ritmo de reproducción elegido."""
+        frame_bytes = int(self.manager.rate * self.frame_ms / 1000) * 2
+        frame_seconds = self.frame_ms / 1000
+        start = time.perf_counter()
+        for index, offset in enumerate(range(0, len(pcm), frame_bytes)):
+            await session.feed_audio(pcm[offset:offset + frame_bytes])
+            if self.speed:
+                # Se espera hasta el instante teórico de la trama para no acumular deriva
+                delay = start + (index + 1) * frame_seconds / self.speed - time.perf_counter()
+                await asyncio.sleep(max(0.0, delay))
+            else:
+                await asyncio.sleep(0)
+
+    async def _settle(self, session):
+        """Espera a que no quede ninguna locución ni turno pendiente durante un periodo de gracia."""
+        grace = (session.assembler.finalize_timeout if session.assembler else 0.0) + 0.5
+        deadline = time.monotonic() + self.settle_timeout
+        idle_since = None
+        while time.monotonic() < deadline:
+            current = session.scheduler.current
+            busy = (current is not None and not current[1].done()) or (
+                session.assembler is not None and session.assembler.parts
+            )
+            if busy:
+                idle_since = None
+            elif idle_since is None:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since >= grace:
+                return
+            await asyncio.sleep(0.05)
+        print(f"⚠️ Sesión {session.session_id}: turnos pendientes tras {self.settle_timeout} s.")
+
+    async def replay_call(self, wav_path):
+        """Reproduce una llamada completa en una sesión nueva."""
+        wav_path = Path(wav_path)
+        pcm = self._read_wav(wav_path)
+        session = await self.manager.open_session()
+
+        script_path = wav_path.with_suffix(".txt")
+        if script_path.exists() and hasattr(session.dg_connection, "script"):
+            lines = script_path.read_text(encoding="utf-8").splitlines()
+            session.dg_connection.script.extend(line.strip() for line in lines if line.strip())
+
+        previous = session.scheduler.on_complete
+        def on_complete(turn):
+            if previous is not None:
+                previous(turn)
+            self._record_turn(turn)
+        session.scheduler.on_complete = on_complete
+
+        # El transporte de la llamada: se consume el audio de respuesta para no bloquear la reproducción
+        draining = threading.Event()
+        def drain():
+            while not draining.is_set():
+                try:
+                    session.audio_out.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+        drainer = threading.Thread(target=drain, daemon=True)
+        drainer.start()
+
+        try:
+            await self._feed(session, pcm)
+            # Silencio final para que el VAD cierre la última locución
+            await self._feed(session, b"\x00\x00" * int(self.manager.rate * self.tail_silence))
+            await self._settle(session)
+        finally:
+            self.turns_cancelled += session.scheduler.cancelled
+            await self.manager.close_session(session.session_id)
+            draining.set()
+            drainer.join(timeout=1)
+        self.calls += 1
+        print(f"📞 Llamada {wav_path.name} reproducida en la sesión {session.session_id}.")
+
+    async def run(self, wav_paths):
+        """Reproduce todas las llamadas con el límite de concurrencia configurado."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(path):
+            async with semaphore:
+                try:
+                    await self.replay_call(path)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"❌ Error al reproducir {path}: {e}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(path) for path in wav_paths))
+        return time.perf_counter() - started
+
+    def report(self, wall_seconds):
+        """Resultado en formato JSON para seguir regresiones entre versiones."""
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "concurrency": self.concurrency,
+            "speed": self.speed,
+            "wall_seconds": round(wall_seconds, 3),
+            "backends": {
+                "stt": type(self.manager.deepgram).__name__,
+                "llm": type(self.manager.llm_client).__name__,
+                "tts": type(self.manager.tts_client).__name__
+            },
+            "turns_completed": self.turns,
+            "turns_cancelled": self.turns_cancelled,
+            "latency": {name: stats.summary() for name, stats in self.metrics.items()}
+        }
+
+async def _main(args):
+    manager = SessionManager(args.config, backend_mode="mock" if args.mock else None)
+    if args.spans:
+        TRACER.set_output(args.spans)
+    harness = ReplayHarness(
+        manager,
+        speed=args.speed,
+        concurrency=args.concurrency,
+        frame_ms=args.frame_ms,
+        tail_silence=args.tail_silence
+    )
+    try:
+        wall_seconds = await harness.run(list(args.wavs) * args.repeat)
+    finally:
+        await manager.close()
+    return harness.report(wall_seconds)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce llamadas WAV a través del pipeline y mide latencias.")
+    parser.add_argument("wavs", nargs="*", help="Llamadas grabadas (PCM 16 bits mono a audio.rate)")
+    parser.add_argument("--config", default=None, help="Ruta a config.yaml")
+    parser.add_argument("--concurrency", type=int, default=1, help="Llamadas simultáneas")
+    parser.add_argument("--speed", type=float, default=1.0, help="Velocidad de envío (1 = tiempo real, 0 = sin esperas)")
+    parser.add_argument("--repeat", type=int, default=1, help="Veces que se reproduce el conjunto de llamadas")
+    parser.add_argument("--frame-ms", type=int, default=20, help="Duración de cada trama enviada")
+    parser.add_argument("--tail-silence", type=float, default=2.0, help="Segundos de silencio al final de cada llamada")
+    parser.add_argument("--mock", action="store_true", help="Usa los sustitutos locales de Deepgram, Grok y ElevenLabs")
+    parser.add_argument("--json", default=None, help="Guarda el resultado en este archivo en lugar de imprimirlo")
+    parser.add_argument("--spans", default=None, help="Guarda los spans de cada turno en este archivo JSON lines")
+    parser.add_argument("--check-vad", action="store_true",
+                        help="Comprueba con ruido y voz sintéticos que el VAD detecta el inicio y el fin de voz")
+    args = parser.parse_args()
+
+    if args.check_vad:
+        config = load_config(args.config)
+        sample_rate = (config.get("audio") or {}).get("rate", 16000)
+        passed, rows = check_vad(sample_rate, args.frame_ms, config=config.get("vad"))
+        print(f"{'ruido dB':>9}  {'caso':<10}{'inicio s':>9}{'fin s':>8}{'suelo dB':>10}")
+        for row in rows:
+            print(
+                f"{row['noise_db']:>9.1f}  {row['case']:<10}{str(row['speech_start']):>9}{str(row['speech_end']):>8}"
+                f"{row['estimated_noise_db']:>10.1f} {'✅' if row['ok'] else '❌'}"
+            )
+        sys.exit(0 if passed else 1)
+    if not args.wavs:
+        parser.error("Hace falta al menos un WAV salvo con --check-vad")
+
+    report = asyncio.run(_main(args))
+    output = json.dumps(report, indent=2)
+    if args.json:
+        Path(args.json).write_text(output, encoding="utf-8")
+        print(f"💾 Resultados guardados en {args.json}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from src.metrics import LatencyStats
+from src.tracing import TRACER
+
+class BatchedRetriever:
+    """Agrupa las consultas concurrentes en una ventana corta y las resuelve por lotes.
+
+    Un único hilo de trabajo espera la primera consulta, recoge las que
+    llegan durante `window_ms` (hasta `max_batch`), las codifica en un solo
+    forward del modelo y hace una sola búsqueda FAISS. Cada llamante recibe su
+    resultado a través de un `Future`. Tras `close()` no se aceptan consultas
+    y las que no llegó a resolver el hilo fallan en lugar de quedar colgadas.
+    """
+
+    def __init__(self, backend, window_ms=3, max_batch=32):
+        self.backend = backend
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.latency = LatencyStats()
+        self.batch_sizes = deque(maxlen=1000)
+        self.completed = 0
+        self.batches = 0
+        self.started_at = time.perf_counter()
+        self._recent = deque(maxlen=1000)  # Instantes de finalización para el throughput reciente
+
+        self.thread = threading.Thread(target=self._run, daemon=True, name="retriever")
+        self.thread.start()
+
+    def submit(self, query, top_k=None):
+        """Encola una consulta y devuelve un Future con (fragmentos relevantes, embedding de la consulta)."""
+        future = Future()
+        with self._lock:
+            # Con el lock, ninguna consulta puede quedar en la cola detrás del aviso de cierre
+            if self._closed:
+                raise RuntimeError("El recuperador por lotes está cerrado.")
+            self.queue.put((query, top_k, future, time.perf_counter(), TRACER.context()))
+        return future
+
+    def retrieve(self, query, top_k=None, timeout=None):
+        """Versión bloqueante de `submit` para los hilos de los turnos."""
+        return self.submit(query, top_k).result(timeout)
+
+    def _run(self):
+        """Hilo de trabajo: forma lotes dentro de la ventana y los resuelve."""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.perf_counter() + self.window
+            closing = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+
+            self._resolve(batch)
+            if closing:
+                break
+        self._fail_pending()
+
+    def _fail_pending(self):
+        """Hace fallar las consultas que quedan en la cola al cerrar."""
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and not item[2].done():
+                item[2].set_exception(RuntimeError("El recuperador por lotes se cerró antes de resolver la consulta."))
+
+    def _resolve(self, batch):
+        """Codifica y busca un lote completo y reparte los resultados."""
+        top_k = max(item[1] or self.backend.top_k for item in batch)
+        try:
+            results = self.backend.retrieve_batch(
+                [item[0] for item in batch],
+                top_k,
+                return_embeddings=True,
+                contexts=[item[4] for item in batch]
+            )
+        except Exception as e:
+            for _, _, future, _, _ in batch:
+                future.set_exception(e)
+            return
+
+        now = time.perf_counter()
+        for (query, k, future, submitted_at, _), (docs, embedding) in zip(batch, results):
+            future.set_result((docs[:k or self.backend.top_k], embedding))
+            self.latency.record(now - submitted_at)
+            self._recent.append(now)
+        self.completed += len(batch)
+        self.batches += 1
+        self.batch_sizes.append(len(batch))
+
+    def stats(self):
+        """Percentiles de latencia de recuperación, tamaño medio de lote y throughput."""
+        elapsed = time.perf_counter() - self.started_at
+        recent = list(self._recent)
+        recent_span = recent[-1] - recent[0] if len(recent) > 1 else 0
+        sizes = list(self.batch_sizes)
+        return {
+            "latency": self.latency.summary(),
+            "queries": self.completed,
+            "batches": self.batches,
+            "avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else None,
+            "throughput_qps": round(self.completed / elapsed, 2) if elapsed else None,
+            "recent_throughput_qps": round((len(recent) - 1) / recent_span, 2) if recent_span else None
+        }
+
+    def close(self):
+        """Detiene el hilo de trabajo tras resolver las consultas pendientes y rechaza las nuevas."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self.queue.put(None)
+        self.thread.join(timeout=1)
+        if not self.thread.is_alive():
+            self._fail_pending()
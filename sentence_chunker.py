@@ -0,0 +1,32 @@
+import re
+
+class SentenceChunker:
+    """Agrupa los tokens que llegan del LLM en frases completas para enviarlas al TTS."""
+
+    # Fin de frase: signo de cierre seguido de espacio, o salto de línea
+    SENTENCE_END = re.compile(r"([.!?…]+[\"'»)]*\s+|\n+)")
+
+    def __init__(self, min_chars=20):
+        """Configura la longitud mínima de una frase para no enviar fragmentos diminutos al TTS."""
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        """Añade texto al búfer y devuelve las frases que ya están completas."""
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in self.SENTENCE_END.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()].strip()
+            if len(candidate) < self.min_chars:
+                continue
+            sentences.append(candidate)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Devuelve el texto pendiente al terminar el stream."""
+        tail = self.buffer.strip()
+        self.buffer = ""
+        return tail
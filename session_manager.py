@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import json
+import os
+import queue
+import sys
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from deepgram import LiveTranscriptionEvents, LiveOptions
+
+# Añade la raíz del proyecto al path de Python
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.llm_processor import LLMProcessor
+from src.audio_output import AudioPlayback
+from src.audio_sink import QueueSink
+from src.metrics import LatencyStats, current_rss
+from src.answer_cache import create_answer_cache, create_tts_cache
+from src.vad import UtteranceAssembler, create_vad, format_trace
+from src.turn_scheduler import TurnScheduler
+from src.backends import create_stt_client, create_llm_client, create_tts_client
+from src.tracing import configure_tracing
+from src.startup import StartupOrchestrator, load_config
+from src.conversation_log import create_conversation_log
+from src.http_pool import close_http_pool, http_stats, preconnect
+from src.transcript_sink import create_transcript_sinks
+
+class CallSession:
+    """Una llamada: historial propio, conexión con Deepgram y canales de audio de entrada y salida.
+
+    El transporte de la llamada escribe el audio del llamante con
+    `feed_audio()` y lee el audio de la respuesta (PCM) de `audio_out`.
+    """
+
+    def __init__(self, session_id, manager):
+        self.session_id = session_id
+        self.manager = manager
+        self.llm = LLMProcessor(
+            manager.config_path,
+            rag_backend=manager.rag,
+            session_id=session_id,
+            answer_cache=manager.answer_cache,
+            llm_client=manager.llm_client,
+            config=manager.config,
+            conversation_log=manager.conversation_log,
+            transcript_sink=manager.transcripts
+        )
+        self.audio_in = asyncio.Queue(maxsize=manager.input_queue_size)
+        self.audio_out = queue.Queue(maxsize=manager.output_queue_size)
+        self.playback = AudioPlayback(
+            manager.config_path,
+            sink=QueueSink(self.audio_out),
+            tts_cache=manager.tts_cache,
+            tts_client=manager.tts_client,
+            config=manager.config
+        )
+        self.dg_connection = None
+        self.sender_task = None
+        self.loop = None
+        self.scheduler = TurnScheduler(
+            self.llm,
+            self.playback,
+            executor=manager.executor,
+            streaming=manager.streaming,
+            max_concurrent=manager.turns_config.get("max_concurrent", 2),
+            cancel_wait=manager.turns_config.get("cancel_wait", 2.0),
+            on_complete=self._on_turn_complete,
+            session_id=session_id
+        )
+
+        self.vad = create_vad(manager.vad_config, manager.rate)
+        self.assembler = None
+        if self.vad is not None:
+            self.assembler = UtteranceAssembler(
+                self._dispatch_utterance,
+                finalize_timeout=manager.vad_config.get("finalize_timeout", 1.5)
+            )
+
+    async def start(self):
+        """Abre la conexión con Deepgram y empieza a enviar el audio recibido."""
+        self.loop = asyncio.get_running_loop()
+        self.scheduler.loop = self.loop
+        self.dg_connection = self.manager.deepgram.listen.asyncwebsocket.v("1")
+        self.dg_connection.on(LiveTranscriptionEvents.Transcript, self._on_transcript)
+        await self.dg_connection.start(self.manager.transcription_options())
+        self.sender_task = asyncio.create_task(self._send_loop())
+        print(f"🔗 Sesión {self.session_id} conectada con Deepgram.")
+
+    async def feed_audio(self, pcm):
+        """Recibe un bloque de audio del llamante (linear16)."""
+        await self.audio_in.put(pcm)
+
+    async def _send_loop(self):
+        """Envía a Deepgram el audio de entrada de la sesión, filtrado por el VAD si está activado."""
+        last_sent = time.time()
+        while True:
+            data = await self.audio_in.get()
+            if data is None:
+                break
+            if self.vad is None:
+                await self.dg_connection.send(data)
+                continue
+
+            frames, events = self.vad.process(data)
+            for frame in frames:
+                await self.dg_connection.send(frame)
+            now = time.time()
+            if frames:
+                last_sent = now
+            elif now - last_sent > 5:
+                await self.dg_connection.keep_alive()
+                last_sent = now
+
+            for event in events:
+                if event.kind == "speech_start":
+                    self.playback.stop()
+                    # Mientras el cliente habla se calientan las conexiones con Grok y ElevenLabs
+                    preconnect()
+                    self.assembler.speech_started(event.timestamp)
+                else:
+                    await self.dg_connection.finalize()
+                    self.assembler.speech_ended(event.timestamp)
+
+    async def _on_transcript(self, client, result, **kwargs):
+        if result.channel and result.channel.alternatives:
+            transcript = result.channel.alternatives[0].transcript
+            if self.assembler is not None:
+                self.assembler.add_result(transcript, result.is_final, getattr(result, "from_finalize", False))
+            elif transcript:
+                self.playback.stop()
+                self.scheduler.submit(transcript)
+
+    def _dispatch_utterance(self, transcript, trace):
+        """Lanza un único turno por locución (se llama desde el hilo del ensamblador)."""
+        print(f"[{self.session_id}] ⏱️ Turno: {format_trace(trace)}")
+        self.playback.stop()
+        speech_ended_at = None
+        if "speech_end" in trace:
+            # El VAD marca con time.time(); los turnos se miden con perf_counter
+            speech_ended_at = time.perf_counter() - (time.time() - trace["speech_end"])
+        self.scheduler.submit_threadsafe(transcript, speech_ended_at=speech_ended_at, trace=trace)
+
+    def _on_turn_complete(self, turn):
+        """Acumula en el gestor el coste de cada turno completado."""
+        self.manager.turn_cpu.record(turn.cpu_seconds or 0.0)
+        self.manager.turn_latency.record(time.perf_counter() - turn.started_at)
+
+    async def close(self):
+        """Cancela el turno en curso, cierra la conexión con Deepgram y libera la reproducción."""
+        await self.scheduler.close()
+        if self.sender_task:
+            await self.audio_in.put(None)
+            await self.sender_task
+        if self.dg_connection:
+            await self.dg_connection.finish()
+        self.playback.close()
+        print(f"📌 Sesión {self.session_id} cerrada: {self.scheduler.stats()}")
+
+class SessionManager:
+    """Atiende muchas llamadas simultáneas desde un único proceso asyncio.
+
+    Todas las sesiones comparten el mismo `RAGBackend` (modelo de embeddings
+    e índice FAISS en solo lectura), las cachés de respuestas y de audio, los
+    clientes de Deepgram, Grok y ElevenLabs y el pool de hilos en el que se
+    ejecutan los turnos LLM + TTS. `backend_mode` ("live" o "mock") fuerza el
+    modo de los tres clientes por encima de la sección `backends` de config.yaml.
+    El RAG no bloquea el arranque: las sesiones reciben su `Future` y lo
+    incorporan cuando termina de cargar.
+    """
+
+    def __init__(self, config_path=None, rag_backend=None, backend_mode=None):
+        if config_path is None:
+            config_path = Path(__file__).parent.parent / "config" / "config.yaml"
+        self.config_path = config_path
+
+        # Se lee una sola vez; las sesiones reutilizan la configuración ya parseada
+        config = load_config(config_path)
+        self.config = config
+
+        self.deepgram_config = config["deepgram"]
+        self.rate = config["audio"]["rate"]
+        self.streaming = (config.get("streaming") or {}).get("enabled", True)
+        self.vad_config = config.get("vad") or {}
+        self.turns_config = config.get("turns") or {}
+        configure_tracing(config.get("tracing"))
+
+        sessions_config = config.get("sessions") or {}
+        self.max_sessions = sessions_config.get("max_sessions", 50)
+        self.input_queue_size = sessions_config.get("input_queue_size", 100)
+        self.output_queue_size = sessions_config.get("output_queue_size", 500)
+        workers = sessions_config.get("max_workers", (os.cpu_count() or 1) * 4)
+
+        # El RAG (modelo, índice y calentamiento) arranca en paralelo con los clientes y las cachés
+        self.startup = StartupOrchestrator()
+        self._owns_rag = rag_backend is None
+        if rag_backend is None:
+            self.startup.start("rag", lambda: self._create_rag(config), warmup=lambda rag: rag.warm_up())
+        self.startup.start("stt", lambda: create_stt_client(config, backend_mode))
+        self.startup.start("llm", lambda: create_llm_client(config, backend_mode))
+        self.startup.start("tts", lambda: create_tts_client(config, backend_mode))
+        cache_config = config.get("cache") or {}
+        self.answer_cache = create_answer_cache(cache_config.get("answers"))
+        self.tts_cache = create_tts_cache(cache_config.get("tts"))
+        # Un único escritor (hilo y archivo) para el log de todas las sesiones
+        self.conversation_log = create_conversation_log(config.get("conversation_log"), Path(__file__).parent / "logs")
+        # Supervisión en directo de todas las llamadas (p. ej. `sinks: [feed]` para el flujo SSE)
+        self.transcripts = create_transcript_sinks(config.get("transcripts"))
+        self.deepgram = self.startup.get("stt")
+        self.llm_client = self.startup.get("llm")
+        self.tts_client = self.startup.get("tts")
+        # Sin esperar al RAG: cada `LLMProcessor` lo incorpora cuando el Future se resuelve
+        self.rag = rag_backend or self.startup.futures["rag"]
+        print(f"🚀 Arranque por componente: {self.startup.report()}")
+        if self._ready_rag() is None:
+            print("⏳ El RAG sigue arrancando; las llamadas irán sin contexto hasta que termine.")
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="turn")
+        self.sessions = {}
+
+        self.turn_cpu = LatencyStats()
+        self.turn_latency = LatencyStats()
+
+    def _create_rag(self, config):
+        # Importación diferida: sentence-transformers y FAISS solo se cargan si el RAG no se inyecta
+        from src.rag_backend import RAGBackend
+        return RAGBackend(self.config_path, config=config)
+
+    def _ready_rag(self):
+        """El RAG si ya terminó de arrancar; None mientras arranca o si falló."""
+        if not isinstance(self.rag, Future):
+            return self.rag
+        if self.rag.done() and not self.rag.cancelled() and self.rag.exception() is None:
+            return self.rag.result()
+        return None
+
+    @staticmethod
+    def _close_rag(future):
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
+
+    def transcription_options(self):
+        """Opciones de transcripción comunes a todas las sesiones."""
+        return LiveOptions(
+            model=self.deepgram_config["model"],
+            language=self.deepgram_config["language"],
+            smart_format=self.deepgram_config["smart_format"],
+            encoding="linear16",
+            sample_rate=self.rate
+        )
+
+    def create_session(self, session_id=None):
+        """Crea una sesión sin conectarla todavía a Deepgram."""
+        if len(self.sessions) >= self.max_sessions:
+            raise RuntimeError(f"Se alcanzó el máximo de {self.max_sessions} sesiones simultáneas.")
+        session_id = session_id or uuid.uuid4().hex[:8]
+        if session_id in self.sessions:
+            raise ValueError(f"La sesión {session_id} ya existe.")
+        session = CallSession(session_id, self)
+        self.sessions[session_id] = session
+        return session
+
+    async def open_session(self, session_id=None):
+        """Crea una sesión y la conecta con Deepgram."""
+        session = self.create_session(session_id)
+        try:
+            await session.start()
+        except Exception:
+            self.sessions.pop(session.session_id, None)
+            session.playback.close()
+            raise
+        return session
+
+    async def close_session(self, session_id):
+        """Cierra y elimina una sesión."""
+        session = self.sessions.pop(session_id, None)
+        if session:
+            await session.close()
+
+    async def close(self):
+        """Cierra todas las sesiones, el pool de hilos, el log y las vistas de la conversación, el pool HTTP y el RAG si es propio."""
+        for session_id in list(self.sessions):
+            await self.close_session(session_id)
+        self.executor.shutdown(wait=False)
+        if self.answer_cache is not None:
+            self.answer_cache.save()
+        if self.conversation_log is not None:
+            self.conversation_log.close()
+        self.transcripts.close()
+        close_http_pool()
+        if self._owns_rag:
+            # Si aún está arrancando, se cierra en cuanto termine
+            self.rag.add_done_callback(self._close_rag)
+        self.startup.shutdown()
+        print(f"🚀 Arranque por componente: {self.startup.report()}")
+
+    def measure_session_overhead(self, count=10):
+        """Mide la memoria adicional por sesión creando `count` sesiones sin conexión."""
+        tracemalloc.start()
+        rss_before = current_rss()
+        python_before = tracemalloc.get_traced_memory()[0]
+
+        created = [self.create_session() for _ in range(count)]
+
+        python_after = tracemalloc.get_traced_memory()[0]
+        rss_after = current_rss()
+        tracemalloc.stop()
+
+        for session in created:
+            self.sessions.pop(session.session_id, None)
+            session.playback.close()
+
+        result = {
+            "sessions": count,
+            "python_bytes_per_session": (python_after - python_before) // count
+        }
+        if rss_before is not None and rss_after is not None:
+            result["rss_bytes_per_session"] = (rss_after - rss_before) // count
+        return result
+
+    def capacity_estimate(self, cores=None, turns_per_minute=4.0, target_utilization=0.7):
+        """Estima cuántas sesiones simultáneas caben en `cores` núcleos según la CPU medida por turno."""
+        cores = cores or os.cpu_count() or 1
+        cpu_per_turn = self.turn_cpu.percentile(95)
+        if not cpu_per_turn:
+            return None
+        cpu_per_session = cpu_per_turn * turns_per_minute / 60
+        return {
+            "cores": cores,
+            "cpu_ms_per_turn_p95": round(cpu_per_turn * 1000, 2),
+            "turns_per_minute": turns_per_minute,
+            "max_sessions": int(cores * target_utilization / cpu_per_session)
+        }
+
+    def stats(self):
+        """Métricas agregadas del servidor de sesiones."""
+        rag = self._ready_rag()
+        return {
+            "active_sessions": len(self.sessions),
+            "turn_cpu": self.turn_cpu.summary(),
+            "turn_latency": self.turn_latency.summary(),
+            "turns_completed": sum(session.scheduler.completed for session in self.sessions.values()),
+            "turns_cancelled": sum(session.scheduler.cancelled for session in self.sessions.values()),
+            "retrieval": rag.stats() if rag is not None else None,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else None,
+            "tts_cache": self.tts_cache.stats() if self.tts_cache else None,
+            "conversation_log": self.conversation_log.stats() if self.conversation_log else None,
+            "transcripts": self.transcripts.stats(),
+            "http": http_stats(),
+            "capacity": self.capacity_estimate()
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de sesiones de llamadas concurrentes.")
+    parser.add_argument("--config", default=None, help="Ruta a config.yaml")
+    parser.add_argument("--measure", type=int, default=10, help="Sesiones a crear para medir la memoria por sesión")
+    args = parser.parse_args()
+
+    manager = SessionManager(args.config)
+    print(json.dumps(manager.measure_session_overhead(args.measure), indent=2))
+    asyncio.run(manager.close())
+
+if __name__ == "__main__":
+    main()
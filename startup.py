@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import yaml
+
+from src.tracing import TRACER
+
+def load_config(config_path=None):
+    """Lee config.yaml (por defecto, config/config.yaml del proyecto)."""
+    if config_path is None:
+        config_path = Path(__file__).parent.parent / "config" / "config.yaml"
+    with open(config_path, "r") as f:
+        return yaml.safe_load(f)
+
+class StartupOrchestrator:
+    """Inicializa los componentes en paralelo, los calienta y mide el arranque de cada uno.
+
+    Cada componente se registra con `start(nombre, crear, calentar)`, que
+    devuelve un `Future` con el componente ya listo. Así el bucle de la
+    llamada espera solo a lo imprescindible (STT) y el resto, como el RAG, se
+    incorpora cuando termina. Los tiempos se registran también como spans
+    `startup.<nombre>`.
+    """
+
+    def __init__(self, max_workers=4):
+        self.started_at = time.perf_counter()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self.futures = {}
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def start(self, name, create, warmup=None):
+        """Crea (y calienta) un componente en segundo plano; devuelve su Future."""
+        future = self.executor.submit(self._run, name, create, warmup)
+        self.futures[name] = future
+        return future
+
+    def _run(self, name, create, warmup):
+        started = time.perf_counter()
+        try:
+            component = create()
+            created = time.perf_counter()
+            if warmup is not None:
+                warmup(component)
+        except Exception as e:
+            print(f"❌ Error al iniciar {name}: {e}")
+            with self._lock:
+                self.timings[name] = {"error": str(e), "ready_s": round(time.perf_counter() - self.started_at, 3)}
+            raise
+        self.record(name, started, created)
+        return component
+
+    def record(self, name, started, created=None):
+        """Registra el arranque de un componente medido fuera del orquestador (por ejemplo, una conexión asíncrona)."""
+        ready = time.perf_counter()
+        created = created or ready
+        timing = {
+            "init_s": round(created - started, 3),
+            "warmup_s": round(ready - created, 3),
+            "ready_s": round(ready - self.started_at, 3)
+        }
+        with self._lock:
+            self.timings[name] = timing
+        TRACER.record(f"startup.{name}", ready - started, context=(None, None), warmup_s=timing["warmup_s"])
+        print(
+            f"🚀 {name} listo en {ready - started:.2f}s (init {timing['init_s']:.2f}s, "
+            f"calentamiento {timing['warmup_s']:.2f}s, {timing['ready_s']:.2f}s desde el arranque)"
+        )
+
+    def get(self, name, timeout=None):
+        """Espera (bloqueando) a que el componente esté listo."""
+        return self.futures[name].result(timeout)
+
+    async def wait(self, name):
+        """Espera a que el componente esté listo sin bloquear el bucle de eventos."""
+        return await asyncio.wrap_future(self.futures[name])
+
+    def ready(self, name):
+        """True si el componente ya terminó de arrancar sin errores."""
+        future = self.futures.get(name)
+        return future is not None and future.done() and future.exception() is None
+
+    def report(self):
+        """Tiempos de arranque por componente, en el orden en que quedaron listos."""
+        with self._lock:
+            timings = sorted(self.timings.items(), key=lambda item: item[1]["ready_s"])
+        return dict(timings)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,272 @@
+import contextvars
+import json
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from src.profiler import SamplingProfiler
+
+# Límites (en segundos) de los histogramas de duración de los spans
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (session_id, turn_id) del turno que se está ejecutando en el hilo o tarea actual
+_turn_context = contextvars.ContextVar("turn_context", default=(None, None))
+
+_STOP = object()
+
+class Histogram:
+    """Histograma acumulativo al estilo Prometheus."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+class Tracer:
+    """Spans por turno de la cadena de voz, exportables como JSON lines y como métricas Prometheus.
+
+    Cada span tiene un nombre (por ejemplo "llm.first_token"), un instante de
+    inicio, una duración y los identificadores de sesión y turno, que se toman
+    del contexto fijado con `bind()` en el hilo del turno o se pasan
+    explícitamente. La duración de cada tipo de span alimenta un histograma.
+
+    Los spans del archivo JSON lines solo se encolan: un hilo en segundo
+    plano los escribe por lotes (como `ConversationLog`), así que `record`
+    nunca espera al disco. Con la cola llena el span no se escribe y se
+    cuenta en `dropped_spans`.
+    """
+
+    def __init__(self, enabled=True, jsonl_path=None, buckets=DEFAULT_BUCKETS, recent=1000, max_queue=10000,
+                 flush_interval=0.5):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.histograms = {}
+        self.gauges = {}
+        self.recent = deque(maxlen=recent)
+        self.profiler = SamplingProfiler()
+        self.server = None
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.dropped_spans = 0
+        self._spans = None  # Cola del hilo de escritura, o None sin archivo
+        self._writer = None
+        self._lock = threading.Lock()
+        self.set_output(jsonl_path)
+
+    def set_output(self, jsonl_path):
+        """Cambia (o desactiva con None) el archivo JSON lines de spans."""
+        with self._lock:
+            spans, writer = self._spans, self._writer
+            self._spans = self._writer = None
+        if writer is not None:
+            # El hilo anterior escribe lo que tenga pendiente y cierra su archivo
+            spans.put(_STOP)
+            writer.join()
+        if jsonl_path:
+            path = Path(jsonl_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            spans = queue.Queue(maxsize=self.max_queue)
+            writer = threading.Thread(target=self._write_spans, args=(path, spans), daemon=True, name="trace-writer")
+            writer.start()
+            with self._lock:
+                self._spans, self._writer = spans, writer
+
+    def _write_spans(self, path, spans):
+        """Hilo de escritura: agrupa los spans pendientes y los añade al archivo de una vez."""
+        with open(path, "a", encoding="utf-8") as f:
+            while True:
+                try:
+                    batch = [spans.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+                while True:
+                    try:
+                        batch.append(spans.get_nowait())
+                    except queue.Empty:
+                        break
+                f.writelines(json.dumps(span, ensure_ascii=False) + "\n" for span in batch if span is not _STOP)
+                f.flush()
+                if any(span is _STOP for span in batch):
+                    return
+
+    def bind(self, session_id, turn_id):
+        """Asocia los spans siguientes del hilo actual a una sesión y un turno. Devuelve el token para `unbind`."""
+        return _turn_context.set((session_id, turn_id))
+
+    def unbind(self, token):
+        _turn_context.reset(token)
+
+    def context(self):
+        """(session_id, turn_id) vigentes en el hilo actual."""
+        return _turn_context.get()
+
+    def observe(self, name, seconds):
+        """Añade una muestra al histograma sin emitir un span (para medidas muy frecuentes)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def record(self, name, duration, start=None, context=None, **attrs):
+        """Registra un span ya medido. `start` es time.time() de inicio; por defecto, ahora menos la duración."""
+        if not self.enabled:
+            return
+        session_id, turn_id = context or self.context()
+        span = {
+            "ts": round(start if start is not None else time.time() - duration, 6),
+            "name": name,
+            "duration_ms": round(duration * 1000, 3),
+            "session_id": session_id,
+            "turn_id": turn_id
+        }
+        span.update(attrs)
+        self.observe(name, duration)
+        with self._lock:
+            self.recent.append(span)
+            spans = self._spans
+        if spans is not None:
+            try:
+                spans.put_nowait(span)
+            except queue.Full:
+                with self._lock:
+                    self.dropped_spans += 1
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Mide el bloque como un span."""
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.record(name, time.perf_counter() - started, start=start, **attrs)
+
+    def gauge(self, name, read):
+        """Registra (o reemplaza) un valor instantáneo que se lee con `read()` al exportar las métricas."""
+        with self._lock:
+            self.gauges[name] = read
+
+    def prometheus(self):
+        """Histogramas y gauges en el formato de texto de Prometheus."""
+        lines = [
+            "# HELP voice_span_duration_seconds Duración de las etapas de cada turno de voz.",
+            "# TYPE voice_span_duration_seconds histogram"
+        ]
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            for name, histogram in histograms:
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'voice_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'voice_span_duration_seconds_sum{{span="{name}"}} {histogram.sum:.6f}')
+                lines.append(f'voice_span_duration_seconds_count{{span="{name}"}} {histogram.count}')
+            gauges = sorted(self.gauges.items())
+        for name, read in gauges:
+            try:
+                value = read()
+            except Exception:
+                continue
+            if value is not None:
+                lines.append(f"voice_{name} {value}")
+        lines.append(f"voice_trace_spans_dropped {self.dropped_spans}")
+        lines.append(f"voice_profiler_running {int(self.profiler.running)}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Arranca (una sola vez) el endpoint HTTP de métricas y control del perfilador.
+
+        GET /metrics          histogramas Prometheus
+        GET /spans?limit=N    últimos spans en JSON
+        GET /profile/start    activa el perfilador (?interval_ms=5)
+        GET /profile/stop     lo detiene
+        GET /profile          resumen de funciones (?collapsed=1 para flamegraph)
+        """
+        if self.server is not None:
+            return self.server
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+                if url.path == "/metrics":
+                    body = tracer.prometheus()
+                elif url.path == "/spans":
+                    limit = int(params.get("limit", ["100"])[0])
+                    body = json.dumps(list(tracer.recent)[-limit:], ensure_ascii=False)
+                    content_type = "application/json"
+                elif url.path == "/profile/start":
+                    interval_ms = params.get("interval_ms")
+                    tracer.profiler.reset()
+                    tracer.profiler.start(float(interval_ms[0]) / 1000 if interval_ms else None)
+                    body = "ok\n"
+                elif url.path == "/profile/stop":
+                    tracer.profiler.stop()
+                    body = tracer.profiler.report() + "\n"
+                elif url.path == "/profile":
+                    collapsed = params.get("collapsed", ["0"])[0] == "1"
+                    body = (tracer.profiler.collapsed() if collapsed else tracer.profiler.report()) + "\n"
+                else:
+                    self.send_error(404)
+                    return
+                payload = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="metrics").start()
+        print(f"📈 Métricas en http://{host}:{port}/metrics")
+        return self.server
+
+    def close(self):
+        """Detiene el endpoint y el perfilador, escribe los spans pendientes y cierra su archivo."""
+        self.profiler.stop()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+        self.set_output(None)
+
+# Trazador compartido por todos los componentes del proceso
+TRACER = Tracer()
+
+def configure_tracing(config):
+    """Configura el trazador compartido desde la sección `tracing` de config.yaml."""
+    config = config or {}
+    TRACER.enabled = config.get("enabled", True)
+    if not TRACER.enabled:
+        return TRACER
+    TRACER.set_output(config.get("jsonl_path"))
+    if config.get("metrics_port"):
+        TRACER.serve(config["metrics_port"], config.get("metrics_host", "127.0.0.1"))
+    TRACER.profiler.interval = config.get("profiler_interval_ms", 5) / 1000
+    if config.get("profile_on_start", False):
+        TRACER.profiler.start()
+    return TRACER
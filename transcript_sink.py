@@ -0,0 +1,380 @@
+import json
+import queue
+import sys
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_STOP = object()
+
+def format_event(event):
+    """Una línea legible de un mensaje de la conversación: hora, sesión, rol y texto."""
+    ts = (event.get("ts") or "")[11:19]
+    prefix = f"[{ts}] " if ts else ""
+    session = event.get("session_id") or "-"
+    content = " ".join(str(event.get("content", "")).split())
+    status = event.get("status")
+    suffix = f" [{status}]" if status and status not in ("completed", "cached") else ""
+    return f"{prefix}{session} {event.get('role', '?')}: {content}{suffix}"
+
+class TranscriptSink:
+    """Destino de los mensajes de la conversación (transcripciones del usuario y respuestas de Eva).
+
+    `publish()` se llama desde los hilos de los turnos: nunca bloquea ni
+    hace E/S; cada destino entrega los mensajes desde su propio hilo.
+    """
+
+    def publish(self, event):
+        """Entrega un mensaje (el mismo dict que se escribe en el log de conversación)."""
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        """Libera el destino."""
+
+class TranscriptFeed(TranscriptSink):
+    """Publica los mensajes por Server-Sent Events para supervisar las llamadas en directo.
+
+    GET /events?session=ID   flujo SSE (todas las sesiones si no se indica);
+                             con `Last-Event-ID` se reenvía lo perdido
+    GET /recent?session=ID&limit=N   últimos mensajes en JSON
+
+    `publish()` solo encola; un hilo reparte cada mensaje a las colas de los
+    suscriptores y guarda los `recent` últimos. Un supervisor lento pierde
+    sus mensajes más antiguos, sin frenar al resto ni a la llamada.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, max_queue=10000, subscriber_queue=1000, recent=1000,
+                 keepalive=15.0):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.subscriber_queue = subscriber_queue
+        self.recent = deque(maxlen=recent)
+        self.keepalive = keepalive
+        self.subscribers = {}  # cola -> sesión filtrada (None = todas)
+        self.published = 0
+        self.dropped = 0
+        self.subscriber_drops = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.thread = threading.Thread(target=self._run, daemon=True, name="transcript-feed")
+        self.thread.start()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="transcript-http").start()
+        print(f"📡 Transcripciones en directo en http://{host}:{port}/events")
+
+    def publish(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _run(self):
+        """Hilo de reparto: numera cada mensaje y lo copia a los suscriptores interesados."""
+        while True:
+            event = self.queue.get()
+            if event is _STOP:
+                break
+            with self._lock:
+                self._next_id += 1
+                item = (self._next_id, event.get("session_id"), json.dumps(event, ensure_ascii=False))
+                self.recent.append(item)
+                self.published += 1
+                subscribers = list(self.subscribers.items())
+            for subscriber, session in subscribers:
+                if session is None or session == item[1]:
+                    self._offer(subscriber, item)
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            self._offer(subscriber, None)
+
+    def _offer(self, subscriber, item):
+        while True:
+            try:
+                subscriber.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    subscriber.get_nowait()
+                    with self._lock:
+                        self.subscriber_drops += 1
+                except queue.Empty:
+                    pass
+
+    def subscribe(self, session=None, last_id=0):
+        """Registra un suscriptor; devuelve su cola, ya con los mensajes recientes posteriores a `last_id`."""
+        subscriber = queue.Queue(maxsize=self.subscriber_queue)
+        with self._lock:
+            backlog = [item for item in self.recent if item[0] > last_id and (session is None or session == item[1])]
+            for item in backlog[-self.subscriber_queue:]:
+                subscriber.put_nowait(item)
+            self.subscribers[subscriber] = session
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self.subscribers.pop(subscriber, None)
+
+    def _handler(self):
+        feed = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                session = params.get("session", [None])[0]
+                if url.path == "/events":
+                    self._stream(session)
+                elif url.path == "/recent":
+                    limit = int(params.get("limit", ["100"])[0])
+                    with feed._lock:
+                        items = [item for item in feed.recent if session is None or session == item[1]]
+                    body = "[" + ",".join(data for _, _, data in items[-limit:]) + "]"
+                    payload = body.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                else:
+                    self.send_error(404)
+
+            def _stream(self, session):
+                last_id = int(self.headers.get("Last-Event-ID") or 0)
+                subscriber = feed.subscribe(session, last_id)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    while True:
+                        try:
+                            item = subscriber.get(timeout=feed.keepalive)
+                        except queue.Empty:
+                            # Comentario SSE para que proxies y clientes no den la conexión por muerta
+                            self.wfile.write(b": ping\n\n")
+                            self.wfile.flush()
+                            continue
+                        if item is None:
+                            break
+                        event_id, _, data = item
+                        self.wfile.write(f"id: {event_id}\ndata: {data}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    feed.unsubscribe(subscriber)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def stats(self):
+        with self._lock:
+            return {
+                "published": self.published,
+                "dropped": self.dropped,
+                "subscribers": len(self.subscribers),
+                "subscriber_drops": self.subscriber_drops
+            }
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.thread.join(timeout=1)
+        self.server.shutdown()
+        self.server.server_close()
+
+class TerminalTranscriptView(TranscriptSink):
+    """Muestra en la terminal las últimas `lines` líneas de la conversación.
+
+    Un hilo escribe las líneas nuevas cuando se le avisa (sin sondear). Con
+    `redraw` se limpia la pantalla y se repinta el búfer circular completo,
+    que es lo adecuado cuando la terminal solo muestra transcripciones.
+    """
+
+    def __init__(self, lines=200, stream=None, redraw=False):
+        self.lines = deque(maxlen=lines)
+        self.stream = stream or sys.stdout
+        self.redraw = redraw
+        self.pending = deque(maxlen=lines)
+        self.published = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self.thread = threading.Thread(target=self._run, daemon=True, name="transcript-terminal")
+        self.thread.start()
+
+    def publish(self, event):
+        self.pending.append(format_event(event))
+        self.published += 1
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            new = []
+            while self.pending:
+                new.append(self.pending.popleft())
+            if new:
+                self.lines.extend(new)
+                if self.redraw:
+                    self.stream.write("\033[2J\033[H" + "\n".join(self.lines) + "\n")
+                else:
+                    self.stream.write("\n".join(f"💬 {line}" for line in new) + "\n")
+                self.stream.flush()
+            if self._stopping:
+                return
+
+    def stats(self):
+        return {"published": self.published, "shown": len(self.lines)}
+
+    def close(self):
+        self._stopping = True
+        self._wake.set()
+        self.thread.join(timeout=1)
+
+class TkTranscriptView(TranscriptSink):
+    """Ventana Tk con las transcripciones, actualizada por lotes desde el hilo principal.
+
+    `publish()` solo añade la línea a una cola acotada; `run()` (en el hilo
+    principal, que es donde Tk debe vivir) la vacía cada `batch_ms` con
+    `root.after` y conserva como mucho `max_lines` líneas en la ventana.
+    `open()` crea la ventana por separado para que quien la ejecuta pueda
+    comprobar que hay pantalla antes de arrancar nada más.
+    """
+
+    def __init__(self, title="Transcripciones de Deepgram", max_lines=500, batch_ms=100, max_pending=1000):
+        self.title = title
+        self.max_lines = max_lines
+        self.batch_ms = batch_ms
+        self.pending = deque(maxlen=max_pending)
+        self.published = 0
+        self.root = None
+        self.text_area = None
+        self._closing = threading.Event()
+
+    def publish(self, event):
+        self.pending.append(format_event(event))
+        self.published += 1
+
+    def open(self):
+        """Crea la ventana en el hilo actual. Lanza `tkinter.TclError` si no hay pantalla."""
+        import tkinter as tk
+        from tkinter import scrolledtext
+
+        self.root = tk.Tk()
+        self.root.title(self.title)
+        self.root.geometry("400x300")
+        self.root.configure(bg="#0d1b2a")  # Color de fondo de la ventana
+        self.text_area = scrolledtext.ScrolledText(
+            self.root,
+            wrap=tk.WORD,
+            width=40,
+            height=20,
+            bg="#0d1b2a",  # Color de fondo del área de texto
+            fg="#ffffff",  # Color del texto blanco para contraste
+            insertbackground="#ffffff"  # Color del cursor
+        )
+        self.text_area.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+
+    def run(self, on_close=None):
+        """Ejecuta el bucle de Tk hasta que se cierre la ventana (bloquea); la abre si hace falta."""
+        if self.root is None:
+            self.open()
+
+        def on_closing():
+            if on_close is not None:
+                on_close()
+            self.root.destroy()
+
+        self.root.protocol("WM_DELETE_WINDOW", on_closing)
+        self.root.after(self.batch_ms, self._drain)
+        self.root.mainloop()
+
+    def _drain(self):
+        """Inserta de una vez las líneas pendientes y recorta la ventana a `max_lines` (hilo de Tk)."""
+        if self._closing.is_set():
+            self.root.destroy()
+            return
+        lines = []
+        while self.pending:
+            lines.append(self.pending.popleft())
+        if lines:
+            self.text_area.insert("end", "\n".join(lines) + "\n")
+            excess = int(self.text_area.index("end-1c").split(".")[0]) - 1 - self.max_lines
+            if excess > 0:
+                self.text_area.delete("1.0", f"{excess + 1}.0")
+            self.text_area.see("end")
+        self.root.after(self.batch_ms, self._drain)
+
+    def stats(self):
+        return {"published": self.published, "pending": len(self.pending)}
+
+    def close(self):
+        """Pide a la ventana que se cierre (la cierra el propio hilo de Tk en el siguiente lote)."""
+        self._closing.set()
+
+class TranscriptSinks(TranscriptSink):
+    """Reparte cada mensaje entre varios destinos."""
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+
+    @property
+    def main_thread_view(self):
+        """La vista que necesita el hilo principal (Tk), o None."""
+        return next((sink for sink in self.sinks if isinstance(sink, TkTranscriptView)), None)
+
+    def replace(self, old, new):
+        """Sustituye un destino por otro (por ejemplo, la ventana Tk por la terminal sin pantalla)."""
+        self.sinks = [new if sink is old else sink for sink in self.sinks]
+        old.close()
+
+    def publish(self, event):
+        for sink in self.sinks:
+            sink.publish(event)
+
+    def stats(self):
+        return {type(sink).__name__: sink.stats() for sink in self.sinks}
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+def create_transcript_sinks(config, default_sinks=()):
+    """Crea los destinos de la sección `transcripts` de config.yaml (`sinks`: feed, terminal y/o tk)."""
+    config = config or {}
+    sinks = []
+    for name in config.get("sinks", list(default_sinks)):
+        section = config.get(name) or {}
+        if name == "feed":
+            sinks.append(TranscriptFeed(
+                host=section.get("host", "127.0.0.1"),
+                port=section.get("port", 8765),
+                max_queue=section.get("max_queue", 10000),
+                subscriber_queue=section.get("subscriber_queue", 1000),
+                recent=section.get("recent", 1000),
+                keepalive=section.get("keepalive", 15.0)
+            ))
+        elif name == "terminal":
+            sinks.append(TerminalTranscriptView(lines=section.get("lines", 200), redraw=section.get("redraw", False)))
+        elif name == "tk":
+            sinks.append(TkTranscriptView(
+                max_lines=section.get("max_lines", 500),
+                batch_ms=section.get("batch_ms", 100),
+                max_pending=section.get("max_pending", 1000)
+            ))
+        else:
+            raise ValueError(f"Destino de transcripciones desconocido: {name}")
+    return TranscriptSinks(sinks)
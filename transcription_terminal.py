@@ -1,14 +1,65 @@
+import argparse
+import json
 import sys
+import time
+import urllib.request
+from pathlib import Path
 
-def display_transcriptions():
-    print("🎙️ Terminal de transcripciones iniciada. Escuchando...")
-    while True:
-        # Leer desde stdin (pipe)
-        transcript = sys.stdin.readline().strip()
-        if not transcript or transcript == "EXIT":
+# Añade la raíz del proyecto al path de Python
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.transcript_sink import TerminalTranscriptView
+
+def _read_stdin():
+    """Mensajes desde stdin (pipe): una línea JSON del log de conversación o texto plano."""
+    for line in sys.stdin:
+        line = line.strip()
+        if not line or line == "EXIT":
             break
-        print(f"Transcripción recibida: {transcript}")
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield {"role": "usuario", "content": line}
+
+def _read_feed(url):
+    """Mensajes del flujo SSE de `TranscriptFeed`; si se corta, se reconecta sin perder mensajes."""
+    last_id = None
+    while True:
+        request = urllib.request.Request(url, headers={"Accept": "text/event-stream"})
+        if last_id is not None:
+            request.add_header("Last-Event-ID", last_id)
+        try:
+            with urllib.request.urlopen(request) as response:
+                for raw in response:
+                    line = raw.decode("utf-8").rstrip("\n")
+                    if line.startswith("id: "):
+                        last_id = line[4:]
+                    elif line.startswith("data: "):
+                        yield json.loads(line[6:])
+        except OSError as e:
+            print(f"⚠️ Conexión con {url} perdida ({e}); reintentando...", file=sys.stderr)
+        time.sleep(1)
+
+def display_transcriptions(url=None, session=None, lines=200):
+    print("🎙️ Terminal de transcripciones iniciada. Escuchando...")
+    if url and session:
+        url = f"{url}{'&' if '?' in url else '?'}session={session}"
+    view = TerminalTranscriptView(lines=lines, redraw=sys.stdout.isatty())
+    try:
+        for event in (_read_feed(url) if url else _read_stdin()):
+            view.publish(event)
+    except KeyboardInterrupt:
+        pass
+    view.close()
     print("📌 Terminal de transcripciones cerrada.")
 
+def main():
+    parser = argparse.ArgumentParser(description="Muestra las transcripciones de las llamadas en la terminal.")
+    parser.add_argument("--url", help="flujo SSE de TranscriptFeed (p. ej. http://127.0.0.1:8765/events); sin él, lee de stdin")
+    parser.add_argument("--session", help="muestra solo esta sesión")
+    parser.add_argument("--lines", type=int, default=200, help="líneas que se conservan en pantalla")
+    args = parser.parse_args()
+    display_transcriptions(args.url, args.session, args.lines)
+
 if __name__ == "__main__":
-    display_transcriptions()
\ No newline at end of file
+    main()
@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.metrics import LatencyStats
+from src.tracing import TRACER
+
+class Turn:
+    """Un turno de conversación: transcripción, marcas de tiempo (perf_counter) y señal de cancelación."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, transcript, started_at=None, speech_ended_at=None, trace=None):
+        self.turn_id = next(self._ids)
+        self.transcript = transcript
+        self.started_at = started_at or time.perf_counter()
+        self.speech_ended_at = speech_ended_at  # Fin de voz detectado por el VAD, si lo hay
+        self.trace = trace or {}  # Marcas time.time() del ensamblador (voz, STT final, envío)
+        self.first_token_at = None
+        self.first_audio_at = None
+        self.completed_at = None
+        self.cancel_event = threading.Event()
+        self.cancelled_at = None
+        self.response = None
+        self.cpu_seconds = None
+
+class TurnScheduler:
+    """Planificador de turnos de una sesión basado en tareas asyncio.
+
+    Cada transcripción nueva cancela el turno anterior: se activa su señal de
+    cancelación (que cortan el stream de Grok y la síntesis de ElevenLabs) y
+    se vacía la reproducción. El turno nuevo espera (como mucho `cancel_wait`)
+    a que el anterior termine; si su hilo sigue vivo, ese turno solo toca su
+    propia entrada del historial y sus propias marcas de tiempo.
+    Los turnos se ejecutan en `executor`; `max_concurrent` limita los hilos
+    ocupados por la sesión, incluidos los turnos cancelados que aún terminan.
+    `on_complete` recibe cada turno completado (con su tiempo de CPU).
+    Los spans de cada turno se etiquetan con `session_id` y el id del turno.
+    """
+
+    def __init__(self, llm, playback, loop=None, executor=None, streaming=True, max_concurrent=2, cancel_wait=2.0,
+                 on_complete=None, session_id=None):
+        self.llm = llm
+        self.session_id = session_id
+        self.playback = playback
+        self.loop = loop
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="turn")
+        self.streaming = streaming
+        self.cancel_wait = cancel_wait
+        self.on_complete = on_complete
+        self.semaphore = None
+        self.max_concurrent = max_concurrent
+
+        self.current = None  # (Turn, asyncio.Task)
+        self.pending_text = ""  # Transcripciones de turnos cancelados sin respuesta audible
+
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.turn_latency = LatencyStats()
+        self.cancel_latency = LatencyStats()
+
+    def submit(self, transcript, started_at=None, speech_ended_at=None, trace=None):
+        """Programa un turno nuevo cancelando el anterior. Debe llamarse desde el bucle de eventos."""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        previous = self.current
+        if previous is not None and not previous[1].done():
+            self._cancel(previous[0])
+            previous[1].cancel()
+
+        turn = Turn(transcript, started_at, speech_ended_at, trace)
+        self._trace_utterance(turn)
+        task = self.loop.create_task(self._run_turn(turn, previous[1] if previous else None))
+        self.current = (turn, task)
+        return task
+
+    def submit_threadsafe(self, transcript, started_at=None, speech_ended_at=None, trace=None):
+        """Versión de `submit` para hilos ajenos al bucle (callbacks de Deepgram, temporizadores)."""
+        started_at = started_at or time.perf_counter()
+        self.loop.call_soon_threadsafe(self.submit, transcript, started_at, speech_ended_at, trace)
+
+    def _trace_utterance(self, turn):
+        """Spans de captura (voz del usuario) y de espera del resultado final de Deepgram."""
+        trace = turn.trace
+        context = (self.session_id, turn.turn_id)
+        if "speech_start" in trace and "speech_end" in trace:
+            TRACER.record("capture", trace["speech_end"] - trace["speech_start"], start=trace["speech_start"],
+                          context=context)
+        if "speech_end" in trace and "stt_final" in trace:
+            TRACER.record("stt.final", max(0.0, trace["stt_final"] - trace["speech_end"]), start=trace["speech_end"],
+                          context=context)
+
+    def _cancel(self, turn):
+        """Marca un turno como cancelado y corta su audio."""
+        turn.cancelled_at = time.perf_counter()
+        turn.cancel_event.set()
+        self.playback.stop()
+
+    async def _run_turn(self, turn, previous_task):
+        try:
+            if previous_task is not None:
+                # Se espera (con límite) a que el turno anterior cierre su historial
+                await asyncio.wait([previous_task], timeout=self.cancel_wait)
+
+            if self.pending_text:
+                turn.transcript = f"{self.pending_text} {turn.transcript}"
+                self.pending_text = ""
+
+            await self.semaphore.acquire()
+        except asyncio.CancelledError:
+            # Cancelado antes de empezar: su transcripción pasa al turno siguiente
+            self.cancelled += 1
+            self.pending_text = turn.transcript
+            raise
+        future = self.executor.submit(self._execute, turn)
+        # El permiso se libera cuando el hilo termina de verdad, no al cancelar la tarea
+        future.add_done_callback(lambda _: self.loop.call_soon_threadsafe(self.semaphore.release))
+        try:
+            await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            turn.cancel_event.set()
+            self.cancelled += 1
+            # La tarea se cancela enseguida, pero el hilo aún debe cerrar el historial
+            await asyncio.wait([asyncio.wrap_future(future)], timeout=self.cancel_wait)
+            if future.done() and turn.cancelled_at is not None:
+                self.cancel_latency.record(time.perf_counter() - turn.cancelled_at)
+            if not turn.response:
+                self.pending_text = turn.transcript
+            print(f"⏹️ Turno {turn.turn_id} cancelado por una nueva intervención.")
+            raise
+        except Exception as e:
+            self.failed += 1
+            print(f"❌ Error en el turno {turn.turn_id}: {e}")
+            return
+
+        if turn.cancel_event.is_set():
+            self.cancelled += 1
+            return
+        self.completed += 1
+        turn.completed_at = time.perf_counter()
+        self.turn_latency.record(turn.completed_at - turn.started_at)
+        TRACER.record("turn.complete", turn.completed_at - turn.started_at, context=(self.session_id, turn.turn_id))
+        if self.on_complete is not None:
+            self.on_complete(turn)
+
+    def _execute(self, turn):
+        """Ejecuta el turno en un hilo: LLM y TTS, ambos atentos a la señal de cancelación."""
+        cpu_start = time.thread_time()
+        token = TRACER.bind(self.session_id, turn.turn_id)
+        try:
+            self._respond(turn)
+        finally:
+            TRACER.unbind(token)
+            turn.cpu_seconds = time.thread_time() - cpu_start
+        return turn.response
+
+    def _respond(self, turn):
+        """Genera y reproduce la respuesta y anota las marcas de tiempo del turno."""
+        print(f"Transcripción: {turn.transcript}")
+        if self.streaming:
+            turn.response = self.playback.play_stream(
+                self.llm.process_stream(turn.transcript, cancel_event=turn.cancel_event),
+                started_at=turn.started_at,
+                cancel_event=turn.cancel_event
+            )
+        else:
+            turn.response = self.llm.process(turn.transcript, cancel_event=turn.cancel_event)
+            if turn.response is not None and not turn.cancel_event.is_set():
+                self.playback.play(turn.response, started_at=turn.started_at, cancel_event=turn.cancel_event)
+        print(f"Respuesta de Grok: {turn.response}")
+        # Las marcas del LLM son por hilo: aunque un turno cancelado siga en otro hilo, estas son las de este turno
+        turn.first_token_at = self.llm.last_first_token_at
+        first_audio = self.playback.last_time_to_first_audio
+        if first_audio is not None:
+            turn.first_audio_at = turn.started_at + first_audio
+            TRACER.record("playback.start", first_audio)
+            if turn.speech_ended_at is not None:
+                TRACER.record("turn.end_to_end", turn.first_audio_at - turn.speech_ended_at)
+
+    async def close(self):
+        """Cancela el turno en curso y espera a que termine."""
+        if self.current is not None and not self.current[1].done():
+            self._cancel(self.current[0])
+            self.current[1].cancel()
+            await asyncio.wait([self.current[1]], timeout=self.cancel_wait)
+
+    def stats(self):
+        """Turnos completados, cancelados y fallidos, con sus latencias."""
+        return {
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "turn_latency": self.turn_latency.summary(),
+            "cancel_latency": self.cancel_latency.summary()
+        }
@@ -0,0 +1,277 @@
+import math
+import threading
+import time
+from collections import deque, namedtuple
+import numpy as np
+
+# kind: "speech_start" | "speech_end"; timestamp: time.time() del evento
+VADEvent = namedtuple("VADEvent", ["kind", "timestamp"])
+
+class VoiceActivityDetector:
+    """Detector de voz por energía con umbral adaptativo sobre tramas PCM linear16.
+
+    Decide qué tramas se envían a Deepgram: las de voz, un pre-roll de audio
+    previo al inicio (para no cortar la primera sílaba) y la cola de silencio
+    hasta el fin de la locución. El resto del silencio no se envía.
+
+    El suelo de ruido es un percentil bajo (`noise_percentile`) del nivel de
+    las tramas de los últimos `noise_window_ms`, con voz o sin ella: las
+    pausas entre palabras bastan para seguirlo, y un ruido de fondo constante
+    no queda clasificado como voz para siempre. Durante los primeros
+    `calibration_ms` solo se mide el ruido. Una locución que dura más de
+    `max_utterance_ms` se cierra aunque no haya silencio.
+    """
+
+    def __init__(self, sample_rate, channels=1, start_ms=90, hangover_ms=600, preroll_ms=300,
+                 margin_db=12.0, min_level_db=-50.0, calibration_ms=500, noise_window_ms=5000,
+                 noise_percentile=10, max_utterance_ms=15000):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.start_ms = start_ms
+        self.hangover_ms = hangover_ms
+        self.preroll_ms = preroll_ms
+        self.margin_db = margin_db
+        self.min_level_db = min_level_db
+        self.calibration_ms = calibration_ms
+        self.noise_window_ms = noise_window_ms
+        self.noise_percentile = noise_percentile
+        self.max_utterance_ms = max_utterance_ms
+
+        self.noise_db = -60.0
+        self.in_speech = False
+        self._elapsed_ms = 0.0
+        self._levels = deque()  # (nivel, duración) de las tramas de la ventana del suelo de ruido
+        self._levels_ms = 0.0
+        self._voiced_ms = 0.0
+        self._silence_ms = 0.0
+        self._speech_ms = 0.0
+        self._preroll = deque()
+        self._preroll_duration = 0.0
+
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.forced_ends = 0  # Locuciones cerradas por `max_utterance_ms` sin silencio
+
+    def _level_db(self, frame):
+        """Nivel RMS de la trama en dBFS."""
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        if samples.size == 0:
+            return -100.0
+        rms = math.sqrt(float(np.mean(samples * samples))) / 32768.0
+        return 20 * math.log10(rms) if rms > 0 else -100.0
+
+    def _track_noise(self, level, duration_ms):
+        """Actualiza el suelo de ruido con el percentil bajo de los niveles de la ventana reciente."""
+        self._levels.append((level, duration_ms))
+        self._levels_ms += duration_ms
+        while len(self._levels) > 1 and self._levels_ms - self._levels[0][1] >= self.noise_window_ms:
+            self._levels_ms -= self._levels.popleft()[1]
+        self.noise_db = float(np.percentile([value for value, _ in self._levels], self.noise_percentile))
+
+    def process(self, frame, timestamp=None):
+        """Procesa una trama y devuelve (tramas a enviar, eventos de voz)."""
+        timestamp = timestamp or time.time()
+        duration_ms = len(frame) / (2 * self.channels) / self.sample_rate * 1000
+        level = self._level_db(frame)
+        self._track_noise(level, duration_ms)
+        self._elapsed_ms += duration_ms
+        # Mientras se calibra el suelo de ruido no se decide nada
+        calibrated = self._elapsed_ms > self.calibration_ms
+        voiced = calibrated and level > max(self.noise_db + self.margin_db, self.min_level_db)
+        events = []
+
+        if not self.in_speech:
+            if voiced:
+                self._voiced_ms += duration_ms
+            else:
+                self._voiced_ms = 0.0
+
+            self._preroll.append(frame)
+            self._preroll_duration += duration_ms
+            while self._preroll_duration - duration_ms > self.preroll_ms and len(self._preroll) > 1:
+                dropped = self._preroll.popleft()
+                self._preroll_duration -= len(dropped) / (2 * self.channels) / self.sample_rate * 1000
+                self.frames_skipped += 1
+
+            if self._voiced_ms >= self.start_ms:
+                self.in_speech = True
+                self._silence_ms = 0.0
+                self._speech_ms = 0.0
+                events.append(VADEvent("speech_start", timestamp))
+                frames = list(self._preroll)
+                self._preroll.clear()
+                self._preroll_duration = 0.0
+                self.frames_sent += len(frames)
+                return frames, events
+            return [], events
+
+        self.frames_sent += 1
+        self._speech_ms += duration_ms
+        if voiced:
+            self._silence_ms = 0.0
+        else:
+            self._silence_ms += duration_ms
+        forced = self.max_utterance_ms and self._speech_ms >= self.max_utterance_ms
+        if self._silence_ms >= self.hangover_ms or forced:
+            if forced and self._silence_ms < self.hangover_ms:
+                self.forced_ends += 1
+            self.in_speech = False
+            self._voiced_ms = 0.0
+            events.append(VADEvent("speech_end", timestamp))
+        return [frame], events
+
+    def stats(self):
+        """Tramas enviadas y descartadas (ahorro de ancho de banda hacia Deepgram)."""
+        total = self.frames_sent + self.frames_skipped
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_skipped": self.frames_skipped,
+            "skipped_ratio": round(self.frames_skipped / total, 4) if total else None,
+            "noise_db": round(self.noise_db, 1),
+            "forced_ends": self.forced_ends
+        }
+
+class UtteranceAssembler:
+    """Une los resultados finales de Deepgram de una locución y entrega una sola transcripción por turno.
+
+    La transcripción se entrega cuando Deepgram responde a la petición de
+    `finalize` enviada al detectar el fin de voz, o tras `finalize_timeout`
+    segundos si esa respuesta no llega. Si el usuario vuelve a hablar antes,
+    se sigue acumulando en el mismo turno. `on_utterance` recibe el texto y
+    las marcas de tiempo del turno.
+    """
+
+    def __init__(self, on_utterance, finalize_timeout=1.5):
+        self.on_utterance = on_utterance
+        self.finalize_timeout = finalize_timeout
+        self.parts = []
+        self.trace = {}
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def speech_started(self, timestamp):
+        """El usuario empezó (o volvió) a hablar: se cancela la entrega pendiente."""
+        with self._lock:
+            self._cancel_timer()
+            self.trace.setdefault("speech_start", timestamp)
+
+    def speech_ended(self, timestamp):
+        """El VAD detectó el fin de la locución: se espera el resultado final de Deepgram."""
+        with self._lock:
+            self.trace["speech_end"] = timestamp
+            self._cancel_timer()
+            self._timer = threading.Timer(self.finalize_timeout, self._emit)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def add_result(self, transcript, is_final, from_finalize=False):
+        """Registra un resultado de Deepgram; los parciales se ignoran."""
+        with self._lock:
+            if is_final and transcript:
+                self.parts.append(transcript)
+                self.trace["stt_final"] = time.time()
+        if from_finalize:
+            self._emit()
+
+    def _emit(self):
+        with self._lock:
+            self._cancel_timer()
+            if not self.parts:
+                return
+            text = " ".join(self.parts)
+            trace = dict(self.trace, dispatched=time.time())
+            self.parts = []
+            self.trace = {}
+        self.on_utterance(text, trace)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+def format_trace(trace):
+    """Resume las marcas de tiempo de un turno como latencias en milisegundos."""
+    def delta(start, end):
+        if start in trace and end in trace:
+            return f"{(trace[end] - trace[start]) * 1000:.0f} ms"
+        return "n/d"
+    return (
+        f"voz {delta('speech_start', 'speech_end')}, "
+        f"fin de voz → STT final {delta('speech_end', 'stt_final')}, "
+        f"fin de voz → envío al LLM {delta('speech_end', 'dispatched')}"
+    )
+
+def create_vad(config, sample_rate, channels=1):
+    """Crea el detector desde la sección `vad` de config.yaml, o None si está desactivado."""
+    config = config or {}
+    if not config.get("enabled", True):
+        return None
+    return VoiceActivityDetector(
+        sample_rate,
+        channels=channels,
+        start_ms=config.get("start_ms", 90),
+        hangover_ms=config.get("hangover_ms", 600),
+        preroll_ms=config.get("preroll_ms", 300),
+        margin_db=config.get("margin_db", 12.0),
+        min_level_db=config.get("min_level_db", -50.0),
+        calibration_ms=config.get("calibration_ms", 500),
+        noise_window_ms=config.get("noise_window_ms", 5000),
+        noise_percentile=config.get("noise_percentile", 10),
+        max_utterance_ms=config.get("max_utterance_ms", 15000)
+    )
+
+def check_vad(sample_rate=16000, frame_ms=20, noise_levels=(-60.0, -47.0, -40.0, -35.0), speech_db=-15.0,
+              config=None, seed=0):
+    """Comprueba con audio sintético que el detector encuentra el inicio y el fin de una locución.
+
+    Para cada nivel de ruido de fondo constante (dBFS) se generan 1 s de
+    ruido, 2 s de "voz" (un tono modulado a `speech_db` sobre el ruido) y
+    3 s de ruido, y una locución continua de 20 s que debe cerrarse por
+    `max_utterance_ms` (3 s en esta prueba). Falla si falta algún inicio o
+    fin o si llegan fuera de margen.
+    """
+    rng = np.random.default_rng(seed)
+    frame_samples = int(sample_rate * frame_ms / 1000)
+
+    def noise(seconds, db):
+        samples = rng.standard_normal(int(seconds * sample_rate))
+        return samples * (10 ** (db / 20))
+
+    def speech(seconds, db):
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        envelope = 0.3 + 0.7 * np.abs(np.sin(2 * np.pi * 2.5 * t))
+        return np.sqrt(2) * (10 ** (db / 20)) * envelope * np.sin(2 * np.pi * 220 * t)
+
+    rows, passed = [], True
+    for noise_db in noise_levels:
+        for case, speech_seconds, tail in (("locución", 2.0, 3.0), ("continua", 20.0, 3.0)):
+            signal = noise(1.0 + speech_seconds + tail, noise_db)
+            start = int(sample_rate)
+            signal[start:start + int(speech_seconds * sample_rate)] += speech(speech_seconds, speech_db)
+            pcm = (np.clip(signal, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+            overrides = {"enabled": True} if case == "locución" else {"enabled": True, "max_utterance_ms": 3000}
+            vad = create_vad(dict(config or {}, **overrides), sample_rate)
+            starts, ends = [], []
+            for index in range(0, len(pcm) // 2 - frame_samples + 1, frame_samples):
+                _, events = vad.process(pcm[index * 2:(index + frame_samples) * 2], timestamp=index / sample_rate)
+                starts += [event.timestamp for event in events if event.kind == "speech_start"]
+                ends += [event.timestamp for event in events if event.kind == "speech_end"]
+
+            speech_end = 1.0 + speech_seconds
+            ok = bool(starts) and bool(ends) and 1.0 <= starts[0] <= 1.5 and ends[0] > starts[0]
+            if case == "locución":
+                # El fin llega tras la cola de silencio (`hangover_ms`) y no hay más locuciones con solo ruido
+                ok = ok and speech_end <= ends[0] <= speech_end + vad.hangover_ms / 1000 + 0.5 and len(starts) == 1
+            else:
+                ok = ok and vad.forced_ends >= 1 and ends[0] <= 1.0 + vad.max_utterance_ms / 1000 + 0.5
+            passed = passed and ok
+            rows.append({
+                "noise_db": noise_db,
+                "case": case,
+                "speech_start": round(starts[0], 2) if starts else None,
+                "speech_end": round(ends[0], 2) if ends else None,
+                "estimated_noise_db": round(vad.noise_db, 1),
+                "ok": ok
+            })
+    return passed, rows
@@ -0,0 +1,549 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from array import array
+from pathlib import Path
+import numpy as np
+import faiss
+
+from src.document_chunker import chunk_document
+from src.metrics import current_rss
+
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "sq8", "hnsw", "hnsw_sq8")
+BATCH_ROWS = 65536  # Filas de embeddings que se copian o se añaden al índice de una vez
+
+def read_index_mapped(index_path):
+    """Lee un índice FAISS mapeando su contenido en memoria; devuelve (índice, modo de carga).
+
+    `IO_FLAG_MMAP_IFC` mapea los vectores de cualquier tipo de índice (plano,
+    SQ, IVF, HNSW), así que la RAM no crece con el tamaño del índice.
+    `IO_FLAG_MMAP` solo mapea las listas invertidas de los IVF: se usa si la
+    versión de FAISS no tiene el anterior, y si ninguno es válido para el
+    archivo se carga entero en memoria.
+    """
+    attempts = []
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        attempts.append(("mmap", faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY))
+    attempts.append(("mmap_ivf", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY))
+    for mode, flags in attempts:
+        try:
+            return faiss.read_index(str(index_path), flags), mode
+        except RuntimeError:
+            continue
+    return faiss.read_index(str(index_path)), "memory"
+
+def build_index(embeddings, config=None):
+    """Construye un índice FAISS del tipo indicado en `config` (sección `rag.index`).
+
+    Tipos: `flat` (exacto), `ivf` (centroides entrenados), `ivfpq` (IVF con
+    cuantización de producto), `sq8` (exacto sobre vectores int8), `hnsw` y
+    `hnsw_sq8` (grafo HNSW sobre vectores float32 o int8). Si no hay
+    suficientes vectores para entrenar el tipo pedido se usa `flat`.
+    """
+    config = config or {}
+    index_type = config.get("type", "flat")
+    count, dimension = embeddings.shape
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconocido: {index_type}. Opciones: {', '.join(INDEX_TYPES)}")
+
+    # FAISS recomienda al menos 39 vectores de entrenamiento por centroide
+    nlist = min(config.get("nlist", 100), max(1, int(4 * np.sqrt(count))))
+    pq_m = config.get("pq_m", 48)
+    pq_nbits = config.get("pq_nbits", 8)
+    if index_type == "ivf" and count < nlist * 39:
+        print(f"⚠️ Solo {count} vectores: insuficientes para entrenar IVF. Se usa índice exacto.")
+        index_type = "flat"
+    if index_type == "ivfpq" and (count < max(nlist, 2 ** pq_nbits) * 39 or dimension % pq_m):
+        print(f"⚠️ IVF-PQ no aplicable ({count} vectores, dimensión {dimension}). Se usa índice exacto.")
+        index_type = "flat"
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, nlist)
+    elif index_type == "ivfpq":
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, pq_m, pq_nbits)
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config.get("hnsw_m", 32))
+    else:
+        index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_8bit, config.get("hnsw_m", 32))
+
+    if index_type.startswith("hnsw"):
+        index.hnsw.efConstruction = config.get("ef_construction", 80)
+    if not index.is_trained:
+        # FAISS no usa más de 256 vectores por centroide: no hace falta leer la matriz entera
+        index.train(_training_sample(embeddings, max(nlist, 2 ** pq_nbits) * 256))
+    # Por lotes, para que una matriz mapeada en memoria no se cargue completa
+    for start in range(0, count, BATCH_ROWS):
+        index.add(np.ascontiguousarray(embeddings[start:start + BATCH_ROWS]))
+    configure_search(index, config)
+    return index
+
+def _training_sample(embeddings, limit):
+    """Hasta `limit` filas repartidas uniformemente por la matriz."""
+    if len(embeddings) <= limit:
+        return np.ascontiguousarray(embeddings)
+    rows = np.linspace(0, len(embeddings) - 1, limit).astype(np.int64)
+    return np.ascontiguousarray(embeddings[rows])
+
+def configure_search(index, config=None):
+    """Aplica los parámetros de búsqueda (nprobe, efSearch) que no se guardan con el índice."""
+    config = config or {}
+    parameters = faiss.ParameterSpace()
+    for name, key, default in (("nprobe", "nprobe", 8), ("efSearch", "ef_search", 64)):
+        try:
+            parameters.set_index_parameter(index, name, config.get(key, default))
+        except RuntimeError:
+            # El tipo de índice no admite este parámetro
+            pass
+    return index
+
+class ChunkStore:
+    """Textos de los fragmentos en un único blob UTF-8 mapeado en memoria, con sus offsets y páginas.
+
+    Se indexa como una lista de cadenas, pero el texto no vive en objetos de
+    Python: el sistema pagina el blob bajo demanda y cada fragmento solo
+    ocupa en memoria su offset (8 bytes) y su página (4 bytes).
+    """
+
+    BLOB_FILE = "chunks.bin"
+    OFFSETS_FILE = "chunk_offsets.npy"
+    PAGES_FILE = "chunk_pages.npy"
+
+    def __init__(self, blob=None, offsets=None, pages=None):
+        self.blob = blob if blob is not None else np.zeros(0, dtype=np.uint8)
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self.pages = pages if pages is not None else np.zeros(0, dtype=np.int32)
+
+    @classmethod
+    def load(cls, directory):
+        """Mapea en memoria los fragmentos guardados en `directory`."""
+        directory = Path(directory)
+        blob_path = directory / cls.BLOB_FILE
+        # Un archivo vacío no se puede mapear
+        blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if blob_path.stat().st_size else None
+        offsets = np.load(directory / cls.OFFSETS_FILE, mmap_mode="r")
+        pages = np.load(directory / cls.PAGES_FILE, mmap_mode="r")
+        return cls(blob, offsets, pages)
+
+    @classmethod
+    def writer(cls, directory):
+        """Escritor que vuelca los fragmentos al blob a medida que se producen."""
+        return ChunkWriter(directory)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def page(self, index):
+        """Página en la que empieza el fragmento, o None si el documento no tiene páginas."""
+        value = int(self.pages[index])
+        return None if value < 0 else value
+
+    def records(self, start, end):
+        """Fragmentos [start, end) como lista de (texto, página)."""
+        return [(self[index], self.page(index)) for index in range(start, end)]
+
+    def nbytes(self):
+        """Bytes del blob de texto (mapeado) y de los arrays residentes."""
+        return {"blob": int(self.offsets[-1]), "arrays": int(self.offsets.nbytes + self.pages.nbytes)}
+
+def _tmp_path(path):
+    """Archivo temporal junto a `path` (se renombra sobre él al terminar)."""
+    return path.with_name(path.stem + ".tmp" + path.suffix)
+
+class ChunkWriter:
+    """Escribe un `ChunkStore` en archivos temporales según llegan los fragmentos.
+
+    El texto va directo al blob en disco; en memoria solo quedan los offsets
+    y las páginas. `commit` reemplaza los archivos del almacén y lo mapea.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.offsets = array("q", [0])
+        self.pages = array("i")
+        self._blob = open(_tmp_path(self.directory / ChunkStore.BLOB_FILE), "wb")
+
+    def add(self, records):
+        """Añade una secuencia de (texto, página)."""
+        for text, page in records:
+            data = text.encode("utf-8")
+            self._blob.write(data)
+            self.offsets.append(self.offsets[-1] + len(data))
+            self.pages.append(-1 if page is None else page)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def commit(self):
+        """Cierra el blob, sustituye los archivos del almacén y devuelve el almacén ya mapeado."""
+        self._blob.close()
+        arrays = {
+            ChunkStore.OFFSETS_FILE: np.frombuffer(self.offsets, dtype=np.int64),
+            ChunkStore.PAGES_FILE: np.frombuffer(self.pages, dtype=np.int32)
+        }
+        for filename, values in arrays.items():
+            np.save(_tmp_path(self.directory / filename), values)
+        for filename in (ChunkStore.BLOB_FILE, ChunkStore.OFFSETS_FILE, ChunkStore.PAGES_FILE):
+            os.replace(_tmp_path(self.directory / filename), self.directory / filename)
+        return ChunkStore.load(self.directory)
+
+    def abort(self):
+        """Descarta los archivos temporales."""
+        self._blob.close()
+        _remove_if_exists(_tmp_path(self.directory / ChunkStore.BLOB_FILE))
+
+class EmbeddingWriter:
+    """Escribe una matriz de embeddings .npy por bloques sin tenerla entera en memoria.
+
+    Los bloques se añaden a un archivo binario temporal; `finish` le pone la
+    cabecera .npy (ya se conoce la forma final) y devuelve la matriz mapeada
+    en memoria. `commit` la coloca en `path`.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.rows = 0
+        self.dimension = None
+        self._raw_path = self.path.with_name(self.path.stem + ".tmp.bin")
+        self._raw = open(self._raw_path, "wb")
+
+    def add(self, embeddings):
+        """Añade un bloque de filas (cualquier array convertible a float32)."""
+        block = np.ascontiguousarray(embeddings, dtype="<f4")
+        if not len(block):
+            return
+        if self.dimension is None:
+            self.dimension = block.shape[1]
+        self._raw.write(block.tobytes())
+        self.rows += len(block)
+
+    def finish(self):
+        """Genera el .npy temporal y lo devuelve mapeado en memoria (None si no hay filas)."""
+        self._raw.close()
+        if not self.rows:
+            _remove_if_exists(self._raw_path)
+            return None
+        header = {"descr": "<f4", "fortran_order": False, "shape": (self.rows, self.dimension)}
+        with open(_tmp_path(self.path), "wb") as f, open(self._raw_path, "rb") as raw:
+            np.lib.format.write_array_header_1_0(f, header)
+            shutil.copyfileobj(raw, f, 16 * 1024 * 1024)
+        os.remove(self._raw_path)
+        return np.load(_tmp_path(self.path), mmap_mode="r")
+
+    def commit(self):
+        """Sustituye el archivo de embeddings por el generado (hay que soltar antes su mapeo)."""
+        os.replace(_tmp_path(self.path), self.path)
+
+    def abort(self):
+        """Descarta los archivos temporales."""
+        self._raw.close()
+        _remove_if_exists(self._raw_path)
+        _remove_if_exists(_tmp_path(self.path))
+
+def _remove_if_exists(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+class PersistentVectorStore:
+    """Índice FAISS persistente en disco con re-indexado incremental por archivo."""
+
+    MANIFEST_FILE = "manifest.json"
+    INDEX_FILE = "index.faiss"
+    EMBEDDINGS_FILE = "embeddings.npy"
+    LEGACY_CHUNKS_FILE = "chunks.json"
+    SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+    def __init__(self, index_dir, encode, load_document, create_chunker, settings=None, index_config=None,
+                 ingest=None):
+        """Configura el directorio del índice y las funciones de carga, troceado y embedding.
+
+        `encode` recibe una lista de fragmentos y devuelve una matriz float32,
+        `load_document` recibe la ruta de un archivo y devuelve su texto (o
+        lanza una excepción si no puede leerlo: el archivo queda en el
+        manifiesto marcado como fallido, sin fragmentos, y solo se reintenta
+        cuando cambian su fecha, tamaño o contenido) y
+        `create_chunker` crea el troceador de un documento (ver
+        `document_chunker`). `settings` describe los parámetros que
+        invalidan el índice completo si cambian (modelo, tamaño de fragmento...).
+        `index_config` elige el tipo de índice FAISS; si cambia, el índice se
+        reconstruye desde los embeddings guardados sin volver a codificar.
+        `ingest` (un `IngestionPipeline`) procesa los archivos nuevos o
+        modificados en paralelo y en streaming en lugar de uno a uno.
+        """
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.encode = encode
+        self.load_document = load_document
+        self.create_chunker = create_chunker
+        self.settings = settings or {}
+        self.index_config = index_config or {}
+        self.ingest = ingest
+
+        self.index = None
+        self.document_chunks = ChunkStore()
+        self.files = {}
+        self.last_sync_stats = {}
+        self.failed_files = {}  # Archivos que no se pudieron leer, con su error (hasta que cambien)
+        self.index_load = {}  # Modo de carga del índice y RAM que añadió (arranques en caliente)
+
+    def sync(self, documents_dir):
+        """Sincroniza el índice con la carpeta de documentos y devuelve (index, chunks).
+
+        Solo se vuelven a leer y codificar los archivos añadidos o modificados;
+        los embeddings de los archivos sin cambios se reutilizan desde disco.
+        """
+        start = time.perf_counter()
+        manifest = self._load_manifest()
+        previous_files = manifest.get("files", {}) if manifest.get("settings") == self.settings else {}
+        current_files = self._scan(documents_dir)
+
+        unchanged, changed, added = {}, [], []
+        for name, stat in current_files.items():
+            entry = previous_files.get(name)
+            if entry is None:
+                added.append(name)
+            elif entry["mtime"] == stat["mtime"] and entry["size"] == stat["size"]:
+                unchanged[name] = entry
+            else:
+                # La fecha cambió: solo se re-indexa si el contenido es distinto
+                digest = self._file_hash(stat["path"])
+                if digest == entry["sha256"]:
+                    unchanged[name] = dict(entry, mtime=stat["mtime"], size=stat["size"])
+                else:
+                    changed.append(name)
+        deleted = [name for name in previous_files if name not in current_files]
+
+        index_path = self.index_dir / self.INDEX_FILE
+        if not changed and not added and not deleted and previous_files and index_path.exists():
+            self.document_chunks = ChunkStore.load(self.index_dir)
+            self.files = unchanged
+            self.failed_files = {name: entry.get("error") for name, entry in unchanged.items() if entry.get("failed")}
+            if manifest.get("index") == self.index_config:
+                self.index = self._read_index(index_path)
+                mode = "warm"
+            else:
+                # Solo cambió el tipo de índice: se reutilizan los embeddings guardados
+                embeddings = np.load(self.index_dir / self.EMBEDDINGS_FILE, mmap_mode="r")
+                self.index = build_index(embeddings, self.index_config)
+                self._write_atomic(index_path, lambda tmp: faiss.write_index(self.index, str(tmp)))
+                mode = "reindexed"
+            if unchanged != previous_files or mode == "reindexed":
+                self._save_manifest(unchanged)
+            return self._finish(mode, start, embedded_files=0, deleted_files=0)
+
+        chunk_writer, embedding_writer, files = self._rebuild(current_files, unchanged, changed + added)
+        # Se sueltan los mapeos anteriores antes de reemplazar los archivos
+        self.index = None
+        self.document_chunks = ChunkStore()
+        embeddings = embedding_writer.finish()
+        if embeddings is not None:
+            self.index = build_index(embeddings, self.index_config)
+            del embeddings
+            self._write_atomic(index_path, lambda tmp: faiss.write_index(self.index, str(tmp)))
+            embedding_writer.commit()
+        else:
+            for filename in (self.INDEX_FILE, self.EMBEDDINGS_FILE):
+                if (self.index_dir / filename).exists():
+                    os.remove(self.index_dir / filename)
+        self.document_chunks = chunk_writer.commit()
+        if (self.index_dir / self.LEGACY_CHUNKS_FILE).exists():
+            os.remove(self.index_dir / self.LEGACY_CHUNKS_FILE)
+        self.files = files
+        self._save_manifest(files)
+
+        mode = "incremental" if previous_files else "cold"
+        return self._finish(mode, start, embedded_files=len(changed) + len(added), deleted_files=len(deleted))
+
+    def _rebuild(self, current_files, unchanged, to_embed):
+        """Combina los embeddings reutilizables con los de los archivos nuevos o modificados.
+
+        Fragmentos y embeddings se escriben en archivos temporales archivo a
+        archivo (los reutilizados, por lotes de `BATCH_ROWS`), así que la
+        memoria no crece con el tamaño del corpus.
+        Devuelve (ChunkWriter, EmbeddingWriter, archivos del manifiesto).
+        """
+        old_embeddings = None
+        old_chunks = None
+        if unchanged:
+            old_embeddings = np.load(self.index_dir / self.EMBEDDINGS_FILE, mmap_mode="r")
+            old_chunks = ChunkStore.load(self.index_dir)
+
+        # Los archivos a codificar se procesan en orden de nombre, el mismo del bucle siguiente
+        ingested = None
+        if self.ingest is not None and to_embed:
+            ingested = self.ingest.run([current_files[name]["path"] for name in sorted(to_embed)])
+
+        chunk_writer = ChunkStore.writer(self.index_dir)
+        embedding_writer = EmbeddingWriter(self.index_dir / self.EMBEDDINGS_FILE)
+        files = {}
+        self.failed_files = {}
+        try:
+            for name in sorted(current_files):
+                stat = current_files[name]
+                start = len(chunk_writer)
+                if name in unchanged:
+                    entry = unchanged[name]
+                    end = entry["start"] + entry["count"]
+                    for batch in range(entry["start"], end, BATCH_ROWS):
+                        chunk_writer.add(old_chunks.records(batch, min(batch + BATCH_ROWS, end)))
+                        embedding_writer.add(old_embeddings[batch:min(batch + BATCH_ROWS, end)])
+                    digest = entry["sha256"]
+                    error = entry.get("error") if entry.get("failed") else None
+                elif name in to_embed:
+                    if ingested is not None:
+                        file_chunks, file_embeddings, error = next(ingested)
+                    else:
+                        try:
+                            text = self.load_document(stat["path"])
+                            error = None
+                        except Exception as e:
+                            print(f"⚠️ No se pudo leer {stat['path']}: {e}. Se reintentará cuando cambie el archivo.")
+                            text, error = "", f"{type(e).__name__}: {e}"
+                        file_chunks = chunk_document(self.create_chunker, text) if text else []
+                        file_embeddings = self.encode([chunk for chunk, _ in file_chunks]) if file_chunks else None
+                    # Un archivo leído a medias no se indexa: queda como fallido y sin fragmentos
+                    if file_chunks and error is None:
+                        chunk_writer.add(file_chunks)
+                        embedding_writer.add(file_embeddings)
+                    try:
+                        digest = self._file_hash(stat["path"])
+                    except OSError:
+                        digest = None
+                else:
+                    continue
+
+                files[name] = {
+                    "mtime": stat["mtime"],
+                    "size": stat["size"],
+                    "sha256": digest,
+                    "start": start,
+                    "count": len(chunk_writer) - start
+                }
+                if error is not None:
+                    # Con la fecha, el tamaño y el hash en el manifiesto, solo se reintenta si el archivo cambia
+                    files[name].update(failed=True, error=error)
+                    self.failed_files[name] = error
+
+            if ingested is not None:
+                # Agota el generador para que cierre el pool y registre las métricas de la ingesta
+                for _ in ingested:
+                    pass
+        except BaseException:
+            chunk_writer.abort()
+            embedding_writer.abort()
+            raise
+        return chunk_writer, embedding_writer, files
+
+    def chunk_metadata(self, position):
+        """Documento de origen y página del fragmento en la posición `position`."""
+        for name, entry in self.files.items():
+            if entry["start"] <= position < entry["start"] + entry["count"]:
+                return {"source": name, "page": self.document_chunks.page(position)}
+        return {"source": None, "page": self.document_chunks.page(position)}
+
+    def _read_index(self, index_path):
+        """Lee el índice desde disco mapeado en memoria y comprueba que la RAM no crece con su tamaño."""
+        rss_before = current_rss()
+        index, mode = read_index_mapped(index_path)
+        rss_after = current_rss()
+        size = index_path.stat().st_size
+        self.index_load = {"mode": mode, "file_bytes": size}
+        if rss_before is not None and rss_after is not None:
+            growth = rss_after - rss_before
+            self.index_load["rss_growth_bytes"] = growth
+            # Un índice mapeado solo añade sus estructuras auxiliares, no una copia de los vectores
+            if size >= 16 * 1024 * 1024 and growth > size // 2:
+                print(f"⚠️ El índice ({size / 1e6:.0f} MB) no quedó mapeado en memoria: la RAM creció {growth / 1e6:.0f} MB.")
+        return configure_search(index, self.index_config)
+
+    def _scan(self, documents_dir):
+        """Lista los documentos soportados con su fecha de modificación y tamaño."""
+        files = {}
+        if not os.path.exists(documents_dir):
+            return files
+        for filename in os.listdir(documents_dir):
+            if not filename.endswith(self.SUPPORTED_EXTENSIONS):
+                continue
+            filepath = os.path.join(documents_dir, filename)
+            stat = os.stat(filepath)
+            files[filename] = {"path": filepath, "mtime": stat.st_mtime_ns, "size": stat.st_size}
+        return files
+
+    def _file_hash(self, filepath):
+        """Calcula el hash SHA-256 del contenido de un archivo."""
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _load_manifest(self):
+        """Carga el manifiesto del índice, o uno vacío si no existe o está corrupto."""
+        manifest_path = self.index_dir / self.MANIFEST_FILE
+        if not manifest_path.exists():
+            return {}
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            print(f"⚠️ Manifiesto {manifest_path} ilegible. Se reconstruirá el índice.")
+            return {}
+
+    def _save_manifest(self, files):
+        """Guarda el manifiesto con los archivos indexados y los parámetros del índice."""
+        manifest = {"settings": self.settings, "index": self.index_config, "files": files}
+        self._write_atomic(
+            self.index_dir / self.MANIFEST_FILE,
+            lambda tmp: tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        )
+
+    def _write_atomic(self, path, writer):
+        """Escribe en un archivo temporal y lo renombra para no dejar archivos a medias."""
+        tmp_path = _tmp_path(path)
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _finish(self, mode, start, embedded_files, deleted_files):
+        """Registra y muestra las métricas de la sincronización."""
+        elapsed = time.perf_counter() - start
+        self.last_sync_stats = {
+            "mode": mode,
+            "seconds": elapsed,
+            "embedded_files": embedded_files,
+            "deleted_files": deleted_files,
+            "failed_files": self.failed_files,
+            "chunks": len(self.document_chunks)
+        }
+        if mode == "warm":
+            self.last_sync_stats["index_load"] = self.index_load
+        labels = {"cold": "en frío", "warm": "en caliente", "incremental": "incremental", "reindexed": "con nuevo tipo de índice"}
+        print(
+            f"⏱️ Arranque {labels[mode]} del vector store: {elapsed:.2f}s "
+            f"({len(self.document_chunks)} fragmentos, {embedded_files} archivos re-indexados, "
+            f"{deleted_files} eliminados)"
+        )
+        if self.failed_files:
+            print(
+                f"⚠️ {len(self.failed_files)} archivos sin indexar por errores de lectura (se reintentan cuando cambian): "
+                f"{', '.join(sorted(self.failed_files))}"
+            )
+        return self.index, self.document_chunks